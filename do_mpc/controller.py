@@ -26,10 +26,17 @@ from casadi.tools import *
 import pdb
 import itertools
 import time
+import os
+import concurrent.futures
+import multiprocessing
+import multiprocessing.connection
+import asyncio
+import copy
 
 import do_mpc.data
 import do_mpc.optimizer
 from do_mpc.tools.indexedproperty import IndexedProperty
+from do_mpc.tools.warm_start_library import WarmStartLibrary
 
 class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
     """Model predictive controller.
@@ -89,11 +96,15 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         self._x_terminal_ub = model._x(np.inf)
 
         self.rterm_factor = self.model._u(0.0)
+        # Weights of the objective function that are parameters of the optimization problem (see set_weight_param):
+        self._w_obj_list = {'name': ['default'], 'var': [self.model.sv.sym('default', (0,0))], 'value': [np.zeros((0,0))]}
 
         # Initialize structure to hold the optimial solution and initial guess:
         self._opt_x_num = None
         # Initialize structure to hold the parameters for the optimization problem:
         self._opt_p_num = None
+        # Plants of the batched step (see make_step_batch):
+        self._batch = None
 
         # Parameters that can be set for the optimizer:
         self.data_fields = [
@@ -106,13 +117,43 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
             'collocation_type',
             'collocation_deg',
             'collocation_ni',
+            'integration_tool',
+            'integration_opts',
             'nl_cons_check_colloc_points',
             'nl_cons_single_slack',
             'cons_check_colloc_points',
             'store_full_solution',
             'store_lagr_multiplier',
             'store_solver_stats',
-            'nlpsol_opts'
+            'nlpsol_opts',
+            'warm_start',
+            'warm_start_library_size',
+            'solver_cache_dir',
+            'compile_nlp',
+            'nlp_construction',
+            'map_parallelization',
+            'scenario_reduction',
+            'n_reduced_scenarios',
+            'robust_branches',
+            'decomposition',
+            'decomposition_opts',
+            'real_time_iteration',
+            'rti_hessian',
+            'rti_regularization',
+            'rti_qpsol',
+            'rti_qpsol_opts',
+            'detect_qp',
+            'qpsol',
+            'qpsol_opts',
+            'batch_n_processes',
+            'max_solve_time',
+            'multistart',
+            'multistart_deadline',
+            'move_blocking',
+            'nlp_ordering',
+            'presolve',
+            'shrinking_horizon',
+            't_end',
         ]
 
         # Default Parameters (param. details in set_param method):
@@ -123,6 +164,8 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         self.collocation_type = 'radau'
         self.collocation_deg = 2
         self.collocation_ni = 1
+        self.integration_tool = 'rk4'
+        self.integration_opts = {}
         self.nl_cons_check_colloc_points = False
         self.nl_cons_single_slack = False
         self.cons_check_colloc_points = True
@@ -134,6 +177,36 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
             't_wall_S',
         ]
         self.nlpsol_opts = {} # Will update default options with this dict.
+        self.warm_start = 'previous'
+        self.warm_start_library_size = 0
+        self.solver_cache_dir = None
+        self.compile_nlp = False
+        self.nlp_construction = 'loop'
+        self.map_parallelization = 'serial'
+        self.scenario_reduction = None
+        self.n_reduced_scenarios = None
+        self.robust_branches = None
+        self.decomposition = None
+        self.decomposition_opts = {}
+        self.real_time_iteration = False
+        self.rti_hessian = 'objective'
+        self.rti_regularization = 1e-6
+        self.rti_qpsol = 'qrqp'
+        self.rti_qpsol_opts = {}
+        self.detect_qp = False
+        self.qpsol = 'qrqp'
+        self.qpsol_opts = {}
+        self.batch_n_processes = 1
+        self.max_solve_time = None
+        self.multistart = None
+        self.multistart_deadline = None
+        self.move_blocking = None
+        self.nlp_ordering = 'type'
+        self.presolve = False
+        self.shrinking_horizon = False
+        self.t_end = None
+        # Probability weights of the scenarios (uniform if None):
+        self._scenario_weights = None
 
         # Flags are checked when calling .setup.
         self.flags = {
@@ -164,6 +237,8 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
             opt_x_num['_z', time_step, scenario, collocation_point, _z_name]
             # inputs:
             opt_x_num['_u', time_step, scenario, _u_name]
+            # inputs (with move blocking, see set_param):
+            opt_x_num['_u', block, scenario, _u_name]
             # slack variables for soft constraints:
             opt_x_num['_eps', time_step, scenario, _nl_cons_name]
 
@@ -223,6 +298,8 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
 
         * previous input sequence
 
+        * weights of the objective function
+
         **do-mpc** handles setting these parameters automatically in the :py:func:`make_step`
         method. However, you can set these values manually and directly call :py:func:`solve`.
 
@@ -239,6 +316,10 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
             opt_p_num['_tvp', time_step, _tvp_name]
             # input at time k-1:
             opt_p_num['_u_prev', time_step, scenario]
+            # weights of the objective function (see weights):
+            opt_p_num['_w_obj', _weight_name]
+            opt_p_num['_w_rterm', _u_name]
+            opt_p_num['_w_eps', _slack_name]
 
         The names refer to those given in the :py:class:`do_mpc.model.Model` configuration.
         Further indices are possible, if the variables are itself vectors or matrices.
@@ -258,6 +339,36 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
     def opt_p_num(self, val):
         self._opt_p_num = val
 
+    @property
+    def n_horizon_active(self):
+        """Effective prediction horizon for ``shrinking_horizon=True`` (see :py:func:`set_param`).
+
+        The effective horizon can be set at any time after :py:func:`setup` and is used in the next call of :py:func:`make_step`.
+        It must be between one and ``n_horizon``.
+        If ``t_end`` is set, the effective horizon is computed from the remaining time in each call of :py:func:`make_step`.
+
+        **Example:**
+
+        ::
+
+            mpc.set_param(n_horizon=20, shrinking_horizon=True)
+            mpc.setup()
+            ...
+            mpc.n_horizon_active = 5
+
+        .. note::
+
+            The attribute is populated when calling :py:func:`setup` (with ``n_horizon``).
+
+        """
+        return self._n_horizon_active
+
+    @n_horizon_active.setter
+    def n_horizon_active(self, val):
+        assert self.shrinking_horizon, 'n_horizon_active requires shrinking_horizon=True. Please call MPC.set_param() prior to MPC.setup().'
+        assert isinstance(val, (int, np.integer)) and 1 <= val <= self.n_horizon, 'n_horizon_active must be an integer between 1 and n_horizon={}. You have {}.'.format(self.n_horizon, val)
+        self._n_horizon_active = int(val)
+
     @IndexedProperty
     def terminal_bounds(self, ind):
         """Query and set the terminal bounds for the states.
@@ -337,6 +448,79 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         # Set value on struct:
         var_struct[var_name] = val
 
+    @IndexedProperty
+    def weights(self, ind):
+        """Query and set the weights of the objective function.
+        The weights are parameters of the optimization problem and can be changed at any time (also after :py:func:`setup`)
+        without recreating the optimization problem. The new values are used in the next call of :py:func:`make_step`.
+        The :py:func:`weights` method is an indexed property, meaning
+        getting and setting this property requires an index and calls this function.
+        The power index (elements are seperated by comas) must contain atleast the following elements:
+
+        ======      =================   ==========================================================
+        order       index name          valid options
+        ======      =================   ==========================================================
+        1           weight type         ``rterm``, ``penalty`` or the name of a weight from :py:func:`set_weight_param`.
+        2           variable name       For ``rterm``: names of the inputs defined in :py:class:`do_mpc.model.Model`.
+                                        For ``penalty``: names of the soft constraints (see :py:func:`do_mpc.optimizer.Optimizer.set_nl_cons`).
+        ======      =================   ==========================================================
+
+        Further indices are possible (but not neccessary) when the referenced variable is a vector or matrix.
+        The weights of :py:func:`set_weight_param` are available after :py:func:`set_objective`, the penalty terms of the soft constraints after :py:func:`setup`.
+        The values are initialized with the values passed to :py:func:`set_weight_param`, :py:func:`set_rterm` and :py:func:`do_mpc.optimizer.Optimizer.set_nl_cons`.
+
+        **Example**:
+
+        ::
+
+            # Set with:
+            mpc.weights['Q'] = 10
+            mpc.weights['rterm', 'F'] = 0.1
+            mpc.weights['penalty', 'T_R_max'] = 1e3
+
+            # Query with:
+            mpc.weights['Q']
+
+        """
+        var_struct, var_name = self._get_weight_struct(ind)
+
+        return var_struct[var_name]
+
+    @weights.setter
+    def weights(self, ind, val):
+        """See Docstring for weights getter method"""
+        var_struct, var_name = self._get_weight_struct(ind)
+
+        # Set value on struct:
+        var_struct[var_name] = val
+
+        if self.flags['setup']:
+            self._set_weight_parameters()
+
+    def _get_weight_struct(self, ind):
+        """Private method of the MPC class that returns the numerical structure of the weights (and the index within the structure)
+        for the power index of :py:attr:`weights`.
+        """
+        if not isinstance(ind, tuple):
+            ind = (ind,)
+        weight_type = ind[0]
+
+        if weight_type == 'rterm':
+            var_struct = self.rterm_factor
+            var_name = ind[1:]
+        elif weight_type == 'penalty':
+            assert self.flags['setup'] == True, 'The penalty terms of the soft constraints are available after .setup().'
+            var_struct = self._eps_penalty
+            var_name = ind[1:]
+        else:
+            assert self.flags['set_objective'] == True, 'The weights of set_weight_param are available after .set_objective().'
+            var_struct = self._w_obj_num
+            var_name = ind
+
+        err_msg = 'Calling .weights with {} is not valid. Possible keys are {}.'
+        assert len(var_name) >= 1 and var_name[0] in var_struct.keys(), err_msg.format(ind, var_struct.keys())
+
+        return var_struct, var_name
 
 
     def set_param(self, **kwargs):
@@ -382,7 +566,7 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         :param use_terminal_bounds: Choose if terminal bounds for the states are used. Defaults to ``True``. Set terminal bounds with :py:attr:`terminal_bounds`.
         :type use_terminal_bounds: bool
 
-        :param state_discretization: Choose the state discretization for continuous models. Currently only ``'collocation'`` is available. Defaults to ``'collocation'``. Has no effect if model is created in ``discrete`` type.
+        :param state_discretization: Choose the state discretization for continuous models. Either ``'collocation'`` (orthogonal collocation) or ``'multiple_shooting'`` (the model is integrated over each time-step with ``integration_tool``, the optimization variables are only the states at the beginning of each time-step). Defaults to ``'collocation'``. Has no effect if model is created in ``discrete`` type.
         :type state_discretization: str
 
         :param collocation_type: Choose the collocation type for continuous models with collocation as state discretization. Currently only ``'radau'`` is available. Defaults to ``'radau'``.
@@ -394,6 +578,12 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         :param collocation_ni: For orthogonal collocation choose the number of finite elements for the states within a time-step (and during constant control input). Defaults to ``1``. Can be used to avoid high-order polynomials.
         :type collocation_ni: int
 
+        :param integration_tool: For multiple shooting, choose the integrator. Either ``'rk4'`` (fixed-step Runge-Kutta method of order four, created symbolically), ``'cvodes'`` or ``'idas'`` (CasADi integrators, ``'idas'`` is required for models with algebraic states). The CasADi integrators can only be used with ``MX`` symbolic variables (``symvar_type='MX'`` of the model). Defaults to ``'rk4'``.
+        :type integration_tool: str
+
+        :param integration_opts: For multiple shooting, options of the integrator. For ``'rk4'``, the number of integration steps per time-step can be set with ``'number_of_finite_elements'`` (defaults to ``1``). For ``'cvodes'`` and ``'idas'``, the options are passed to the CasADi integrator (e.g. ``'abstol'`` and ``'reltol'``). Defaults to ``{}``.
+        :type integration_opts: dict
+
         :param nl_cons_check_colloc_points: For orthogonal collocation choose whether the nonlinear bounds set with :py:func:`set_nl_cons` are evaluated once per finite Element or for each collocation point. Defaults to ``False`` (once per collocation point).
         :type nl_cons_check_colloc_points: bool
 
@@ -409,12 +599,96 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         :param store_lagr_multiplier: Choose whether to store the lagrange multipliers of the optimization problem. Increases the required storage. Defaults to ``True``.
         :type store_lagr_multiplier: bool
 
-        :param store_solver_stats: Choose which solver statistics to store. Must be a list of valid statistics. Defaults to ``['success','t_wall_S','t_wall_S']``.
+        :param store_solver_stats: Choose which solver statistics to store. Must be a list of valid statistics. In addition to the statistics of the solver, ``'solve_status'`` (``'converged'``, ``'suboptimal'``, ``'fallback'`` or ``'failed'``, see ``max_solve_time``) can be stored. Defaults to ``['success','t_wall_S','t_wall_S']``.
         :type store_solver_stats: list
 
         :param nlpsol_opts: Dictionary with options for the CasADi solver call ``nlpsol`` with plugin ``ipopt``. All options are listed `here <http://casadi.sourceforge.net/api/internal/d4/d89/group__nlpsol.html>`_.
         :type store_solver_stats: dict
 
+        :param warm_start: Choose how the previous solution is used as initial guess. With ``'previous'`` the previous :py:attr:`opt_x_num` is reused as-is. With ``'shift'`` the previous solution (and its lagrange multipliers) is shifted one stage forward along the scenario tree, the last stage is held constant and IPOPT is configured for a primal-dual warm start. Defaults to ``'previous'``.
+        :type warm_start: str
+
+        :param warm_start_library_size: Maximum number of converged solutions stored in the warm start library (attribute ``warm_start_library`` after :py:func:`setup`, see :py:class:`do_mpc.tools.WarmStartLibrary`). A library that was stored with :py:func:`do_mpc.tools.WarmStartLibrary.save` can be assigned to this attribute to warm start the MPC after a restart. At each call of :py:func:`make_step`, the stored solution for the nearest parameters (initial state and previous input scaled with :py:attr:`scaling`, time-varying parameters and uncertain parameters) is used as initial guess if it is closer than the previous solution (with ``warm_start='shift'``: if the initial state deviates more from the predicted state than from the nearest stored solution). This improves the initial guess after disturbances or mode switches. We recommend to combine the library with ``warm_start='shift'`` (primal-dual warm start). The least recently used solution is replaced if the library is full. Not available with ``decomposition``. Defaults to ``0`` (no library).
+        :type warm_start_library_size: int
+
+        :param solver_cache_dir: Directory for the solver cache. If a directory is supplied, the solver created in :py:func:`setup` is stored on disk and loaded again (instead of being created) whenever an identical optimization problem is setup. The problem is identified by a fingerprint of the model, the objective, the constraints and the configuration. Bounds can be changed without invalidating the cache. On a cache hit, the construction of the optimization problem and its derivatives is skipped. The remaining setup time is dominated by loading (deserializing) the solver and creating the structures of the optimization variables, which typically reduces the setup time by a factor of two to four (not to milliseconds). Loading is fastest in combination with ``compile_nlp``. Defaults to ``None`` (no caching).
+        :type solver_cache_dir: str
+
+        :param compile_nlp: If ``True``, C code is generated for the functions of the optimization problem (objective, constraints and their derivatives) and compiled with the local C compiler. This can drastically reduce the time for function evaluations during the solver call. The compilation can take several minutes for large problems. The compiled library is therefore stored (in ``solver_cache_dir`` or the temporary directory of the system) and reused for identical problems. Without compiler, the problem is solved without compilation. Defaults to ``False``.
+        :type compile_nlp: bool
+
+        :param nlp_construction: Choose how the optimization problem is constructed. With ``'loop'`` the discretization, constraints and cost are created for each node of the scenario tree individually. With ``'map'`` a single function for one node is evaluated for all nodes with ``casadi.Function.map``. The objective and constraints are identical (the solutions only differ within the solver tolerance due to the different order of operations), but the problem is formulated with ``MX`` symbolic variables and the setup time and memory grow only linearly with the number of nodes. Recommended for long horizons and robust MPC with ``n_robust > 1``. Note that the evaluation of ``MX`` expressions is slower than ``SX`` for small models. Use ``map_parallelization`` to distribute the evaluation on multiple cores or ``nlpsol_opts={'expand': True}`` to convert the problem to ``SX`` after construction. Defaults to ``'loop'``.
+        :type nlp_construction: str
+
+        :param map_parallelization: Parallelization of the node evaluations for ``nlp_construction='map'``. Choose from ``'serial'``, ``'thread'`` (one thread per available CPU) and ``'openmp'`` (requires CasADi compiled with OpenMP, otherwise CasADi falls back to serial evaluation). The objective, constraints and their derivatives for all stages and scenarios are then evaluated in parallel during the solver call. Defaults to ``'serial'``.
+        :type map_parallelization: str
+
+        :param scenario_reduction: Reduce the number of scenarios created with :py:func:`set_uncertainty_values` to ``n_reduced_scenarios``. Choose from ``'k_medoids'`` and ``'extreme_vertices'`` (see :py:func:`do_mpc.tools.reduce_scenarios`). The selected scenarios are weighted with their probability in the objective. Must be set before calling :py:func:`set_uncertainty_values`. Defaults to ``None`` (no reduction).
+        :type scenario_reduction: str
+
+        :param n_reduced_scenarios: Number of scenarios (per branch of the scenario tree) for ``scenario_reduction``.
+        :type n_reduced_scenarios: int
+
+        :param robust_branches: Choose the scenarios of the uncertain parameters that branch the scenario tree at each robust stage. Pass a list with one entry per stage (must have ``n_robust`` entries), where each entry is a list of scenario indices (referring to :py:func:`get_p_template` or the order of :py:func:`set_uncertainty_values`). Example with ``n_robust=2``: ``[[0, 1, 2, 3, 4], [0, 3, 4]]`` considers five scenarios at the first stage and only three at the second stage. Defaults to ``None`` (all scenarios at each robust stage).
+        :type robust_branches: list
+
+        :param decomposition: Choose ``'progressive_hedging'`` to solve the robust multi-stage problem in a decomposed way. Instead of the monolithic optimization problem, a single subproblem for one scenario (path from the root to a leaf of the scenario tree) is created. It is solved for all scenarios (in parallel) and the non-anticipativity of the control inputs (scenarios with a common parent node have the same input) is enforced iteratively with progressive hedging. Requires ``n_robust >= 1``. Not available with ``warm_start='shift'``. Defaults to ``None`` (monolithic problem).
+        :type decomposition: str
+
+        :param decomposition_opts: Options for the decomposed solve. Valid keys are ``'rho'`` (initial penalty parameter for the deviation of the (scaled) inputs from the consensus, defaults to ``1.0``), ``'adaptive_rho'`` (if ``True``, the penalty parameter is doubled or halved whenever the deviation from the consensus or the change of the consensus dominates, defaults to ``True``), ``'max_iter'`` (maximum number of iterations, defaults to ``100``), ``'tol'`` (tolerance for the probability weighted deviation of the inputs from the consensus and the change of the consensus between iterations multiplied with the penalty parameter, defaults to ``1e-5``) and ``'n_processes'`` (number of processes to solve the subproblems, defaults to ``None``, i.e. one process per CPU). With ``'n_processes': 1`` the subproblems are solved sequentially in the main process. Otherwise the worker processes are kept alive for the next calls (see :py:func:`close`).
+        :type decomposition_opts: dict
+
+        :param real_time_iteration: If ``True``, :py:func:`make_step` performs a single SQP iteration (real-time iteration) instead of solving the optimization problem to convergence. Only the first call of :py:func:`make_step` solves the problem with IPOPT. The linearization of the problem (preparation phase) can be computed with :py:func:`prepare_step` after applying the control input and before the next measurement is available. :py:func:`make_step` then only embeds the new initial state and solves a single QP (feedback phase). We recommend to combine the real-time iteration with ``warm_start='shift'``. Not available with ``decomposition``. Defaults to ``False``.
+        :type real_time_iteration: bool
+
+        :param rti_hessian: Hessian approximation for ``real_time_iteration``. With ``'objective'`` the Hessian of the objective function is used (the curvature of the constraints is neglected). This is a Gauss-Newton type approximation which is positive semi-definite for convex objectives. With ``'exact'`` the Hessian of the Lagrangian is used, which requires a QP solver that can handle non-convex problems. Defaults to ``'objective'``.
+        :type rti_hessian: str
+
+        :param rti_regularization: Regularization for ``real_time_iteration``. The value is added to the diagonal of the Hessian approximation such that the QP is strictly convex. Defaults to ``1e-6``.
+        :type rti_regularization: float
+
+        :param rti_qpsol: QP solver (plugin of the CasADi ``conic`` interface) for ``real_time_iteration``, e.g. ``'qrqp'``, ``'osqp'`` or ``'qpoases'``. Defaults to ``'qrqp'``.
+        :type rti_qpsol: str
+
+        :param rti_qpsol_opts: Dictionary with options for the CasADi QP solver (``conic``). For ``'qrqp'``, the number of iterations is limited to ``100`` (option ``'max_iter'``). If the QP solver fails, the step is solved with the NLP solver instead.
+        :type rti_qpsol_opts: dict
+
+        :param detect_qp: If ``True``, :py:func:`setup` checks if the optimization problem is a quadratic program (linear dynamics, linear constraints and quadratic objective). In this case, the problem is solved with the sparse QP solver ``qpsol`` instead of IPOPT. ``nlpsol_opts`` and ``compile_nlp`` have no effect for quadratic programs (a warning is shown if ``nlpsol_opts`` are set, use ``qpsol_opts`` instead). The problem is always solved with IPOPT if ``max_solve_time`` is set. Defaults to ``False``.
+        :type detect_qp: bool
+
+        :param qpsol: QP solver (plugin of CasADi ``qpsol``) for quadratic programs (see ``detect_qp``), e.g. ``'qrqp'``, ``'osqp'`` or ``'qpoases'``. Defaults to ``'qrqp'``.
+        :type qpsol: str
+
+        :param qpsol_opts: Dictionary with options for the CasADi QP solver ``qpsol``.
+        :type qpsol_opts: dict
+
+        :param batch_n_processes: Number of processes to solve the optimization problems of all plants in :py:func:`make_step_batch`. With ``1`` (default), the problems are solved sequentially in the main process.
+        :type batch_n_processes: int
+
+        :param max_solve_time: Maximum wall time in seconds for each solver call (IPOPT). The solver is stopped once the time is exceeded (IPOPT option ``max_wall_time`` and an iteration callback). If the solver did not converge, the best feasible iterate (lowest objective) is returned. If no feasible iterate was found, the first iterate of the solver (initial guess) is returned. The result is recorded in the solver statistic ``'solve_status'`` (``'converged'``, ``'suboptimal'`` or ``'fallback'``, see ``store_solver_stats``). Without ``max_solve_time``, ``'solve_status'`` is ``'converged'`` or ``'failed'`` (the solver did not converge and its last iterate is returned). The solver cache is not used with ``max_solve_time``. Defaults to ``None`` (no time limit).
+        :type max_solve_time: float
+
+        :param multistart: List of variants for the multistart of :py:func:`make_step`. Each variant is a dict with the initial guess (key ``'initial_guess'``) and optionally options for the solver (key ``'nlpsol_opts'``, updates ``nlpsol_opts``), e.g. ``[{'initial_guess': 'warm_start'}, {'initial_guess': 'simulation', 'nlpsol_opts': {'ipopt.mu_strategy': 'adaptive'}}]``. Valid initial guesses are ``'warm_start'`` (default, as configured with ``warm_start``), ``'library'`` (nearest solution of the warm start library, see ``warm_start_library_size``), ``'simulation'`` and ``'constant'`` (see :py:func:`set_initial_guess` with the current state and the previous input). All variants are solved in parallel (one worker process per variant, requires the ``fork`` start method). The first converged solution is used and the remaining solves are cancelled. If no variant converged, the solution with the lowest objective is used. The index of the used variant is recorded in the solver statistic ``'multistart_variant'`` and the initial guess in ``'warm_start'``. The solver options of the variants have no effect for quadratic programs (see ``detect_qp``). Not available with ``decomposition``, ``real_time_iteration`` and ``max_solve_time``. Defaults to ``None`` (single solve).
+        :type multistart: list
+
+        :param multistart_deadline: Maximum time in seconds to wait for a converged variant of the multistart. After the deadline, the finished variant with the lowest objective is used and the remaining solves are cancelled. If no variant finished, the first finished variant is used. Defaults to ``None`` (no deadline).
+        :type multistart_deadline: float
+
+        :param move_blocking: List with the number of stages for each block of the prediction horizon (must sum up to ``n_horizon``), e.g. ``[1, 1, 2, 4, 12]`` for ``n_horizon=20``. The inputs are constant within each block, which reduces the number of optimization variables. In the robust case, the input of a node is also used for all its successors within the block. Defaults to ``None`` (one block per stage).
+        :type move_blocking: list
+
+        :param nlp_ordering: Order of the optimization variables passed to the solver. With ``'type'`` (default), the order of :py:attr:`opt_x` is used (all states, then all algebraic states, inputs and slack variables). With ``'stage'``, the variables are ordered stage by stage (state of the node, input, algebraic states, collocation points and slack variables of each stage), like the constraints. This results in a banded structure of the KKT matrix and can reduce the fill-in of the factorization for long horizons. The order only affects the solver, :py:attr:`opt_x_num` and the bounds keep their structure. Not available with ``decomposition``.
+        :type nlp_ordering: str
+
+        :param presolve: If ``True``, the optimization problem is simplified before it is passed to the solver: Constraints with infinite bounds are removed, duplicate constraints (e.g. nonlinear constraints that are identical for multiple branches of the scenario tree) are merged, nonlinear constraints that are affine in a single variable (e.g. ``set_nl_cons('x_max', 2*model.x['C_a'], ub=4)``) are converted to bounds and optimization variables with identical lower and upper bounds are eliminated. Optimization variables that enter neither the objective nor the constraints (e.g. the collocation points of the initial state and the unused nodes of the scenario tree) are not passed to the solver. The solution, :py:attr:`opt_x_num` and the lagrange multipliers refer to the original problem. The bounds of fixed variables cannot be changed after :py:func:`setup`. Has no effect with ``decomposition``. Defaults to ``False``.
+        :type presolve: bool
+
+        :param shrinking_horizon: Build the optimization problem such that the effective prediction horizon (:py:attr:`n_horizon_active`) can be reduced at runtime without calling :py:func:`setup` again, e.g. towards the end of a batch process. The stages after the effective horizon are masked with parameters: their stage cost is removed, their state bounds and nonlinear constraints are relaxed and their inputs hold the last input of the effective horizon. The terminal cost and terminal bounds apply at the end of the effective horizon. Not available with ``decomposition``. Defaults to ``False``.
+        :type shrinking_horizon: bool
+
+        :param t_end: End time of the batch process for ``shrinking_horizon=True``. If set, the effective horizon at each call of :py:func:`make_step` is the number of remaining time steps until ``t_end`` (at most ``n_horizon`` and at least one). Defaults to ``None`` (the effective horizon is set with :py:attr:`n_horizon_active`).
+        :type t_end: float
+
         .. note:: We highly suggest to change the linear solver for IPOPT from `mumps` to `MA27`. In many cases this will drastically boost the speed of **do-mpc**. Change the linear solver with:
 
             ::
@@ -436,6 +710,51 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
                 setattr(self, key, value)
 
 
+    def set_weight_param(self, weight_name, value=1.0, shape=(1,1)):
+        """Introduce a weight of the objective function as parameter of the optimization problem.
+        Returns a symbolic variable that can be used in the ``lterm`` and ``mterm`` expressions of :py:func:`set_objective`.
+
+        Weights that are constants in ``lterm`` and ``mterm`` are part of the optimization problem
+        and changing them requires to call :py:func:`setup` again.
+        Weights introduced with this method can be changed at any time with :py:attr:`weights`,
+        e.g. to retune the controller during operation.
+
+        **Example:**
+
+        ::
+
+            Q = mpc.set_weight_param('Q', value=10)
+            mpc.set_objective(lterm=Q*(model.x['T_R']-T_ref)**2, mterm=Q*(model.x['T_R']-T_ref)**2)
+            mpc.setup()
+            ...
+            mpc.weights['Q'] = 50
+
+        :param weight_name: Name of the weight. Must be unique and differ from ``default``, ``rterm`` and ``penalty``.
+        :type weight_name: string
+        :param value: Initial value of the weight. Defaults to ``1.0``.
+        :type value: int, float or numpy.ndarray
+        :param shape: Shape of the weight. Defaults to ``(1,1)``.
+        :type shape: int or tuple
+
+        :raises assertion: weight_name must be str and unique
+        :raises assertion: Cannot call .set_weight_param after .set_objective().
+
+        :return: Symbolic variable of the weight.
+        :rtype: casadi.SX or casadi.MX
+        """
+        assert self.flags['set_objective'] == False, 'Cannot call .set_weight_param after .set_objective().'
+        assert isinstance(weight_name, str), 'weight_name must be str, you have: {}'.format(type(weight_name))
+        assert weight_name not in self._w_obj_list['name'] + ['rterm', 'penalty'], 'The weight_name {} exists already or is reserved.'.format(weight_name)
+        assert isinstance(value, (int, float, np.ndarray)), 'value must be int, float or numpy.ndarray, you have: {}'.format(type(value))
+
+        var = self.model.sv.sym(weight_name, shape)
+
+        self._w_obj_list['name'].append(weight_name)
+        self._w_obj_list['var'].append(var)
+        self._w_obj_list['value'].append(value)
+
+        return var
+
     def set_objective(self, mterm=None, lterm=None):
         """Sets the objective of the optimal control problem (OCP). We introduce the following cost function:
 
@@ -452,6 +771,7 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
 
         :py:func:`set_objective` is used to set the :math:`l(x_k,z_k,u_k,p_k,p_{\\text{tv},k})` (``lterm``) and :math:`m(x_{N+1})` (``mterm``), where ``N`` is the prediction horizon.
         Please see :py:func:`set_rterm` for the penalization of the control inputs.
+        Both expressions may contain the weights introduced with :py:func:`set_weight_param`.
 
         :param lterm: Stage cost - **scalar** symbolic expression with respect to ``_x``, ``_u``, ``_z``, ``_tvp``, ``_p``
         :type lterm:  CasADi SX or MX
@@ -479,18 +799,31 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         if not isinstance(lterm, (casadi.DM, casadi.SX, casadi.MX)):
             raise Exception('lterm must be of type casadi.DM, casadi.SX or casadi.MX. You have: {}.'.format(type(lterm)))
 
+        # Weights of the objective function (see set_weight_param) are substituted with the variables of a structure:
+        self._w_obj = _w_obj = self.model.sv.sym_struct([
+            entry(name, shape=var.shape) for name, var in zip(self._w_obj_list['name'], self._w_obj_list['var'])
+        ])
+        w_vars = [_w_obj[name] for name in self._w_obj_list['name']]
+        if not isinstance(mterm, casadi.DM):
+            mterm = substitute([mterm], self._w_obj_list['var'], w_vars)[0]
+        if not isinstance(lterm, casadi.DM):
+            lterm = substitute([lterm], self._w_obj_list['var'], w_vars)[0]
+        self._w_obj_num = _w_obj(0)
+        for name, value in zip(self._w_obj_list['name'][1:], self._w_obj_list['value'][1:]):
+            self._w_obj_num[name] = value
+
         self.mterm = mterm
         # TODO: This function should be evaluated with scaled variables.
-        self.mterm_fun = Function('mterm', [_x, _tvp, _p], [mterm])
+        self.mterm_fun = Function('mterm', [_x, _tvp, _p, _w_obj], [mterm])
 
         self.lterm = lterm
-        self.lterm_fun = Function('lterm', [_x, _u, _z, _tvp, _p], [lterm])
+        self.lterm_fun = Function('lterm', [_x, _u, _z, _tvp, _p, _w_obj], [lterm])
 
         # Check if lterm and mterm use invalid variables as inputs.
         # For the check we evaluate the function with dummy inputs and expect a DM output.
         err_msg = '{} contains invalid symbolic variables as inputs. Must contain only: {}'
         try:
-            self.mterm_fun(_x(0),_tvp(0),_p(0))
+            self.mterm_fun(_x(0),_tvp(0),_p(0),_w_obj(0))
         except:
             raise Exception(err_msg.format('mterm','_x, _tvp, _p'))
         try:
@@ -541,6 +874,10 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
 
             For :math:`k=0` we obtain :math:`u_{-1}` from the previous solution.
 
+        .. note::
+
+            The penalty factors are parameters of the optimization problem and can be changed after :py:func:`setup` with :py:attr:`weights`.
+
         """
         assert self.flags['setup'] == False, 'Cannot call .set_rterm after .setup().'
 
@@ -709,6 +1046,12 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         ``beta = 1``
         which is determined by the order in the arrays above (first element is nominal).
 
+        .. note::
+
+            The number of scenarios grows with the number of uncertain parameters.
+            Use the ``scenario_reduction`` option in :py:func:`set_param` (prior to this call) to select a limited
+            number of weighted scenarios.
+
         :param kwargs: Arbitrary number of keyword arguments.
 
         :return: None
@@ -731,6 +1074,14 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
 
 
         p_scenario = list(itertools.product(*values))
+
+        # Reduce the number of scenarios (optional):
+        self._scenario_reduction_applied = (self.scenario_reduction, self.n_reduced_scenarios)
+        if self.scenario_reduction is not None:
+            ind, weights = do_mpc.tools.reduce_scenarios(p_scenario, self.n_reduced_scenarios, method=self.scenario_reduction)
+            p_scenario = [p_scenario[i] for i in ind]
+            self._scenario_weights = weights
+
         n_combinations = len(p_scenario)
         p_template = self.get_p_template(n_combinations)
 
@@ -746,6 +1097,39 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
 
         self.set_p_fun(p_fun)
 
+    def set_scenario_weights(self, weights):
+        """Set the probability weights of the scenarios for robust multi-stage MPC.
+        Low-level API method to complement :py:func:`get_p_template` and :py:func:`set_p_fun`.
+        Each weight refers to the respective scenario of the uncertain parameters (``n_combinations`` in :py:func:`get_p_template`).
+        The weights are normalized to a sum of one.
+
+        By default all scenarios are equally probable.
+        The weight of a node in the scenario tree is the product of the weights of all branches leading to the node.
+        Stage costs and terminal cost are weighted with the probability of the respective node.
+
+        **Example:**
+
+        ::
+
+            p_template = MPC.get_p_template(3)
+            ...
+            MPC.set_p_fun(p_fun)
+            MPC.set_scenario_weights([0.6, 0.2, 0.2])
+
+        .. note::
+
+            Weights are set automatically when using ``scenario_reduction`` with :py:func:`set_uncertainty_values`.
+
+        :param weights: Probability weights of the scenarios.
+        :type weights: list or numpy.ndarray
+
+        :return: None
+        :rtype: None
+        """
+        weights = np.array(weights, dtype=float).flatten()
+        assert np.all(weights > 0), 'Scenario weights must be positive.'
+        self._scenario_weights = weights/np.sum(weights)
+
     def _check_validity(self):
         """Private method to be called in :py:func:`setup`. Checks if the configuration is valid and
         if the optimization problem can be constructed.
@@ -766,6 +1150,82 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         if self.flags['set_p_fun'] == False and self.model._p.size > 0:
             raise Exception('You have not supplied a function to obtain the parameters defined in model. Use .set_p_fun() (low-level API) or .set_uncertainty_values() (high-level API) prior to setup.')
 
+        if self.scenario_reduction not in [None, 'k_medoids', 'extreme_vertices']:
+            raise Exception('scenario_reduction must be None, \'k_medoids\' or \'extreme_vertices\'. You have {}.'.format(self.scenario_reduction))
+        if self.scenario_reduction is not None and getattr(self, '_scenario_reduction_applied', None) != (self.scenario_reduction, self.n_reduced_scenarios):
+            raise Exception('scenario_reduction was not applied. Please set scenario_reduction with .set_param() prior to .set_uncertainty_values().')
+        if self._scenario_weights is not None and len(self._scenario_weights) != self.n_combinations:
+            raise Exception('Received {} scenario weights for {} scenarios of the uncertain parameters.'.format(len(self._scenario_weights), self.n_combinations))
+
+        if self.robust_branches is not None:
+            if len(self.robust_branches) != self.n_robust:
+                raise Exception('robust_branches must have n_robust={} entries. You have {}.'.format(self.n_robust, len(self.robust_branches)))
+            for branches_k in self.robust_branches:
+                if len(branches_k) == 0 or not set(branches_k).issubset(set(range(self.n_combinations))):
+                    raise Exception('Each entry of robust_branches must be a non-empty list of scenario indices in range({}). You have {}.'.format(self.n_combinations, branches_k))
+
+        if self.nlp_construction not in ['loop', 'map']:
+            raise Exception('nlp_construction must be either \'loop\' or \'map\'. You have {}.'.format(self.nlp_construction))
+
+        if self.map_parallelization not in ['serial', 'thread', 'openmp']:
+            raise Exception('map_parallelization must be \'serial\', \'thread\' or \'openmp\'. You have {}.'.format(self.map_parallelization))
+        if self.map_parallelization != 'serial' and self.nlp_construction != 'map':
+            raise Exception('map_parallelization requires nlp_construction=\'map\'.')
+
+        if self.warm_start not in ['previous', 'shift']:
+            raise Exception('warm_start must be either \'previous\' or \'shift\'. You have {}.'.format(self.warm_start))
+
+        if not isinstance(self.warm_start_library_size, (int, np.integer)) or self.warm_start_library_size < 0:
+            raise Exception('warm_start_library_size must be a non-negative integer. You have {}.'.format(self.warm_start_library_size))
+
+        if self.decomposition not in [None, 'progressive_hedging']:
+            raise Exception('decomposition must be None or \'progressive_hedging\'. You have {}.'.format(self.decomposition))
+        if self.decomposition is not None:
+            if self.n_robust < 1:
+                raise Exception('decomposition requires a scenario tree with n_robust >= 1.')
+            if self.warm_start == 'shift':
+                raise Exception('decomposition is not available with warm_start=\'shift\'.')
+            if self.real_time_iteration:
+                raise Exception('decomposition is not available with real_time_iteration.')
+            if self.max_solve_time is not None:
+                raise Exception('decomposition is not available with max_solve_time.')
+            if self.warm_start_library_size > 0:
+                raise Exception('decomposition is not available with warm_start_library_size > 0.')
+            invalid_opts = set(self.decomposition_opts.keys())-{'rho', 'adaptive_rho', 'max_iter', 'tol', 'n_processes'}
+            if len(invalid_opts) > 0:
+                raise Exception('Invalid keys {} in decomposition_opts. Valid keys are \'rho\', \'adaptive_rho\', \'max_iter\', \'tol\' and \'n_processes\'.'.format(invalid_opts))
+
+        if self.multistart is not None:
+            if not isinstance(self.multistart, (list, tuple)) or len(self.multistart) == 0 or not all(isinstance(variant, dict) for variant in self.multistart):
+                raise Exception('multistart must be a non-empty list of dicts. You have {}.'.format(self.multistart))
+            for variant in self.multistart:
+                invalid_keys = set(variant.keys())-{'initial_guess', 'nlpsol_opts'}
+                if len(invalid_keys) > 0:
+                    raise Exception('Invalid keys {} in multistart. Valid keys are \'initial_guess\' and \'nlpsol_opts\'.'.format(invalid_keys))
+                if variant.get('initial_guess', 'warm_start') not in ['warm_start', 'library', 'simulation', 'constant']:
+                    raise Exception('initial_guess of multistart must be \'warm_start\', \'library\', \'simulation\' or \'constant\'. You have {}.'.format(variant['initial_guess']))
+                if variant.get('initial_guess') == 'library' and self.warm_start_library_size == 0:
+                    raise Exception('initial_guess=\'library\' of multistart requires warm_start_library_size > 0.')
+            if self.decomposition is not None or self.real_time_iteration or self.max_solve_time is not None:
+                raise Exception('multistart is not available with decomposition, real_time_iteration and max_solve_time.')
+
+        if self.move_blocking is not None:
+            if not all(isinstance(n_k, (int, np.integer)) and n_k >= 1 for n_k in self.move_blocking) or sum(self.move_blocking) != self.n_horizon:
+                raise Exception('move_blocking must be a list of positive integers that sum up to n_horizon={}. You have {}.'.format(self.n_horizon, self.move_blocking))
+            if self.decomposition is not None:
+                raise Exception('decomposition is not available with move_blocking.')
+
+        if self.nlp_ordering not in ['type', 'stage']:
+            raise Exception('nlp_ordering must be either \'type\' or \'stage\'. You have {}.'.format(self.nlp_ordering))
+
+        if self.shrinking_horizon and self.decomposition is not None:
+            raise Exception('decomposition is not available with shrinking_horizon.')
+        if self.t_end is not None and not self.shrinking_horizon:
+            raise Exception('t_end requires shrinking_horizon=True.')
+
+        if self.rti_hessian not in ['objective', 'exact']:
+            raise Exception('rti_hessian must be either \'objective\' or \'exact\'. You have {}.'.format(self.rti_hessian))
+
         if np.any(self.rterm_factor.cat.full() < 0):
             warnings.warn('You have selected negative values for the rterm penalizing changes in the control input.')
             time.sleep(2)
@@ -824,19 +1284,34 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         self._check_validity()
         self._setup_mpc_optim_problem()
 
+        # Library of converged solutions (see warm_start_library_size):
+        self.warm_start_library = WarmStartLibrary(self.warm_start_library_size) if self.warm_start_library_size > 0 else None
+        self._warm_start_key = None
+
         # Gather meta information:
         meta_data = {key: getattr(self, key) for key in self.data_fields}
         meta_data.update({'structure_scenario': self.scenario_tree['structure_scenario']})
+        meta_data.update({'u_block': self._u_block, 'u_block_start': self._u_block_start})
         self.data.set_meta(**meta_data)
 
         self._prepare_data()
 
         self.flags['setup'] = True
 
-    def set_initial_guess(self):
+    def set_initial_guess(self, method='constant', u_guess=None):
         """Initial guess for optimization variables.
         Uses the current class attributes :py:attr:`x0`, :py:attr:`z0` and :py:attr:`u0` to create the initial guess.
-        The initial guess is simply the initial values for all :math:`k=0,\dots,N` instances of :math:`x_k`, :math:`u_k` and :math:`z_k`.
+
+        With ``method='constant'`` (default), the initial guess is simply the initial values for all :math:`k=0,\\dots,N` instances of :math:`x_k`, :math:`u_k` and :math:`z_k`.
+
+        With ``method='simulation'``, the states and algebraic states are obtained by simulating the model from :py:attr:`x0` with the discretization of the optimization problem
+        (e.g. orthogonal collocation) for all scenarios of the scenario tree. The initial guess is thus dynamically consistent,
+        which can reduce the number of iterations for the first call of the solver and helps for stiff models and long horizons.
+        The current values of the time-varying parameters and uncertain parameters (see :py:func:`set_tvp_fun` and :py:func:`set_uncertainty_values`) are used for the simulation.
+        If the simulation of a step fails, the state of the previous step is kept for the remaining horizon of the scenario.
+
+        The inputs are :py:attr:`u0` for the entire horizon or, optionally, the sequence ``u_guess``.
+        For the simulation, the inputs are projected on their bounds.
 
         .. warning::
             If no initial values for :py:attr:`x0`, :py:attr:`z0` and :py:attr:`u0` were supplied during setup, these default to zero.
@@ -844,15 +1319,78 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         .. note::
             The initial guess is fully customizable by directly setting values on the class attribute:
             :py:attr:`opt_x_num`.
+
+        :param method: Method to create the initial guess for the states. Must be ``'constant'`` or ``'simulation'``.
+        :type method: str
+
+        :param u_guess: Inputs for each step of the horizon with shape ``(n_horizon, n_u)``. Defaults to :py:attr:`u0` for all steps.
+        :type u_guess: numpy.ndarray
+
+        :raises assertion: method must be constant or simulation.
+        :raises assertion: u_guess must have shape (n_horizon, n_u).
         """
         assert self.flags['setup'] == True, 'MPC was not setup yet. Please call MPC.setup().'
+        assert method in ['constant', 'simulation'], 'method must be constant or simulation, you have {}'.format(method)
 
         self.opt_x_num['_x'] = self._x0.cat/self._x_scaling
         self.opt_x_num['_u'] = self._u0.cat/self._u_scaling
         self.opt_x_num['_z'] = self._z0.cat/self._z_scaling
 
+        if u_guess is not None:
+            u_guess = np.array(u_guess).reshape(-1, self.model.n_u)
+            assert u_guess.shape[0] == self.n_horizon, 'u_guess must have shape (n_horizon, n_u) = ({}, {}), you have {}'.format(self.n_horizon, self.model.n_u, u_guess.shape)
+            # Inputs of a block (see set_move_blocking) are set with the first step of the block:
+            for k in reversed(range(self.n_horizon)):
+                for s in range(self.scenario_tree['n_scenarios'][k]):
+                    self.opt_x_num['_u', self._u_node[k][s][0], self._u_node[k][s][1]] = u_guess[k]/self._u_scaling.cat.full().flatten()
+
+        if method == 'simulation':
+            self._simulate_initial_guess()
+
         self.flags['set_initial_guess'] = True
 
+    def _simulate_initial_guess(self):
+        """Private method of the MPC class to simulate the states and algebraic states of the initial guess
+        along the scenario tree with the discretization of the optimization problem (see :py:func:`set_initial_guess`).
+        The inputs are taken from :py:attr:`opt_x_num` and projected on their bounds.
+        """
+        n_branches = self.scenario_tree['n_branches']
+        n_scenarios = self.scenario_tree['n_scenarios']
+        child_scenario = self.scenario_tree['child_scenario']
+        p_index = self.scenario_tree['p_index']
+        n_z = self.model.n_z
+
+        tvp0 = self.tvp_fun(self._t0)
+        p0 = self.p_fun(self._t0)
+        _w = self.model._w(0)
+        z0 = (self._z0.cat/self._z_scaling).full().flatten()
+
+        self.opt_x_num['_x', 0, 0, -1] = self._x0.cat/self._x_scaling
+        failed = False
+        for k in range(self.n_horizon):
+            for s in range(n_scenarios[k]):
+                x_ks = self.opt_x_num['_x', k, s, -1]
+                # The inputs are projected on their bounds (as by the solver):
+                u_ind = (self._u_node[k][s][0], self._u_node[k][s][1])
+                u_ks = np.clip(DM(self.opt_x_num['_u', u_ind[0], u_ind[1]]).full(), self.lb_opt_x['_u', u_ind[0], u_ind[1]].full(), self.ub_opt_x['_u', u_ind[0], u_ind[1]].full())
+                self.opt_x_num['_u', u_ind[0], u_ind[1]] = u_ks
+                for b in range(n_branches[k]):
+                    c = child_scenario[k][s][b]
+                    res = self._simulate_ifcn(x_ks, u_ks, tvp0['_tvp', k], p0['_p', p_index[k][s][b]], _w, z0)
+                    if res is None:
+                        # Keep the state of the previous step:
+                        failed = True
+                        res = (np.tile(DM(x_ks).full().flatten(), self._ifcn.size1_in(1)//self.model.n_x), np.tile(z0, self._ifcn.size1_in(3)//max(n_z, 1)), DM(x_ks).full().flatten())
+                    col_xk, col_zk, xf_ksb = res
+                    for i, x_i in enumerate(col_xk.reshape(-1, self.model.n_x)):
+                        self.opt_x_num['_x', k+1, c, i] = x_i
+                    if n_z > 0:
+                        for i, z_i in enumerate(col_zk.reshape(-1, n_z)):
+                            self.opt_x_num['_z', k, c, i] = z_i
+                    self.opt_x_num['_x', k+1, c, -1] = xf_ksb
+
+        if failed:
+            warnings.warn('The simulation of the initial guess failed for some steps of the horizon. The state of the previous step was used instead.')
 
     def make_step(self, x0):
         """Main method of the class during runtime. This method is called at each timestep
@@ -888,6 +1426,35 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
             # Since do-mpc is warmstarting, the initial guess will exist after the first call.
             self.flags['set_initial_guess'] = True
 
+        tvp0, t0 = self._set_step_parameters(x0)
+        if self.real_time_iteration and self._n_solve > 0:
+            # Real-time iteration: The linearization is prepared (if not done with prepare_step) and the new initial state is embedded.
+            if not self._rti_prepared:
+                self.prepare_step()
+            if not self._solve_rti(x0):
+                # The QP solver failed (e.g. maximum number of iterations): The step is solved with the NLP solver instead.
+                self.solve()
+            warm_start = 'shifted' if self.warm_start == 'shift' else 'previous'
+        elif self.multistart is not None:
+            warm_start = self._solve_multistart(x0)
+        else:
+            warm_start = self._set_warm_start(x0)
+            # Solve the optimization problem (method inherited from optimizer)
+            self.solve()
+
+        return self._store_step(x0, tvp0, t0, warm_start)
+
+    def _set_step_parameters(self, x0):
+        """Private method of the MPC class to set the parameters of the optimization problem for the current time step
+        (initial state, previous input, time-varying parameters and uncertain parameters).
+        Called from :py:func:`make_step`.
+
+        :param x0: Current state of the system.
+        :type x0: numpy.ndarray or casadi.DM
+
+        :return: Time-varying parameters and current time.
+        :rtype: tuple
+        """
         # Get current tvp, p and time (as well as previous u)
         u_prev = self._u0
         tvp0 = self.tvp_fun(self._t0)
@@ -899,11 +1466,216 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         self.opt_p_num['_u_prev'] = u_prev
         self.opt_p_num['_tvp'] = tvp0['_tvp']
         self.opt_p_num['_p'] = p0['_p']
-        # Solve the optimization problem (method inherited from optimizer)
-        self.solve()
+        self._set_weight_parameters()
+        if self.shrinking_horizon:
+            self._set_horizon_parameters()
+        return tvp0, t0
+
+    def _set_weight_parameters(self):
+        """Private method of the MPC class to set the current weights of the objective function (see :py:attr:`weights`)
+        in the parameters of the optimization problem.
+        """
+        self.opt_p_num['_w_obj'] = self._w_obj_num
+        self.opt_p_num['_w_rterm'] = self.rterm_factor
+        self.opt_p_num['_w_eps'] = self._eps_penalty
+
+    def _set_horizon_parameters(self):
+        """Private method of the MPC class to set the effective horizon (see :py:attr:`n_horizon_active`) for ``shrinking_horizon=True``.
+        The stages after the effective horizon are masked in the parameters of the optimization problem
+        and the bounds of their states, algebraic states and nonlinear constraints are relaxed.
+        The terminal bounds are applied to the final state of the effective horizon.
+        """
+        if self.t_end is not None:
+            # Number of remaining time steps:
+            n_remaining = int(np.ceil(np.round((self.t_end-self._t0.item())/self.t_step, 6)))
+            self._n_horizon_active = min(max(n_remaining, 1), self.n_horizon)
+        n_active = self._n_horizon_active
+
+        self.opt_p_num['_horizon_mask'] = [float(k < n_active) for k in range(self.n_horizon)]
+        self.opt_p_num['_horizon_end'] = [float(k == n_active-1) for k in range(self.n_horizon)]
+
+        lb_opt_x, ub_opt_x, cons_lb, cons_ub = [bound.copy() for bound in self._horizon_bounds]
+        if n_active < self.n_horizon:
+            x_ind = np.concatenate(self._horizon_x_ind[n_active+1:]+self._horizon_z_ind[n_active:]).astype(int)
+            lb_opt_x[x_ind] = -np.inf
+            ub_opt_x[x_ind] = np.inf
+            x_term_ind = self._horizon_x_term_ind[n_active]
+            lb_opt_x[x_term_ind] = self._horizon_bounds[0][self._horizon_x_term_ind[-1]]
+            ub_opt_x[x_term_ind] = self._horizon_bounds[1][self._horizon_x_term_ind[-1]]
+            cons_ind = np.concatenate(self._horizon_cons_ind[n_active:]).astype(int)
+            cons_lb[cons_ind] = -np.inf
+            cons_ub[cons_ind] = np.inf
+        self.lb_opt_x.master = DM(lb_opt_x)
+        self.ub_opt_x.master = DM(ub_opt_x)
+        self.cons_lb = DM(cons_lb)
+        self.cons_ub = DM(cons_ub)
+
+    def _set_warm_start(self, x0):
+        """Private method of the MPC class to prepare the initial guess of the solver call (see ``warm_start`` in :py:func:`set_param`).
+        Called from :py:func:`make_step`.
+
+        :param x0: Current state of the system.
+        :type x0: numpy.ndarray or casadi.DM
+
+        :return: Type of the warmstart (``'initial'``, ``'previous'``, ``'shifted'`` or ``'library'``).
+        :rtype: str
+        """
+        if self.warm_start_library is not None and len(self.warm_start_library) > 0:
+            key = self._get_warm_start_key()
+            if not self.warm_start_library.is_compatible(key.shape[0], self.n_opt_x, self.n_opt_lagr):
+                raise Exception('The warm start library does not match the optimization problem.')
+            dist, opt_x, lam_x, lam_g = self.warm_start_library.query(key)
+            if self._n_solve > 0 and self._warm_start_key is not None:
+                key_prev = self._warm_start_key
+                if self.warm_start == 'shift':
+                    # The shifted solution starts at the predicted state (of the nominal scenario):
+                    key_prev = key.copy()
+                    key_prev[:self.model.n_x] = self.opt_x_num['_x', 1, 0, -1].full().flatten()
+                dist_prev = np.linalg.norm(key-key_prev)
+            else:
+                dist_prev = np.inf
+            if dist < dist_prev:
+                self.opt_x_num.master = DM(opt_x)
+                self.lam_x_num = DM(lam_x)
+                self.lam_g_num = DM(lam_g)
+                return 'library'
+
+        # Shift the previous solution to obtain the initial guess (if selected and possible):
+        if self.warm_start == 'shift' and self._n_solve > 0:
+            self._shift_solution(x0)
+            return 'shifted'
+        elif self._n_solve > 0:
+            return 'previous'
+        else:
+            return 'initial'
+
+    def _get_warm_start_key(self):
+        """Private method of the MPC class that returns the key of the current optimization problem for the warm start library (see ``warm_start_library_size``).
+        The key consists of the (scaled) initial state and previous input, the time-varying parameters and the uncertain parameters.
+
+        :return: Key of the current optimization problem.
+        :rtype: numpy.ndarray
+        """
+        return np.concatenate([
+            (self.opt_p_num['_x0']/self._x_scaling).full().flatten(),
+            (self.opt_p_num['_u_prev']/self._u_scaling).full().flatten(),
+            vertcat(*self.opt_p_num['_tvp']).full().flatten(),
+            vertcat(*self.opt_p_num['_p']).full().flatten(),
+        ])
+
+    def _solve_multistart(self, x0):
+        """Private method of the MPC class to solve the optimization problem with all variants of the multistart in parallel (see ``multistart`` in :py:func:`set_param`).
+        The first converged solution (or the solution with the lowest objective) is stored with :py:func:`_set_solution`.
+        Called from :py:func:`make_step`.
+
+        :param x0: Current state of the system.
+        :type x0: numpy.ndarray or casadi.DM
+
+        :return: Initial guess of the used variant (see :py:func:`_set_warm_start`).
+        :rtype: str
+        """
+        if self._multistart_workers is None:
+            self._multistart_workers = _MultistartWorkers(self._multistart_solvers)
+            self._add_solver_stat('multistart_variant')
+
+        # The initial guess of each variant is obtained from the previous solution:
+        opt_x_prev = DM(self.opt_x_num.cat)
+        if self._lam_warmstart:
+            lam_prev = DM(self.lam_x_num), DM(self.lam_g_num)
+        guesses, solver_args = {}, {}
+        for i, variant in enumerate(self.multistart):
+            self.opt_x_num.master = opt_x_prev
+            if self._lam_warmstart:
+                self.lam_x_num, self.lam_g_num = lam_prev
+            warm_start = self._set_multistart_guess(x0, variant.get('initial_guess', 'warm_start'))
+            if warm_start is None:
+                continue
+            guesses[i] = (warm_start, DM(self.opt_x_num.cat))
+            solver_args[i] = {key: DM(value).full() for key, value in self._get_solver_args().items()}
+
+        results = self._multistart_workers.race(solver_args, self.multistart_deadline)
+        if len(results) == 0:
+            raise Exception('All solves of the multistart failed.')
+        converged = [(i, r) for i, r in results if r['success']]
+        if len(converged) > 0:
+            i, r = converged[0]
+        else:
+            i, r = min(results, key=lambda result: result[1]['f'])
+
+        self.opt_x_num.master = guesses[i][1]
+        solver_stats = r['stats']
+        solver_stats['solve_status'] = 'converged' if r['success'] else 'failed'
+        solver_stats['multistart_variant'] = i
+        self._set_solution(r, solver_stats)
+        return guesses[i][0]
+
+    def _set_multistart_guess(self, x0, initial_guess):
+        """Private method of the MPC class to set the initial guess of a multistart variant (see ``multistart`` in :py:func:`set_param`).
+
+        :param x0: Current state of the system.
+        :type x0: numpy.ndarray or casadi.DM
+
+        :param initial_guess: Initial guess of the variant.
+        :type initial_guess: str
+
+        :return: Type of the initial guess. ``None`` if the initial guess is not available (empty warm start library).
+        :rtype: str
+        """
+        if initial_guess == 'warm_start':
+            return self._set_warm_start(x0)
+        elif initial_guess == 'library':
+            dist, opt_x, lam_x, lam_g = self.warm_start_library.query(self._get_warm_start_key())
+            if opt_x is None:
+                return None
+            self.opt_x_num.master = DM(opt_x)
+            self.lam_x_num, self.lam_g_num = DM(lam_x), DM(lam_g)
+            return 'library'
+        else:
+            self._x0.master = DM(x0)
+            self.set_initial_guess(method=initial_guess)
+            if self._lam_warmstart:
+                self.lam_x_num = np.zeros((self.n_opt_x, 1))
+                self.lam_g_num = np.zeros((self.n_opt_lagr, 1))
+            return initial_guess
+
+    def _store_step(self, x0, tvp0, t0, warm_start, u0=None):
+        """Private method of the MPC class to extract the control input from the current solution,
+        update the :py:class:`do_mpc.data.Data` object and the initial values for the next time step.
+        Called from :py:func:`make_step` after the solver call.
+
+        :param x0: Current state of the system.
+        :type x0: numpy.ndarray or casadi.DM
+
+        :param tvp0: Time-varying parameters of the current time step.
+        :type tvp0: casadi.tools.structure3.DMStruct
+
+        :param t0: Current time.
+        :type t0: float
+
+        :param warm_start: Type of the warmstart of the solver call.
+        :type warm_start: str
+
+        :param u0: Control input (unscaled) that replaces the input of the current solution (see :py:func:`make_step_async`).
+        :type u0: casadi.DM
+
+        :return: u0
+        :rtype: numpy.ndarray
+        """
+        if self.warm_start_library is not None:
+            # Converged solutions are stored in the library (not the single iterations of the real-time iteration):
+            self._warm_start_key = self._get_warm_start_key()
+            rti_step = self.real_time_iteration and self._n_solve > 0
+            if self.solver_stats.get('success', False) and u0 is None and not rti_step:
+                self.warm_start_library.add(self._warm_start_key, self.opt_x_num.cat, self.lam_x_num, self.lam_g_num)
+
+        self._n_solve += 1
+        self._rti_prepared = False
+        self.solver_stats['warm_start'] = warm_start
+        self.solver_stats.setdefault('fallback', False)
 
         # Extract solution:
-        u0 = self.opt_x_num['_u', 0, 0]*self._u_scaling
+        if u0 is None:
+            u0 = self.opt_x_num['_u', 0, 0]*self._u_scaling
         z0 = self.opt_x_num['_z', 0, 0, 0]*self._z_scaling
         aux0 = self.opt_aux_num['_aux', 0, 0]
 
@@ -939,6 +1711,601 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         # Return control input:
         return u0.full()
 
+    async def make_step_async(self, x0, deadline=None):
+        """Non-blocking variant of :py:func:`make_step` for the use with ``asyncio``.
+        The optimization problem is solved in a separate worker process and the event loop is not blocked while waiting for the result.
+
+        If the solution is not available before the ``deadline``, the time-shifted input of the previous solution
+        (or the previous input if no solution is available) is returned instead (fallback input). The solve is not interrupted.
+        Once it finishes, its solution is used as initial guess for the next call (the late solution).
+        While the worker is busy with a late solve, no new solve is started and the fallback input is returned immediately.
+
+        The solver statistic ``'fallback'`` (see ``store_solver_stats`` in :py:func:`set_param`) is recorded in the :py:class:`do_mpc.data.Data` object for all calls.
+
+        **Example:**
+
+        ::
+
+            async def control_loop():
+                while True:
+                    x0 = await plant.read_state()
+                    u0 = await mpc.make_step_async(x0, deadline=0.05)
+                    await plant.write_input(u0)
+
+        .. note::
+
+            The worker process is forked from the current process (only available on Linux and macOS).
+            It is kept alive for the next calls. Use :py:func:`close` to stop it.
+
+        :param x0: Current state of the system.
+        :type x0: numpy.ndarray or casadi.DM
+
+        :param deadline: Maximum time in seconds to wait for the solution. Defaults to ``None`` (no deadline).
+        :type deadline: float
+
+        :raises assertion: MPC was not setup yet.
+        :raises assertion: The asynchronous step is not available with real_time_iteration or decomposition.
+
+        :return: u0
+        :rtype: numpy.ndarray
+        """
+        assert self.flags['setup'] == True, 'MPC was not setup yet. Please call MPC.setup().'
+        assert not self.real_time_iteration and self.decomposition is None, 'make_step_async is not available with real_time_iteration or decomposition.'
+        tic = time.time()
+        if isinstance(x0, structure3.DMStruct):
+            x0 = x0.cat
+        x0 = DM(x0)
+        assert x0.numel() == self.model.n_x, 'Wrong input with shape {}. Expected vector with {} elements'.format(x0.shape, self.model.n_x)
+        self.flags['set_initial_guess'] = True
+
+        if self._async_pool is None:
+            self._async_pool = concurrent.futures.ProcessPoolExecutor(max_workers=1,
+                mp_context=multiprocessing.get_context('fork'), initializer=_init_solver_worker, initargs=(self.S,))
+            self._add_solver_stat('fallback')
+        # The late solution of a previous call is used as initial guess:
+        if self._async_future is not None and self._async_future.done():
+            self._set_solution(self._async_future.result(), self._async_future.result()['stats'])
+            self._async_t_solution = self._async_t_future
+            self._async_future = None
+
+        tvp0, t0 = self._set_step_parameters(x0)
+        u_fallback = self._get_fallback_input()
+        if self._async_future is not None:
+            # The worker is busy with a late solve:
+            return self._store_fallback(x0, tvp0, t0, u_fallback, 'Solver_Busy', tic)
+
+        warm_start = self._set_warm_start(x0)
+        solver_args = {key: DM(value).full() for key, value in self._get_solver_args().items()}
+        self._async_future = self._async_pool.submit(_solve_nlp, solver_args)
+        self._async_t_future = t0
+        try:
+            # The solve is shielded (and continues) if the deadline passes.
+            r = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._async_future)), deadline)
+        except asyncio.TimeoutError:
+            return self._store_fallback(x0, tvp0, t0, u_fallback, 'Deadline_Exceeded', tic)
+        self._async_future = None
+
+        self._set_solution(r, r['stats'])
+        self._async_t_solution = t0
+        return self._store_step(x0, tvp0, t0, warm_start)
+
+    def close(self):
+        """Stop the worker processes of the MPC (started by :py:func:`make_step_async`, :py:func:`make_step_batch` and by :py:func:`make_step` for the decomposed solve and the multistart).
+        The method waits for a pending (late) solve of :py:func:`make_step_async` to finish and discards its solution.
+        The worker processes are started again when they are needed, i.e. the MPC can still be used after calling this method.
+
+        :return: None
+        :rtype: None
+        """
+        if self._async_pool is not None:
+            self._async_pool.shutdown()
+            self._async_pool = None
+            self._async_future = None
+        if self._batch_pool is not None:
+            self._batch_pool.shutdown()
+            self._batch_pool = None
+        if self.decomposition is not None and self._ph_pool is not None:
+            self._ph_pool.shutdown()
+            self._ph_pool = None
+        if self._multistart_workers is not None:
+            self._multistart_workers.close()
+            self._multistart_workers = None
+
+    def _get_fallback_input(self):
+        """Private method of the MPC class that returns the fallback input of :py:func:`make_step_async`.
+        The fallback input is the input of the (nominal) prediction of the latest available solution for the current time.
+        If no solution is available, the previous input is returned.
+
+        :return: Fallback input (unscaled).
+        :rtype: casadi.DM
+        """
+        if self._async_t_solution is None:
+            return DM(self._u0.cat)
+        k = int(np.round((self._t0.item()-self._async_t_solution.item())/self.t_step))
+        k = min(max(k, 0), self.n_horizon-1)
+        return self.opt_x_num['_u', self._u_block[k], 0]*self._u_scaling
+
+    def _store_fallback(self, x0, tvp0, t0, u0, return_status, tic):
+        """Private method of the MPC class to store the fallback input of :py:func:`make_step_async` (see :py:func:`_store_step`).
+        The solver statistics mark the step as fallback (not recorded statistics are ``nan``).
+
+        :return: u0
+        :rtype: numpy.ndarray
+        """
+        solver_stats = {stat_i: np.nan for stat_i in self.store_solver_stats}
+        solver_stats.update({'success': False, 'return_status': return_status, 'fallback': True, 't_wall_S': time.time()-tic})
+        self.solver_stats = solver_stats
+        return self._store_step(x0, tvp0, t0, 'fallback', u0=u0)
+
+    def _add_solver_stat(self, stat):
+        """Private method of the MPC class to record an additional solver statistic in the :py:class:`do_mpc.data.Data` object
+        (after :py:func:`setup`). The statistic is ``nan`` for the previous time steps.
+
+        :param stat: Name of the solver statistic.
+        :type stat: str
+        """
+        if stat not in self.store_solver_stats:
+            self.store_solver_stats = self.store_solver_stats + [stat]
+            self.data.data_fields.update({stat: 1})
+            setattr(self.data, stat, np.full((self.data['_time'].shape[0], 1), np.nan))
+
+    def make_step_batch(self, X0, tvp_fun=None, p_fun=None):
+        """Batched version of :py:func:`make_step` for a fleet of identical plants which are controlled with the same MPC.
+        Returns the control inputs for the current initial states of all plants.
+
+        Each plant has its own initial guess (warmstart from its previous solution), its own initial values
+        (:py:attr:`x0`, :py:attr:`u0`, :py:attr:`z0` and :py:attr:`t0`) and its own :py:class:`do_mpc.data.MPCData` object in :py:attr:`batch_data`.
+        The plants are initialized at the first call (and if the number of plants changes) with the current :py:attr:`u0`, :py:attr:`z0` and :py:attr:`t0` of the MPC
+        and the initial guess is obtained from the given initial states (see :py:func:`set_initial_guess`).
+
+        All optimization problems are solved with the solver of the MPC, which is created only once in :py:func:`setup`.
+        With ``batch_n_processes > 1`` (see :py:func:`set_param`), the problems are solved in parallel in a pool of worker processes,
+        which are forked from the current process (only available on Linux and macOS) and kept alive for the next calls (see :py:func:`close`).
+        The state of the MPC itself (e.g. :py:attr:`opt_x_num` and :py:attr:`data`) is not changed.
+
+        **Example:**
+
+        ::
+
+            X0 = np.hstack([simulator.x0.cat.full() for simulator in simulators]).T
+            U0 = mpc.make_step_batch(X0)
+            for i, simulator in enumerate(simulators):
+                simulator.make_step(U0[i].reshape(-1,1))
+
+        :param X0: Current states of all plants with one row per plant.
+        :type X0: numpy.ndarray
+
+        :param tvp_fun: List with one function per plant for the time-varying parameters (see :py:func:`set_tvp_fun`). Defaults to the function of the MPC for all plants.
+        :type tvp_fun: list
+
+        :param p_fun: List with one function per plant for the uncertain parameters (see :py:func:`set_p_fun`). Defaults to the function of the MPC for all plants.
+        :type p_fun: list
+
+        :raises assertion: MPC was not setup yet.
+        :raises assertion: Batched steps are not available with real_time_iteration or decomposition.
+
+        :return: U0 with one row per plant.
+        :rtype: numpy.ndarray
+        """
+        assert self.flags['setup'] == True, 'MPC was not setup yet. Please call MPC.setup().'
+        assert not self.real_time_iteration and self.decomposition is None, 'make_step_batch is not available with real_time_iteration or decomposition.'
+        X0 = np.array(X0, dtype=float).reshape(-1, self.model.n_x)
+        n_plants = X0.shape[0]
+        if tvp_fun is None:
+            tvp_fun = [self.tvp_fun]*n_plants
+        if p_fun is None:
+            p_fun = [self.p_fun]*n_plants
+        assert len(tvp_fun) == n_plants and len(p_fun) == n_plants, 'tvp_fun and p_fun must be lists with one function per plant.'
+
+        # State of the MPC (restored after the batched step):
+        mpc_state = self._get_batch_state()
+        try:
+            if self._batch is None or len(self._batch) != n_plants:
+                self._setup_batch(X0)
+            if self.batch_n_processes > 1 and self._batch_pool is None:
+                self._batch_pool = concurrent.futures.ProcessPoolExecutor(max_workers=min(self.batch_n_processes, n_plants),
+                    mp_context=multiprocessing.get_context('fork'), initializer=_init_solver_worker, initargs=(self.S,))
+
+            # Parameters and initial guess of all plants:
+            steps, solver_args = [], []
+            for i in range(n_plants):
+                self._set_batch_state(self._batch[i])
+                self.tvp_fun, self.p_fun = tvp_fun[i], p_fun[i]
+                x0 = X0[i].reshape(-1, 1)
+                tvp0, t0 = self._set_step_parameters(x0)
+                warm_start = self._set_warm_start(x0)
+                steps.append((x0, tvp0, t0, warm_start))
+                solver_args.append({key: DM(value).full() for key, value in self._get_solver_args().items()})
+                self._batch[i] = self._get_batch_state()
+
+            if self._batch_pool is None:
+                results = [_solve_nlp(args_i, self.S) for args_i in solver_args]
+            else:
+                results = list(self._batch_pool.map(_solve_nlp, solver_args))
+
+            U0 = []
+            for i, r_i in enumerate(results):
+                self._set_batch_state(self._batch[i])
+                self._set_solution(r_i, r_i['stats'])
+                U0.append(self._store_step(*steps[i]).flatten())
+                self._batch[i] = self._get_batch_state()
+        finally:
+            self._set_batch_state(mpc_state)
+
+        return np.array(U0)
+
+    @property
+    def batch_data(self):
+        """List with the :py:class:`do_mpc.data.MPCData` objects of all plants of the batched steps (see :py:func:`make_step_batch`).
+        Empty if :py:func:`make_step_batch` was not called.
+        """
+        if self._batch is None:
+            return []
+        return [state_i['data'] for state_i in self._batch]
+
+    def _setup_batch(self, X0):
+        """Private method of the MPC class to initialize the plants of the batched step (see :py:func:`make_step_batch`).
+        Each plant obtains the initial guess from its initial state and an empty :py:class:`do_mpc.data.MPCData` object.
+
+        :param X0: Current states of all plants with one row per plant.
+        :type X0: numpy.ndarray
+        """
+        mpc_state = self._get_batch_state()
+        self._batch = []
+        for x0 in X0:
+            self._set_batch_state(mpc_state)
+            self._x0.master = DM(x0)
+            self.set_initial_guess()
+            self._n_solve = 0
+            self.lam_x_num = np.zeros((self.n_opt_x, 1))
+            self.lam_g_num = np.zeros((self.n_opt_lagr, 1))
+            self.data = self._get_empty_data(mpc_state['data'])
+            self._batch.append(self._get_batch_state())
+
+    def _get_empty_data(self, data):
+        """Private method of the MPC class that returns an empty copy of the :py:class:`do_mpc.data.MPCData` object (same data fields and meta data, no history).
+
+        :param data: Data object to copy.
+        :type data: do_mpc.data.MPCData
+
+        :return: Empty data object.
+        :rtype: do_mpc.data.MPCData
+        """
+        data_empty = copy.copy(data)
+        data_empty.data_fields = data.data_fields.copy()
+        data_empty.meta_data = data.meta_data.copy()
+        data_empty.result_queries = {'ind':[], 'f_ind':[]}
+        data_empty.prediction_queries = {'ind':[], 'f_ind':[]}
+        data_empty.init_storage()
+        return data_empty
+
+    def _get_batch_state(self):
+        """Private method of the MPC class that returns (a copy of) the numerical state of the MPC
+        which differs between the plants of the batched step (see :py:func:`make_step_batch`).
+
+        :return: State of the MPC.
+        :rtype: dict
+        """
+        return {
+            'opt_x_num': DM(self.opt_x_num.cat),
+            'opt_p_num': DM(self.opt_p_num.cat),
+            'lam_x_num': DM(getattr(self, 'lam_x_num', np.zeros((self.n_opt_x, 1)))),
+            'lam_g_num': DM(getattr(self, 'lam_g_num', np.zeros((self.n_opt_lagr, 1)))),
+            'x0': DM(self._x0.cat),
+            'u0': DM(self._u0.cat),
+            'z0': DM(self._z0.cat),
+            't0': self._t0,
+            'n_solve': self._n_solve,
+            'warm_start_key': self._warm_start_key,
+            'data': self.data,
+            'tvp_fun': self.tvp_fun,
+            'p_fun': self.p_fun,
+        }
+
+    def _set_batch_state(self, state):
+        """Private method of the MPC class to set the numerical state of the MPC (see :py:func:`_get_batch_state`).
+
+        :param state: State of the MPC.
+        :type state: dict
+        """
+        self.opt_x_num.master = DM(state['opt_x_num'])
+        self.opt_p_num.master = DM(state['opt_p_num'])
+        self.lam_x_num = DM(state['lam_x_num'])
+        self.lam_g_num = DM(state['lam_g_num'])
+        self._x0.master = DM(state['x0'])
+        self._u0.master = DM(state['u0'])
+        self._z0.master = DM(state['z0'])
+        self._t0 = state['t0']
+        self._n_solve = state['n_solve']
+        self._warm_start_key = state['warm_start_key']
+        self.data = state['data']
+        self.tvp_fun = state['tvp_fun']
+        self.p_fun = state['p_fun']
+
+
+    def prepare_step(self):
+        """Preparation phase of the real-time iteration (``real_time_iteration=True``, see :py:func:`set_param`).
+
+        Linearizes the optimization problem at the current solution (shifted with ``warm_start='shift'``)
+        with the time-varying parameters and uncertain parameters of the next time step.
+        Call this method after applying the control input obtained with :py:func:`make_step` and before the next measurement is available.
+        The next call of :py:func:`make_step` then only embeds the new initial state and solves a single QP.
+
+        If the method is not called, the preparation is done in :py:func:`make_step`.
+
+        :return: None
+        :rtype: None
+        """
+        assert self.flags['setup'] == True, 'MPC was not setup yet. Please call MPC.setup().'
+        assert self.real_time_iteration, 'prepare_step requires real_time_iteration=True. Please call MPC.set_param() prior to MPC.setup().'
+        if self._n_solve == 0:
+            # The first call of make_step solves the full problem (nothing to prepare).
+            return
+
+        self.opt_p_num['_u_prev'] = self._u0
+        self.opt_p_num['_tvp'] = self.tvp_fun(self._t0)['_tvp']
+        self.opt_p_num['_p'] = self.p_fun(self._t0)['_p']
+        self._set_weight_parameters()
+        if self.shrinking_horizon:
+            self._set_horizon_parameters()
+        if self.warm_start == 'shift':
+            # Shift along the nominal branch (the next state is unknown):
+            child_scenario = self.scenario_tree['child_scenario']
+            self._shift_solution(self.opt_x_num['_x', 1, child_scenario[0][0][0], -1]*self._x_scaling)
+
+        [self._rti_H, self._rti_grad_f, self._rti_J, self._rti_g] = self._rti_lin_fun(self.opt_x_num, self.opt_p_num, self.lam_g_num)
+        self._rti_prepared = True
+
+    def _solve_rti(self, x0):
+        """Private method of the MPC class for the feedback phase of the real-time iteration (``real_time_iteration=True``).
+        Called from :py:func:`make_step` after :py:func:`prepare_step`.
+
+        The new initial state only enters the (linear) initial condition. It is embedded in the bounds of the QP
+        which is then solved with the linearization from :py:func:`prepare_step`. The solution is updated with the full step.
+        If the QP solver fails, the solution is not updated.
+
+        :param x0: Current state of the system.
+        :type x0: numpy.ndarray or casadi.DM
+
+        :return: ``True`` if the QP was solved successfully.
+        :rtype: bool
+        """
+        tic = time.time()
+        opt_x_num = self.opt_x_num.cat
+        g = DM(self._rti_g)
+        # Initial condition with the new initial state:
+        g[:self.model.n_x] = opt_x_num[self.opt_x.f['_x', 0, 0, -1]]-DM(x0)/self._x_scaling.cat
+
+        if self._rti_qp_multipliers:
+            lam_x0, lam_a0 = self.lam_x_num, self.lam_g_num
+        else:
+            # The multipliers of the interior point method (first QP after a solve with the NLP solver) are nonzero for all constraints.
+            # Only the multipliers of the active constraints (at the linearization point) are used as initial guess for the active set of the QP solver:
+            tol = 1e-8
+            active_x = np.logical_or(opt_x_num.full()-self.lb_opt_x.cat.full() < tol, self.ub_opt_x.cat.full()-opt_x_num.full() < tol)
+            g_num = DM(self._rti_g).full()
+            active_g = np.logical_or(g_num-DM(self.cons_lb).full() < tol, DM(self.cons_ub).full()-g_num < tol)
+            lam_x0 = DM(self.lam_x_num).full()*active_x
+            lam_a0 = DM(self.lam_g_num).full()*active_g
+
+        r = self._rti_qpsol(h=self._rti_H, g=self._rti_grad_f, a=self._rti_J,
+            lba=self.cons_lb-g, uba=self.cons_ub-g, lbx=self.lb_opt_x.cat-opt_x_num, ubx=self.ub_opt_x.cat-opt_x_num,
+            lam_x0=lam_x0, lam_a0=lam_a0)
+        self._rti_qp_multipliers = self._rti_qpsol.stats()['success']
+        if not self._rti_qp_multipliers:
+            return False
+
+        self.opt_x_num.master = opt_x_num + r['x']
+        self.opt_x_num_unscaled.master = self.opt_x_num.cat*self.opt_x_scaling.cat
+        self.opt_g_num = g + mtimes(self._rti_J, r['x'])
+        self.lam_g_num = r['lam_a']
+        self.lam_x_num = r['lam_x']
+        self.solver_stats = self._rti_qpsol.stats()
+        self.solver_stats['t_wall_S'] = time.time()-tic
+
+        self.opt_aux_num.master = self.opt_aux_expression_fun(self.opt_x_num, self.opt_p_num)
+        return True
+
+    def solve(self):
+        """Solves the optmization problem. See :py:func:`do_mpc.optimizer.Optimizer.solve`.
+
+        With ``decomposition='progressive_hedging'`` (see :py:func:`set_param`), the scenario subproblems are solved
+        and the solution is written to :py:attr:`opt_x_num` (and the related attributes) in the structure of the full scenario tree.
+
+        :return: None
+        :rtype: None
+        """
+        if self.decomposition is None:
+            super().solve()
+        else:
+            self._solve_progressive_hedging()
+
+    def _shift_solution(self, x0):
+        """Private method of the MPC class to shift the previous solution (and its lagrange multipliers) one step forward.
+        The stage-one node of the previous prediction that is closest to the current state :py:obj:`x0` becomes the new root node.
+        The shifted solution is used as initial guess for the next solver call.
+
+        :param x0: Current state of the system.
+        :type x0: numpy.ndarray or casadi.DM
+        """
+        x0_scaled = DM(x0).full().reshape(-1,1)/self._x_scaling.cat.full()
+        child_scenario = self.scenario_tree['child_scenario']
+        # Select the realized branch of the scenario tree:
+        dist = [np.linalg.norm(self.opt_x_num['_x', 1, child_scenario[0][0][b], -1].full()-x0_scaled)
+            for b in range(self.scenario_tree['n_branches'][0])]
+        b0 = int(np.argmin(dist))
+
+        shift_ind_x, shift_ind_g = self._shift_ind[b0]
+        self.opt_x_num.master = self.opt_x_num.cat[shift_ind_x]
+        self.lam_x_num = DM(self.lam_x_num)[shift_ind_x]
+        self.lam_g_num = DM(self.lam_g_num)[shift_ind_g]
+        # The new initial state is known:
+        self.opt_x_num['_x', 0, 0, -1] = x0_scaled
+
+    def _setup_multistart(self, nlp, nlpsol_opts):
+        """Private method of the MPC class to create the solvers of the multistart variants (see ``multistart`` in :py:func:`set_param`).
+        Variants with identical solver options share the solver.
+
+        :param nlp: Optimization problem of the solver.
+        :type nlp: dict
+
+        :param nlpsol_opts: Options of the solver :py:attr:`S`.
+        :type nlpsol_opts: dict
+        """
+        solvers = [(nlpsol_opts, self.S)]
+        self._multistart_solvers = []
+        for variant in self.multistart:
+            opts = dict(nlpsol_opts)
+            if self.warm_start == 'shift' and variant.get('initial_guess', 'warm_start') in ['simulation', 'constant']:
+                # These initial guesses have no lagrange multipliers for the primal-dual warmstart of IPOPT:
+                opts.update({'ipopt.warm_start_init_point': 'no', 'ipopt.mu_init': 0.1})
+            opts.update(variant.get('nlpsol_opts', {}))
+            S = [S_i for opts_i, S_i in solvers if opts_i == opts or self._is_qp]
+            if len(S) == 0:
+                S = [self._setup_nlpsol(nlp, opts)]
+                solvers.append((opts, S[0]))
+            self._multistart_solvers.append(S[0])
+
+    def _setup_warm_start_shift(self, cons_blocks):
+        """Private method of the MPC class to prepare the shifted warmstart (``warm_start='shift'``).
+        For each branch of the root node, index vectors are computed that map the previous solution
+        (optimization variables and constraints) to the initial guess of the next solver call.
+        The subtree starting at the realized branch becomes the new scenario tree.
+        Nodes of the new tree without counterpart (the last stage) hold the values of their parent.
+
+        :param cons_blocks: Row indices of the constraints for each node, identified by ``(k, child_scenario)``.
+        :type cons_blocks: dict
+        """
+        n_horizon = self.n_horizon
+        n_branches = self.scenario_tree['n_branches']
+        n_scenarios = self.scenario_tree['n_scenarios']
+        child_scenario = self.scenario_tree['child_scenario']
+        parent_scenario = self.scenario_tree['parent_scenario']
+        n_eps = 1 if self.nl_cons_single_slack else n_horizon
+        f = self.opt_x.f
+
+        self._shift_ind = []
+        for b0 in range(n_branches[0]):
+            # node_map[k][s] is the node of the previous solution (at stage k+1) that corresponds to node s (at stage k).
+            node_map = [[child_scenario[0][0][b0]]]
+            for k in range(n_horizon-1):
+                node_map.append(-1*np.ones(n_scenarios[k+1], dtype=int))
+                for s in range(n_scenarios[k]):
+                    for b in range(n_branches[k]):
+                        b_prev = b if b < n_branches[k+1] else 0
+                        node_map[k+1][child_scenario[k][s][b]] = child_scenario[k+1][node_map[k][s]][b_prev]
+
+            ind_x = np.arange(self.n_opt_x)
+            ind_g = np.arange(self.n_opt_lagr)
+            for k in range(n_horizon+1):
+                for s in range(n_scenarios[k]):
+                    if k < n_horizon:
+                        ind_x[f['_x', k, s]] = f['_x', k+1, node_map[k][s]]
+                    else:
+                        # Hold the final state of the previous solution for all collocation points.
+                        s_prev = node_map[k-1][parent_scenario[k][s]]
+                        for i in range(len(f['_x', k, s])//self.model.n_x):
+                            ind_x[f['_x', k, s, i]] = f['_x', k, s_prev, -1]
+            for k in range(n_horizon):
+                for c in range(n_scenarios[k+1]):
+                    if k < n_horizon-1:
+                        k_prev, c_prev = k+1, node_map[k+1][c]
+                    else:
+                        k_prev, c_prev = k, node_map[k][parent_scenario[k+1][c]]
+                    ind_x[f['_z', k, c]] = f['_z', k_prev, c_prev]
+                    ind_g[cons_blocks[(k, c)]] = cons_blocks[(k_prev, c_prev)]
+                for s in range(n_scenarios[k]):
+                    if k < n_horizon-1:
+                        k_prev, s_prev = k+1, node_map[k][s]
+                    else:
+                        k_prev, s_prev = k, parent_scenario[k+1][node_map[k][s]]
+                    if not self.open_loop and self._u_block_start[k] == k:
+                        # The input of each block is obtained from the first stage of the block (move blocking).
+                        ind_x[f['_u', self._u_node[k][s][0], s]] = f['_u', self._u_node[k_prev][s_prev][0], self._u_node[k_prev][s_prev][1]]
+                    if n_eps == n_horizon:
+                        ind_x[f['_eps', k, s]] = f['_eps', k_prev, s_prev]
+                if self.open_loop and self._u_block_start[k] == k:
+                    ind_x[f['_u', self._u_block[k], 0]] = f['_u', self._u_block[min(k+1, n_horizon-1)], 0]
+            self._shift_ind.append((ind_x, ind_g))
+
+    def _setup_move_blocking(self, n_scenarios, parent_scenario):
+        """Private method of the MPC class to prepare the input parametrization with move blocking (``move_blocking``, see :py:func:`set_param`).
+        The block of each stage and its first stage are stored in ``_u_block`` and ``_u_block_start``.
+
+        The input of a node is the input of its predecessor at the first stage of the block.
+        The inputs are identified by the block and the scenario (always ``0`` with ``open_loop``) of this predecessor.
+
+        :param n_scenarios: Number of scenarios for each stage of the scenario tree.
+        :type n_scenarios: list
+
+        :param parent_scenario: Parent node of each node of the scenario tree.
+        :type parent_scenario: list
+
+        :return: Number of blocks and the input ``(block, scenario)`` for each node (``u_node[k][s]``).
+        :rtype: tuple
+        """
+        blocks = self.move_blocking if self.move_blocking is not None else [1]*self.n_horizon
+        self._u_block = np.repeat(np.arange(len(blocks)), blocks)
+        self._u_block_start = np.repeat(np.cumsum([0]+list(blocks[:-1])), blocks)
+
+        u_node = []
+        for k in range(self.n_horizon):
+            u_node.append([])
+            for s in range(n_scenarios[k]):
+                s_start = s
+                for k_ in range(k, self._u_block_start[k], -1):
+                    s_start = parent_scenario[k_][s_start]
+                u_node[k].append((int(self._u_block[k]), 0 if self.open_loop else int(s_start)))
+
+        return len(blocks), u_node
+
+    def _setup_nlp_ordering(self):
+        """Private method of the MPC class to compute the stage-wise order of the optimization variables for the solver (``nlp_ordering='stage'``, see :py:func:`set_param`).
+        The permutation is stored in ``_nlp_perm`` (see :py:func:`do_mpc.optimizer.Optimizer._permute_nlp`).
+
+        Within each stage :math:`k` the variables are ordered as follows: states of the nodes, inputs (of the blocks starting at :math:`k`),
+        algebraic states, collocation points of the finite element from :math:`k` to :math:`k+1` and slack variables.
+        """
+        if self.nlp_ordering == 'type' or self.decomposition is not None:
+            self._nlp_perm = None
+            return
+
+        f = self.opt_x.f
+        n_x = self.model.n_x
+        # Sort key (stage and position within the stage) for each optimization variable:
+        key = np.zeros(self.n_opt_x)
+        for k in range(self.n_horizon+1):
+            for s in range(self.scenario_tree['n_scenarios'][-1]):
+                ind_x = np.array(f['_x', k, s], dtype=int).reshape(-1, n_x)
+                # The last point is the state of the node, the other points are the collocation points of the previous finite element.
+                key[ind_x[-1]] = 5*k
+                key[ind_x[:-1]] = 5*(k-1)+3
+        for k in range(self.n_horizon):
+            key[np.array(f['_z', k], dtype=int).flatten()] = 5*k+2
+        for b in range(max(self._u_block)+1):
+            key[np.array(f['_u', b], dtype=int).flatten()] = 5*np.argmax(self._u_block == b)+1
+        for k in range(1 if self.nl_cons_single_slack else self.n_horizon):
+            key[np.array(f['_eps', k], dtype=int).flatten()] = 5*k+4
+
+        self._nlp_perm = np.argsort(key, kind='stable')
+
+    def _setup_shrinking_horizon(self):
+        """Private method of the MPC class to prepare the shrinking horizon (``shrinking_horizon=True``).
+        Called from :py:func:`_setup_mpc_optim_problem`.
+
+        Stores the bounds of the full horizon and the indices of the states and algebraic states of each stage,
+        which are relaxed for the masked stages (see :py:func:`_set_horizon_parameters`).
+        The rows of the nonlinear constraints of each stage are obtained in :py:func:`_setup_mpc_solver`.
+        """
+        f = self.opt_x.f
+        # Indices of the states (all collocation points), the final states and the algebraic states of each stage:
+        self._horizon_x_ind = [np.array(f['_x', k]).flatten() for k in range(self.n_horizon+1)]
+        self._horizon_x_term_ind = [np.array(f['_x', k, :, -1]).astype(int).flatten() for k in range(self.n_horizon+1)]
+        self._horizon_z_ind = [np.array(f['_z', k]).flatten() for k in range(self.n_horizon)]
+        self._horizon_bounds = [DM(bound).full().flatten() for bound in [self.lb_opt_x.cat, self.ub_opt_x.cat, self.cons_lb, self.cons_ub]]
+
+        self._n_horizon_active = self.n_horizon
+        self._set_horizon_parameters()
 
     def _setup_mpc_optim_problem(self):
         """Private method of the MPC class to construct the MPC optimization problem.
@@ -951,7 +2318,10 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         n_branches, n_scenarios, child_scenario, parent_scenario, branch_offset = self._setup_scenario_tree()
 
         # How many scenarios arise from the scenario tree (robust multi-stage MPC)
-        n_max_scenarios = self.n_combinations ** self.n_robust
+        n_max_scenarios = n_scenarios[-1]
+
+        # Move blocking: Number of blocks and the input (block and scenario) of each node.
+        n_blocks, self._u_node = self._setup_move_blocking(n_scenarios, parent_scenario)
 
         # If open_loop option is active, all scenarios (at a given stage) have the same input.
         if self.open_loop:
@@ -973,13 +2343,15 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
                                 1+n_total_coll_points], struct=self.model._x),
             entry('_z', repeat=[self.n_horizon, n_max_scenarios,
                                 max(n_total_coll_points,1)], struct=self.model._z),
-            entry('_u', repeat=[self.n_horizon, n_u_scenarios], struct=self.model._u),
+            entry('_u', repeat=[n_blocks, n_u_scenarios], struct=self.model._u),
             entry('_eps', repeat=[n_eps, n_max_scenarios], struct=self._eps),
         ])
         self.n_opt_x = self.opt_x.shape[0]
+        self._setup_nlp_ordering()
         # NOTE: The entry _x[k,child_scenario[k,s,b],:] starts with the collocation points from s to b at time k
         #       and the last point contains the child node
-        # NOTE: Currently there exist dummy collocation points for the initial state (for each branch)
+        # NOTE: The structure holds dummy collocation points for the initial state and the nodes of the scenario tree
+        #       with fewer scenarios than n_max_scenarios. These are not passed to the solver with presolve (see _setup_mpc_solver).
 
         # Create scaling struct as assign values for _x, _u, _z.
         self.opt_x_scaling = opt_x_scaling = opt_x(1)
@@ -991,13 +2363,23 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
 
 
         # Create struct for optimization parameters:
-        self.opt_p = opt_p = self.model.sv.sym_struct([
+        opt_p_entries = [
             entry('_x0', struct=self.model._x),
             entry('_tvp', repeat=self.n_horizon+1, struct=self.model._tvp),
             entry('_p', repeat=self.n_combinations, struct=self.model._p),
             entry('_u_prev', struct=self.model._u),
-        ])
-        _w = self.model._w(0)
+            # Weights of the objective function (see weights):
+            entry('_w_obj', struct=self._w_obj),
+            entry('_w_rterm', struct=self.model._u),
+            entry('_w_eps', struct=self._eps),
+        ]
+        if self.shrinking_horizon:
+            # Active stages and last stage of the effective horizon (see n_horizon_active):
+            opt_p_entries.extend([
+                entry('_horizon_mask', repeat=self.n_horizon),
+                entry('_horizon_end', repeat=self.n_horizon),
+            ])
+        self.opt_p = opt_p = self.model.sv.sym_struct(opt_p_entries)
 
         self.n_opt_p = opt_p.shape[0]
 
@@ -1013,11 +2395,117 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         self.lb_opt_x = opt_x(-np.inf)
         self.ub_opt_x = opt_x(np.inf)
 
+        if self.cons_check_colloc_points:   # Constraints for all collocation points.
+            # Dont bound the initial state
+            self.lb_opt_x['_x', 1:self.n_horizon] = self._x_lb.cat/self._x_scaling
+            self.ub_opt_x['_x', 1:self.n_horizon] = self._x_ub.cat/self._x_scaling
+
+            # Bounds for the algebraic variables:
+            self.lb_opt_x['_z'] = self._z_lb.cat/self._z_scaling
+            self.ub_opt_x['_z'] = self._z_ub.cat/self._z_scaling
+
+            # Terminal bounds
+            self.lb_opt_x['_x', self.n_horizon, :, -1] = self._x_terminal_lb.cat/self._x_scaling
+            self.ub_opt_x['_x', self.n_horizon, :, -1] = self._x_terminal_ub.cat/self._x_scaling
+        else:   # Constraints only at the beginning of the finite Element
+            # Dont bound the initial state
+            self.lb_opt_x['_x', 1:self.n_horizon, :, -1] = self._x_lb.cat/self._x_scaling
+            self.ub_opt_x['_x', 1:self.n_horizon, :, -1] = self._x_ub.cat/self._x_scaling
+
+            # Bounds for the algebraic variables:
+            self.lb_opt_x['_z', :, :, 0] = self._z_lb.cat/self._z_scaling
+            self.ub_opt_x['_z', :, : ,0] = self._z_ub.cat/self._z_scaling
+
+            # Terminal bounds
+            self.lb_opt_x['_x', self.n_horizon, :, -1] = self._x_terminal_lb.cat/self._x_scaling
+            self.ub_opt_x['_x', self.n_horizon, :, -1] = self._x_terminal_ub.cat/self._x_scaling
+
+        # Bounds for the inputs along the horizon
+        self.lb_opt_x['_u'] = self._u_lb.cat/self._u_scaling
+        self.ub_opt_x['_u'] = self._u_ub.cat/self._u_scaling
+
+        # Bounds for the slack variables:
+        self.lb_opt_x['_eps'] = self._eps_lb.cat
+        self.ub_opt_x['_eps'] = self._eps_ub.cat
+
+        if self.decomposition is not None:
+            self._setup_progressive_hedging(n_total_coll_points, n_eps)
+
+        # The solver (and related objects) are loaded from disk if the identical problem was created before (optional):
+        if not self._load_solver_cache(*self._get_solver_cache_fingerprint_input()):
+            if self.decomposition is not None:
+                self._setup_mpc_nlp_scenario(ifcn, n_total_coll_points, n_eps)
+            elif self.nlp_construction == 'map':
+                self._setup_mpc_nlp_map(ifcn, n_total_coll_points, n_max_scenarios, n_eps)
+            else:
+                self._setup_mpc_nlp(ifcn, n_total_coll_points, n_max_scenarios, n_eps)
+
+        # Create copies of these structures with numerical values (all zero):
+        self.opt_x_num = self.opt_x(0)
+        self.opt_x_num_unscaled = self.opt_x(0)
+        self.opt_p_num = self.opt_p(0)
+        self.opt_aux_num = self.opt_aux(0)
+        self._set_weight_parameters()
+
+        if self.shrinking_horizon:
+            self._setup_shrinking_horizon()
+
+        # Lagrange multipliers must exist before the first call: They are passed to the solver (warm_start='shift'),
+        # required for the linearization of the real-time iteration and stored for steps without solution (see make_step_async).
+        self.lam_x_num = np.zeros((self.n_opt_x, 1))
+        self.lam_g_num = np.zeros((self.n_opt_lagr, 1))
+        self._lam_warmstart = self.warm_start == 'shift'
+        # Number of solver calls since setup (the first call cannot be warmstarted with a shifted solution).
+        self._n_solve = 0
+        self._rti_prepared = False
+        # The multipliers stem from a successful QP of the real-time iteration (and are used as initial guess of the next QP):
+        self._rti_qp_multipliers = False
+        # Plants of the batched step (initialized in make_step_batch):
+        self._batch = None
+        self._batch_pool = None
+        # Worker process, pending solve and time of the latest solution of the asynchronous step (see make_step_async):
+        self._async_pool = None
+        self._async_future = None
+        self._async_t_future = None
+        self._async_t_solution = None
+        # Worker processes of the multistart (started in the first call of make_step):
+        self._multistart_workers = None
+
+    def _setup_mpc_nlp(self, ifcn, n_total_coll_points, n_max_scenarios, n_eps):
+        """Private method of the MPC class to create the objective function and constraints of the MPC
+        optimization problem and the resulting solver object. Called from :py:func:`_setup_mpc_optim_problem`
+        unless the solver was loaded from the solver cache.
+
+        :param ifcn: Discretization of the model equations (see :py:func:`do_mpc.optimizer.Optimizer._setup_discretization`).
+        :type ifcn: casadi.Function
+
+        :param n_total_coll_points: Number of collocation points per finite element.
+        :type n_total_coll_points: int
+
+        :param n_max_scenarios: Number of scenarios at the last stage of the scenario tree.
+        :type n_max_scenarios: int
+
+        :param n_eps: Number of slack variables over the horizon.
+        :type n_eps: int
+        """
+        opt_x = self.opt_x
+        opt_x_unscaled = self.opt_x_unscaled
+        opt_p = self.opt_p
+        opt_aux = self.opt_aux
+        _w = self.model._w(0)
+        n_branches = self.scenario_tree['n_branches']
+        n_scenarios = self.scenario_tree['n_scenarios']
+        child_scenario = self.scenario_tree['child_scenario']
+        parent_scenario = self.scenario_tree['parent_scenario']
+        p_index = self.scenario_tree['p_index']
+
         # Initialize objective function and constraints
         obj = 0
         cons = []
         cons_lb = []
         cons_ub = []
+        # Position (in cons) of the constraints for each node, identified by (k, child_scenario).
+        cons_blocks = {}
 
         # Initial condition:
         cons.append(opt_x['_x', 0, 0, -1]-opt_p['_x0']/self._x_scaling)
@@ -1025,10 +2513,8 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
         cons_lb.append(np.zeros((self.model.n_x, 1)))
         cons_ub.append(np.zeros((self.model.n_x, 1)))
 
-        # NOTE: Weigthing factors for the tree assumed equal. They could be set from outside
-        # Weighting factor for every scenario
-        omega = [1. / n_scenarios[k + 1] for k in range(self.n_horizon)]
-        omega_delta_u = [1. / n_scenarios[k + 1] for k in range(self.n_horizon)]
+        # Weighting factor for every scenario (probability of each node in the scenario tree)
+        omega = self.scenario_tree['node_weight']
 
         # For all control intervals
         for k in range(self.n_horizon):
@@ -1036,17 +2522,20 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
             for s in range(n_scenarios[k]):
                 # For all childen nodes of each node at stage k, discretize the model equations
 
-                # Scenario index for u is always 0 if self.open_loop = True
-                s_u = 0 if self.open_loop else s
+                # Input of the node (scenario index for u is always 0 if self.open_loop = True):
+                u_ks = opt_x['_u', self._u_node[k][s][0], self._u_node[k][s][1]]
+                u_ks_unscaled = opt_x_unscaled['_u', self._u_node[k][s][0], self._u_node[k][s][1]]
                 for b in range(n_branches[k]):
                     # Obtain the index of the parameter values that should be used for this scenario
-                    current_scenario = b + branch_offset[k][s]
+                    current_scenario = p_index[k][s][b]
+                    # Store the position of the constraints of the current node (used for warmstarting).
+                    cons_ind_start = len(cons)
 
                     # Compute constraints and predicted next state of the discretization scheme
                     col_xk = vertcat(*opt_x['_x', k+1, child_scenario[k][s][b], :-1])
                     col_zk = vertcat(*opt_x['_z', k, child_scenario[k][s][b]])
                     [g_ksb, xf_ksb] = ifcn(opt_x['_x', k, s, -1], col_xk,
-                                           opt_x['_u', k, s_u], col_zk, opt_p['_tvp', k],
+                                           u_ks, col_zk, opt_p['_tvp', k],
                                            opt_p['_p', current_scenario], _w)
 
                     # Add the collocation equations
@@ -1062,9 +2551,9 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
                     k_eps = min(k, n_eps-1)
                     if self.nl_cons_check_colloc_points:
                         # Ensure nonlinear constraints on all collocation points
-                        for i in range(n_total_coll_points):
+                        for i in range(max(n_total_coll_points, 1)):
                             nl_cons_k = self._nl_cons_fun(
-                                opt_x_unscaled['_x', k, s, i], opt_x_unscaled['_u', k, s_u], opt_x_unscaled['_z', k, s, i],
+                                opt_x_unscaled['_x', k, s, i], u_ks_unscaled, opt_x_unscaled['_z', k, s, i],
                                 opt_p['_tvp', k], opt_p['_p', current_scenario], opt_x_unscaled['_eps', k_eps, s])
                             cons.append(nl_cons_k)
                             cons_lb.append(self._nl_cons_lb)
@@ -1072,95 +2561,863 @@ class MPC(do_mpc.optimizer.Optimizer, do_mpc.model.IteratedVariables):
                     else:
                         # Ensure nonlinear constraints only on the beginning of the FE
                         nl_cons_k = self._nl_cons_fun(
-                            opt_x_unscaled['_x', k, s, -1], opt_x_unscaled['_u', k, s_u], opt_x_unscaled['_z', k, s, 0],
+                            opt_x_unscaled['_x', k, s, -1], u_ks_unscaled, opt_x_unscaled['_z', k, s, 0],
                             opt_p['_tvp', k], opt_p['_p', current_scenario], opt_x_unscaled['_eps', k_eps, s])
                         cons.append(nl_cons_k)
                         cons_lb.append(self._nl_cons_lb)
                         cons_ub.append(self._nl_cons_ub)
 
+                    cons_blocks[(k, child_scenario[k][s][b])] = (cons_ind_start, len(cons))
+
                     # Add terminal constraints
                     # TODO: Add terminal constraints with an additional nl_cons
 
                     # Add contribution to the cost
-                    obj += omega[k] * self.lterm_fun(opt_x_unscaled['_x', k, s, -1], opt_x_unscaled['_u', k, s_u],
-                                                     opt_x_unscaled['_z', k, s, -1], opt_p['_tvp', k], opt_p['_p', current_scenario])
+                    lterm_ksb = omega[k+1][child_scenario[k][s][b]] * self.lterm_fun(opt_x_unscaled['_x', k, s, -1], u_ks_unscaled,
+                                                     opt_x_unscaled['_z', k, s, -1], opt_p['_tvp', k], opt_p['_p', current_scenario], opt_p['_w_obj'])
+                    if self.shrinking_horizon:
+                        # Stages after the effective horizon are masked:
+                        lterm_ksb *= opt_p['_horizon_mask', k]
+                    obj += lterm_ksb
                     # Add slack variables to the cost
-                    obj += self.epsterm_fun(opt_x_unscaled['_eps', k_eps, s])
+                    obj += self.epsterm_fun(opt_x_unscaled['_eps', k_eps, s], opt_p['_w_eps'])
 
                     # In the last step add the terminal cost too
-                    if k == self.n_horizon - 1:
-                        obj += omega[k] * self.mterm_fun(opt_x_unscaled['_x', k + 1, s, -1], opt_p['_tvp', k+1],
-                                                         opt_p['_p', current_scenario])
-
-                    # U regularization:
+                    if self.shrinking_horizon:
+                        # The terminal cost is active at the last stage of the effective horizon:
+                        obj += opt_p['_horizon_end', k]*omega[k+1][child_scenario[k][s][b]] * self.mterm_fun(opt_x_unscaled['_x', k + 1, s, -1], opt_p['_tvp', k+1],
+                                                         opt_p['_p', current_scenario], opt_p['_w_obj'])
+                    elif k == self.n_horizon - 1:
+                        obj += omega[k+1][child_scenario[k][s][b]] * self.mterm_fun(opt_x_unscaled['_x', k + 1, s, -1], opt_p['_tvp', k+1],
+                                                         opt_p['_p', current_scenario], opt_p['_w_obj'])
+
+                    # U regularization (changes of the input only occur at the first stage of each block):
                     if k == 0:
-                        obj += self.rterm_factor.cat.T@((opt_x['_u', 0, s_u]-opt_p['_u_prev']/self._u_scaling)**2)
-                    else:
-                        obj += self.rterm_factor.cat.T@((opt_x['_u', k, s_u]-opt_x['_u', k-1, parent_scenario[k][s_u]])**2)
+                        obj += opt_p['_w_rterm'].T@((u_ks-opt_p['_u_prev']/self._u_scaling)**2)
+                    elif self._u_node[k][s] != self._u_node[k-1][parent_scenario[k][s]]:
+                        u_prev_ks = opt_x['_u', self._u_node[k-1][parent_scenario[k][s]][0], self._u_node[k-1][parent_scenario[k][s]][1]]
+                        obj += opt_p['_w_rterm'].T@((u_ks-u_prev_ks)**2)
+                        if self.shrinking_horizon:
+                            # The inputs of the masked stages hold the last input of the effective horizon:
+                            obj += (1-opt_p['_horizon_mask', k])*sumsqr(u_ks-u_prev_ks)
 
                     # Calculate the auxiliary expressions for the current scenario:
                     opt_aux['_aux', k, s] = self.model._aux_expression_fun(
-                        opt_x_unscaled['_x', k, s, -1], opt_x_unscaled['_u', k, s_u], opt_x_unscaled['_z', k, s, -1], opt_p['_tvp', k], opt_p['_p', current_scenario])
+                        opt_x_unscaled['_x', k, s, -1], u_ks_unscaled, opt_x_unscaled['_z', k, s, -1], opt_p['_tvp', k], opt_p['_p', current_scenario])
 
-                    # For some reason when working with MX, the "unused" aux values in the scenario tree must be set explicitly (they are not ever used...)
-                for s_ in range(n_scenarios[k],n_max_scenarios):
-                    opt_aux['_aux', k, s_] = self.model._aux_expression_fun(
-                        opt_x_unscaled['_x', k, s, -1], opt_x_unscaled['_u', k, s_u], opt_x_unscaled['_z', k, s, -1], opt_p['_tvp', k], opt_p['_p', current_scenario])
+            # The auxiliary expressions of the unused nodes in the scenario tree are set to zero (they must be set explicitly for MX):
+            for s_ in range(n_scenarios[k], n_max_scenarios):
+                opt_aux['_aux', k, s_] = DM.zeros(self.model.n_aux)
 
+        # Convert the position of the constraint blocks to row indices:
+        cons_rows = np.cumsum([0]+[cons_i.shape[0] for cons_i in cons])
+        cons_blocks = {key: np.arange(cons_rows[start], cons_rows[stop]) for key, (start, stop) in cons_blocks.items()}
 
+        cons = vertcat(*cons)
+        self.cons_lb = vertcat(*cons_lb)
+        self.cons_ub = vertcat(*cons_ub)
 
-        if self.cons_check_colloc_points:   # Constraints for all collocation points.
-            # Dont bound the initial state
-            self.lb_opt_x['_x', 1:self.n_horizon] = self._x_lb.cat/self._x_scaling
-            self.ub_opt_x['_x', 1:self.n_horizon] = self._x_ub.cat/self._x_scaling
+        self._setup_mpc_solver(vertcat(opt_x), vertcat(opt_p), obj, cons, opt_aux, cons_blocks)
 
-            # Bounds for the algebraic variables:
-            self.lb_opt_x['_z'] = self._z_lb.cat/self._z_scaling
-            self.ub_opt_x['_z'] = self._z_ub.cat/self._z_scaling
+    def _setup_mpc_node_fun(self, ifcn, n_total_coll_points):
+        """Private method of the MPC class to create a function for the discretization, constraints and cost of a single node
+        of the scenario tree (as in :py:func:`_setup_mpc_nlp`). Used in :py:func:`_setup_mpc_nlp_map` and :py:func:`_setup_mpc_nlp_scenario`.
 
-            # Terminal bounds
-            self.lb_opt_x['_x', self.n_horizon, :, -1] = self._x_terminal_lb.cat/self._x_scaling
-            self.ub_opt_x['_x', self.n_horizon, :, -1] = self._x_terminal_ub.cat/self._x_scaling
-        else:   # Constraints only at the beginning of the finite Element
-            # Dont bound the initial state
-            self.lb_opt_x['_x', 1:self.n_horizon, :, -1] = self._x_lb.cat/self._x_scaling
-            self.ub_opt_x['_x', 1:self.n_horizon, :, -1] = self._x_ub.cat/self._x_scaling
+        The cost of the node is weighted with the input ``omega`` (probability of the node). The terminal cost is only active if the input ``terminal`` is one.
+        With ``shrinking_horizon``, the stage cost is only active if the input ``mask`` is one.
+        All states, inputs and algebraic states are passed as scaled variables.
 
-            # Bounds for the algebraic variables:
-            self.lb_opt_x['_z', :, :, 0] = self._z_lb.cat/self._z_scaling
-            self.ub_opt_x['_z', :, : ,0] = self._z_ub.cat/self._z_scaling
+        :param ifcn: Discretization of the model equations (see :py:func:`do_mpc.optimizer.Optimizer._setup_discretization`).
+        :type ifcn: casadi.Function
 
-            # Terminal bounds
-            self.lb_opt_x['_x', self.n_horizon, :, -1] = self._x_terminal_lb.cat/self._x_scaling
-            self.ub_opt_x['_x', self.n_horizon, :, -1] = self._x_terminal_ub.cat/self._x_scaling
+        :param n_total_coll_points: Number of collocation points per finite element.
+        :type n_total_coll_points: int
 
-        # Bounds for the inputs along the horizon
-        self.lb_opt_x['_u'] = self._u_lb.cat/self._u_scaling
-        self.ub_opt_x['_u'] = self._u_ub.cat/self._u_scaling
+        :return: Symbolic inputs of the node (dict), function for the constraints and cost of the node, function for the auxiliary expressions, lower and upper bounds of the constraints of the node.
+        :rtype: tuple
+        """
+        n_x, n_u, n_z = self.model.n_x, self.model.n_u, self.model.n_z
+        n_nl_cons_points = max(n_total_coll_points, 1) if self.nl_cons_check_colloc_points else 1
+
+        # Symbolic variables for the inputs of a single node:
+        sym = self.model.sv.sym
+        node_in = {
+            'x_k': sym('x_k', n_x),
+            'col_x': sym('col_x', n_x*n_total_coll_points),
+            'x_next': sym('x_next', n_x),
+            'x_term': sym('x_term', n_x),
+            'x_nl': sym('x_nl', n_x*n_nl_cons_points),
+            'u': sym('u', n_u),
+            'u_ref': sym('u_ref', n_u),
+            'col_z': sym('col_z', n_z*max(n_total_coll_points, 1)),
+            'z_last': sym('z_last', n_z),
+            'z_nl': sym('z_nl', n_z*n_nl_cons_points),
+            'tvp_k': sym('tvp_k', self.model.n_tvp),
+            'tvp_next': sym('tvp_next', self.model.n_tvp),
+            'p': sym('p', self.model.n_p),
+            'eps': sym('eps', self._eps.shape[0]),
+            'omega': sym('omega', 1),
+            'terminal': sym('terminal', 1),
+            'w_obj': sym('w_obj', self._w_obj.shape[0]),
+            'w_rterm': sym('w_rterm', n_u),
+            'w_eps': sym('w_eps', self._eps.shape[0]),
+        }
+        if self.shrinking_horizon:
+            node_in['mask'] = sym('mask', 1)
+        x_scaling = self._x_scaling.cat
+        u_scaling = self._u_scaling.cat
+        z_scaling = self._z_scaling.cat
+        x_k, u, tvp_k, p_k, eps = node_in['x_k'], node_in['u'], node_in['tvp_k'], node_in['p'], node_in['eps']
+
+        # Discretization, constraints and cost of a single node (as in _setup_mpc_nlp):
+        [g_k, xf_k] = ifcn(x_k, node_in['col_x'], u, node_in['col_z'], tvp_k, p_k, self.model._w(0))
+        cons_node = [g_k, xf_k - node_in['x_next']]
+        x_nl = reshape(node_in['x_nl'], n_x, n_nl_cons_points)
+        z_nl = reshape(node_in['z_nl'], n_z, n_nl_cons_points)
+        for i in range(n_nl_cons_points):
+            cons_node.append(self._nl_cons_fun(x_nl[:, i]*x_scaling, u*u_scaling, z_nl[:, i]*z_scaling, tvp_k, p_k, eps))
+        cons_node = vertcat(*cons_node)
+
+        w_obj = node_in['w_obj']
+        obj_node = node_in['omega']*self.lterm_fun(x_k*x_scaling, u*u_scaling, node_in['z_last']*z_scaling, tvp_k, p_k, w_obj)
+        if self.shrinking_horizon:
+            # Masked stage (the input holds the input of the previous stage):
+            obj_node = node_in['mask']*obj_node + (1-node_in['mask'])*sumsqr(u-node_in['u_ref'])
+        obj_node += self.epsterm_fun(eps, node_in['w_eps'])
+        obj_node += node_in['terminal']*node_in['omega']*self.mterm_fun(node_in['x_term']*x_scaling, node_in['tvp_next'], p_k, w_obj)
+        obj_node += node_in['w_rterm'].T@((u-node_in['u_ref'])**2)
+
+        node_fun = Function('node_fun', list(node_in.values()), [cons_node, obj_node])
+        aux_node_fun = Function('aux_node_fun', [x_k, u, node_in['z_last'], tvp_k, p_k],
+            [self.model._aux_expression_fun(x_k*x_scaling, u*u_scaling, node_in['z_last']*z_scaling, tvp_k, p_k)])
+
+        cons_lb_node = vertcat(np.zeros((cons_node.shape[0]-n_nl_cons_points*self._nl_cons_lb.shape[0], 1)), *[self._nl_cons_lb]*n_nl_cons_points)
+        cons_ub_node = vertcat(np.zeros((cons_node.shape[0]-n_nl_cons_points*self._nl_cons_ub.shape[0], 1)), *[self._nl_cons_ub]*n_nl_cons_points)
+
+        return node_in, node_fun, aux_node_fun, cons_lb_node, cons_ub_node
+
+    def _setup_mpc_nlp_map(self, ifcn, n_total_coll_points, n_max_scenarios, n_eps):
+        """Private method of the MPC class to create the objective function and constraints of the MPC
+        optimization problem (``nlp_construction='map'``). Alternative to :py:func:`_setup_mpc_nlp` with identical objective and constraints (also for scenario trees with ``robust_branches``).
+
+        Instead of calling the discretization, constraint and cost functions for each node of the scenario tree,
+        a single function for one node is created and evaluated for all nodes with ``casadi.Function.map``.
+        The inputs for all nodes are gathered from the optimization variables and parameters as matrices (one column per node).
+        The resulting problem is formulated with ``MX`` symbolic variables and its size grows linearly with the number of nodes.
+
+        :param ifcn: Discretization of the model equations (see :py:func:`do_mpc.optimizer.Optimizer._setup_discretization`).
+        :type ifcn: casadi.Function
+
+        :param n_total_coll_points: Number of collocation points per finite element.
+        :type n_total_coll_points: int
+
+        :param n_max_scenarios: Number of scenarios at the last stage of the scenario tree.
+        :type n_max_scenarios: int
+
+        :param n_eps: Number of slack variables over the horizon.
+        :type n_eps: int
+        """
+        n_branches = self.scenario_tree['n_branches']
+        n_scenarios = self.scenario_tree['n_scenarios']
+        child_scenario = self.scenario_tree['child_scenario']
+        parent_scenario = self.scenario_tree['parent_scenario']
+        p_index = self.scenario_tree['p_index']
+        n_x, n_u, n_z = self.model.n_x, self.model.n_u, self.model.n_z
+        node_in, node_fun, aux_node_fun, cons_lb_node, cons_ub_node = self._setup_mpc_node_fun(ifcn, n_total_coll_points)
+        u_scaling = self._u_scaling.cat
+        x_scaling = self._x_scaling.cat
+
+        # Symbolic optimization variables and parameters (MX).
+        opt_x = MX.sym('opt_x', self.n_opt_x)
+        opt_p = MX.sym('opt_p', self.n_opt_p)
+        # All node inputs are gathered from this vector (the previous input is appended as scaled variable):
+        v = vertcat(opt_x, opt_p, opt_p[self.opt_p.f['_u_prev']]/u_scaling)
+        f_x = self.opt_x.f
+        f_p = [np.array(ind)+self.n_opt_x for ind in [self.opt_p.f['_tvp', k] for k in range(self.n_horizon+1)]]
+        f_p_p = [np.array(self.opt_p.f['_p', i])+self.n_opt_x for i in range(self.n_combinations)]
+        f_u_prev = np.arange(n_u)+self.n_opt_x+self.n_opt_p
+        f_w = {key: np.array(self.opt_p.f['_'+key], dtype=int)+self.n_opt_x for key in ['w_obj', 'w_rterm', 'w_eps']}
+        if self.shrinking_horizon:
+            f_mask = [np.array(self.opt_p.f['_horizon_mask', k])+self.n_opt_x for k in range(self.n_horizon)]
+            f_end = [np.array(self.opt_p.f['_horizon_end', k])+self.n_opt_x for k in range(self.n_horizon)]
+        omega = self.scenario_tree['node_weight']
+
+        # Gather the indices of all node inputs:
+        node_ind = {key: [] for key in node_in.keys()}
+        cons_blocks = {}
+        aux_nodes = []
+        aux_ind = []
+        n_nodes = 0
+        for k in range(self.n_horizon):
+            for s in range(n_scenarios[k]):
+                for b in range(n_branches[k]):
+                    current_scenario = p_index[k][s][b]
+                    child = child_scenario[k][s][b]
+                    k_eps = min(k, n_eps-1)
+                    node_ind['x_k'].append(f_x['_x', k, s, -1])
+                    node_ind['col_x'].append(np.array(f_x['_x', k+1, child, :-1]).flatten())
+                    node_ind['x_next'].append(f_x['_x', k+1, child, -1])
+                    node_ind['x_term'].append(f_x['_x', k+1, s, -1])
+                    if self.nl_cons_check_colloc_points:
+                        node_ind['x_nl'].append(np.array([f_x['_x', k, s, i] for i in range(max(n_total_coll_points, 1))]).flatten())
+                        node_ind['z_nl'].append(np.array([f_x['_z', k, s, i] for i in range(max(n_total_coll_points, 1))]).flatten())
+                    else:
+                        node_ind['x_nl'].append(f_x['_x', k, s, -1])
+                        node_ind['z_nl'].append(f_x['_z', k, s, 0])
+                    node_ind['u'].append(f_x['_u', self._u_node[k][s][0], self._u_node[k][s][1]])
+                    if k == 0:
+                        node_ind['u_ref'].append(f_u_prev)
+                    else:
+                        # Within a block, the reference is the input itself (no penalty):
+                        node_ind['u_ref'].append(f_x['_u', self._u_node[k-1][parent_scenario[k][s]][0], self._u_node[k-1][parent_scenario[k][s]][1]])
+                    node_ind['col_z'].append(np.array(f_x['_z', k, child]).flatten())
+                    node_ind['z_last'].append(f_x['_z', k, s, -1])
+                    node_ind['tvp_k'].append(f_p[k])
+                    node_ind['tvp_next'].append(f_p[k+1])
+                    node_ind['p'].append(f_p_p[current_scenario])
+                    node_ind['eps'].append(f_x['_eps', k_eps, s])
+                    node_ind['omega'].append(omega[k+1][child])
+                    for key, ind in f_w.items():
+                        node_ind[key].append(ind)
+                    if self.shrinking_horizon:
+                        node_ind['mask'].append(f_mask[k])
+                        node_ind['terminal'].append(f_end[k])
+                    else:
+                        node_ind['terminal'].append(float(k == self.n_horizon-1))
+                    cons_blocks[(k, child)] = n_nodes
+                    n_nodes += 1
+                # The auxiliary expressions are evaluated with the last branch of each node:
+                aux_nodes.append(n_nodes-1)
+                aux_ind.append(self.aux_struct.f['_aux', k, s])
+
+        # Evaluate all nodes (in parallel, if selected):
+        map_args = [self.map_parallelization]
+        if self.map_parallelization == 'thread':
+            map_args.append(os.cpu_count())
+        node_args = []
+        for key, sym_in in node_in.items():
+            if key == 'omega' or (key == 'terminal' and not self.shrinking_horizon):
+                node_args.append(DM(node_ind[key]).T)
+            else:
+                ind = np.concatenate(node_ind[key]).astype(int) if sym_in.shape[0] > 0 else []
+                node_args.append(reshape(v[ind], sym_in.shape[0], n_nodes))
+        [cons_nodes, obj_nodes] = node_fun.map(n_nodes, *map_args)(*node_args)
+        aux_args = [node_args[list(node_in.keys()).index(key)][:, aux_nodes] for key in ['x_k', 'u', 'z_last', 'tvp_k', 'p']]
+        aux_nodes_val = reshape(aux_node_fun.map(len(aux_nodes), *map_args)(*aux_args), -1, 1)
+        # The auxiliary expressions of the unused nodes in the scenario tree are zero:
+        aux_ind = np.concatenate(aux_ind).astype(int)
+        opt_aux = mtimes(DM(Sparsity.triplet(self.n_opt_aux, len(aux_ind), list(aux_ind), list(range(len(aux_ind)))), 1.0), aux_nodes_val)
 
-        # Bounds for the slack variables:
-        self.lb_opt_x['_eps'] = self._eps_lb.cat
-        self.ub_opt_x['_eps'] = self._eps_ub.cat
+        # Initial condition and constraints of all nodes (in the same order as in _setup_mpc_nlp).
+        cons = vertcat(opt_x[self.opt_x.f['_x', 0, 0, -1]]-opt_p[self.opt_p.f['_x0']]/x_scaling, reshape(cons_nodes, -1, 1))
+        obj = sum2(obj_nodes)
 
+        n_cons_node = cons_lb_node.shape[0]
+        self.cons_lb = vertcat(np.zeros((n_x, 1)), repmat(cons_lb_node, n_nodes, 1))
+        self.cons_ub = vertcat(np.zeros((n_x, 1)), repmat(cons_ub_node, n_nodes, 1))
+        cons_blocks = {key: n_x+n_cons_node*node+np.arange(n_cons_node) for key, node in cons_blocks.items()}
 
-        cons = vertcat(*cons)
-        self.cons_lb = vertcat(*cons_lb)
-        self.cons_ub = vertcat(*cons_ub)
+        self._setup_mpc_solver(opt_x, opt_p, obj, cons, opt_aux, cons_blocks)
 
+    def _setup_mpc_solver(self, opt_x, opt_p, obj, cons, opt_aux, cons_blocks):
+        """Private method of the MPC class to create the solver object (and related objects) for the
+        objective function and constraints created in :py:func:`_setup_mpc_nlp` or :py:func:`_setup_mpc_nlp_map`.
+        The created objects are stored in the solver cache (if activated).
+
+        :param opt_x: Symbolic optimization variables.
+        :type opt_x: casadi.SX or casadi.MX
+
+        :param opt_p: Symbolic parameters.
+        :type opt_p: casadi.SX or casadi.MX
+
+        :param obj: Objective function.
+        :type obj: casadi.SX or casadi.MX
+
+        :param cons: Constraints.
+        :type cons: casadi.SX or casadi.MX
+
+        :param opt_aux: Auxiliary expressions (with the structure of :py:attr:`aux_struct`).
+        :type opt_aux: casadi.SX or casadi.MX
+
+        :param cons_blocks: Row indices of the constraints for each node, identified by ``(k, child_scenario)``.
+        :type cons_blocks: dict
+        """
         self.n_opt_lagr = cons.shape[0]
         # Create casadi optimization object:
         nlpsol_opts = {
             'expand': False,
             'ipopt.linear_solver': 'mumps',
-        }.update(self.nlpsol_opts)
-        nlp = {'x': vertcat(opt_x), 'f': obj, 'g': cons, 'p': vertcat(opt_p)}
-        self.S = nlpsol('S', 'ipopt', nlp, self.nlpsol_opts)
+        }
+        if self.warm_start == 'shift':
+            # Primal-dual warmstart of IPOPT. The user supplied options may overwrite these values.
+            nlpsol_opts.update({
+                'ipopt.warm_start_init_point': 'yes',
+                'ipopt.warm_start_bound_push': 1e-8,
+                'ipopt.warm_start_slack_bound_push': 1e-8,
+                'ipopt.warm_start_mult_bound_push': 1e-8,
+                'ipopt.mu_init': 1e-4,
+            })
+        nlp = {'x': opt_x, 'f': obj, 'g': cons, 'p': opt_p}
+        # Linear dynamics and constraints with quadratic objective (e.g. linear time-invariant models) are solved as QP.
+        # The time limit (max_solve_time) is only available for IPOPT:
+        self._is_qp = self.detect_qp and self.max_solve_time is None and self._check_qp(opt_x, opt_p, obj, cons)
+        # Optimization variables that enter neither the objective nor the constraints (the collocation points of the initial state
+        # and the unused nodes of the scenario tree) are not passed to the solver with presolve and for QPs (otherwise the QP is singular).
+        # The problem is simplified with presolve.
+        # The bounds of the states and algebraic states are relaxed for shrinking_horizon and must not be eliminated:
+        x_keep = None
+        if self.shrinking_horizon:
+            x_keep = np.concatenate([np.array(self.opt_x.f['_x']).flatten(), np.array(self.opt_x.f['_z']).flatten()]).astype(int)
+        nlp = self._setup_nlp_presolve(nlp, x_keep, drop_unused=self.presolve or self._is_qp)
+        if self.max_solve_time is not None:
+            nlpsol_opts.update(self._setup_iteration_callback(nlp))
+        nlpsol_opts.update(self.nlpsol_opts)
+        if self._is_qp:
+            if self.nlpsol_opts or any(variant.get('nlpsol_opts') for variant in (self.multistart or [])):
+                warnings.warn('The optimization problem is a quadratic program and is solved with qpsol {}. The nlpsol_opts have no effect, use qpsol_opts instead.'.format(self.qpsol))
+            qpsol_opts = {'error_on_fail': False}
+            if self.qpsol == 'qrqp':
+                qpsol_opts.update({'print_iter': False, 'print_header': False})
+            qpsol_opts.update(self.qpsol_opts)
+            self.S = qpsol('S', self.qpsol, nlp, qpsol_opts)
+        else:
+            self.S = self._setup_nlpsol(nlp, nlpsol_opts)
 
-        # Create copies of these structures with numerical values (all zero):
-        self.opt_x_num = self.opt_x(0)
-        self.opt_x_num_unscaled = self.opt_x(0)
-        self.opt_p_num = self.opt_p(0)
-        self.opt_aux_num = self.opt_aux(0)
+        if self.multistart is not None:
+            self._setup_multistart(nlp, nlpsol_opts)
 
         # Create function to caculate all auxiliary expressions:
         self.opt_aux_expression_fun = Function('opt_aux_expression_fun', [opt_x, opt_p], [opt_aux])
+
+        if self.warm_start == 'shift':
+            self._setup_warm_start_shift(cons_blocks)
+
+        if self.real_time_iteration:
+            self._setup_rti(opt_x, opt_p, obj, cons)
+
+        if self.shrinking_horizon:
+            # Rows of the nonlinear constraints of each stage (the last rows of each node):
+            n_coll = len(self.opt_x.f['_x', 0, 0])-1
+            n_nl_cons = self._nl_cons.shape[0]*(max(n_coll, 1) if self.nl_cons_check_colloc_points else 1)
+            self._horizon_cons_ind = [
+                np.concatenate([[]]+[rows[len(rows)-n_nl_cons:] for (k_b, c), rows in cons_blocks.items() if k_b == k]).astype(int)
+                for k in range(self.n_horizon)
+            ]
+
+        self._save_solver_cache(**{key: getattr(self, key) for key in self._solver_cache_attributes()})
+
+    def _setup_progressive_hedging(self, n_total_coll_points, n_eps):
+        """Private method of the MPC class to prepare the decomposed solve (``decomposition='progressive_hedging'``).
+        Called from :py:func:`_setup_mpc_optim_problem`.
+
+        Creates the optimization variables and parameters of the scenario subproblem (see :py:func:`_setup_mpc_nlp_scenario`)
+        and the index arrays that map each scenario (leaf of the scenario tree) to the optimization variables and parameters of the full problem.
+
+        :param n_total_coll_points: Number of collocation points per finite element.
+        :type n_total_coll_points: int
+
+        :param n_eps: Number of slack variables over the horizon.
+        :type n_eps: int
+        """
+        nk = self.n_horizon
+        structure_scenario = self.scenario_tree['structure_scenario']
+        child_scenario = self.scenario_tree['child_scenario']
+        p_index = self.scenario_tree['p_index']
+        node_weight = self.scenario_tree['node_weight']
+        n_leaves = self.scenario_tree['n_scenarios'][-1]
+        # Inputs of all stages are identical for all scenarios (open_loop) or for scenarios with a common parent node (up to the robust horizon).
+        n_ph = nk if self.open_loop else self.n_robust
+
+        # Optimization variables and parameters of a single scenario (same structure as opt_x with a single scenario):
+        self.opt_x_scenario = opt_x_scenario = self.model.sv.sym_struct([
+            entry('_x', repeat=[nk+1, 1, 1+n_total_coll_points], struct=self.model._x),
+            entry('_z', repeat=[nk, 1, max(n_total_coll_points,1)], struct=self.model._z),
+            entry('_u', repeat=[nk, 1], struct=self.model._u),
+            entry('_eps', repeat=[n_eps, 1], struct=self._eps),
+        ])
+        self.opt_p_scenario = opt_p_scenario = self.model.sv.sym_struct([
+            entry('_x0', struct=self.model._x),
+            entry('_tvp', repeat=nk+1, struct=self.model._tvp),
+            # Uncertain parameters and probability of the nodes along the scenario:
+            entry('_p', repeat=nk, struct=self.model._p),
+            entry('_u_prev', struct=self.model._u),
+            entry('_w_obj', struct=self._w_obj),
+            entry('_w_rterm', struct=self.model._u),
+            entry('_w_eps', struct=self._eps),
+            entry('_omega', repeat=nk),
+            # Multipliers and consensus of the non-anticipativity constraints as well as the penalty parameter:
+            entry('_ph_w', repeat=n_ph, struct=self.model._u),
+            entry('_ph_u_bar', repeat=n_ph, struct=self.model._u),
+            entry('_ph_rho'),
+        ])
+
+        f_x, f_x_s = self.opt_x.f, opt_x_scenario.f
+        f_p, f_p_s = self.opt_p.f, opt_p_scenario.f
+        f_aux = self.aux_struct.f
+        self._ph_x_ind = np.zeros((n_leaves, opt_x_scenario.shape[0])).astype(int)
+        self._ph_p_ind = np.zeros((n_leaves, nk*self.model.n_p)).astype(int)
+        self._ph_aux_ind = np.zeros((n_leaves, nk*self.model.n_aux)).astype(int)
+        self._ph_omega = np.zeros((n_leaves, nk))
+        self._ph_group = np.zeros((n_leaves, n_ph)).astype(int)
+        for l in range(n_leaves):
+            # Nodes of the scenario tree along the scenario:
+            s_l = structure_scenario[:, l]
+            for k in range(nk+1):
+                for i in range(1+n_total_coll_points):
+                    self._ph_x_ind[l, f_x_s['_x', k, 0, i]] = f_x['_x', k, s_l[k], i]
+            for k in range(nk):
+                for i in range(max(n_total_coll_points,1)):
+                    self._ph_x_ind[l, f_x_s['_z', k, 0, i]] = f_x['_z', k, s_l[k+1], i]
+                self._ph_x_ind[l, f_x_s['_u', k, 0]] = f_x['_u', k, 0 if self.open_loop else s_l[k]]
+                b = s_l[k+1]-child_scenario[k][s_l[k]][0]
+                self._ph_p_ind[l, k*self.model.n_p:(k+1)*self.model.n_p] = f_p['_p', p_index[k][s_l[k]][b]]
+                self._ph_aux_ind[l, k*self.model.n_aux:(k+1)*self.model.n_aux] = f_aux['_aux', k, s_l[k]]
+                self._ph_omega[l, k] = node_weight[k+1][s_l[k+1]]
+            for k in range(n_eps):
+                self._ph_x_ind[l, f_x_s['_eps', k, 0]] = f_x['_eps', k, s_l[k]]
+            for k in range(n_ph):
+                self._ph_group[l, k] = 0 if self.open_loop else s_l[k]
+        # Probability of each scenario:
+        self._ph_prob = node_weight[nk][:n_leaves]
+        self._ph_u_ind = np.array([f_x_s['_u', k, 0] for k in range(n_ph)]).astype(int)
+        n_repeat = {'_p': nk, '_omega': nk, '_ph_w': n_ph, '_ph_u_bar': n_ph}
+        self._ph_ind = {key: np.concatenate([f_p_s[key, k] for k in range(n)]).astype(int) for key, n in n_repeat.items()}
+        self._ph_ind['_ph_rho'] = f_p_s['_ph_rho']
+
+        self._ph_opts = {'rho': 1.0, 'adaptive_rho': True, 'max_iter': 100, 'tol': 1e-5, 'n_processes': None}
+        self._ph_opts.update(self.decomposition_opts)
+        if self._ph_opts['n_processes'] is None:
+            self._ph_opts['n_processes'] = os.cpu_count()
+        # Multipliers of the non-anticipativity constraints (reused for the next call) and solutions of the scenario subproblems:
+        self._ph_w = np.zeros((n_leaves, n_ph, self.model.n_u))
+        self._ph_solution = None
+        self._ph_pool = None
+
+    def _setup_mpc_nlp_scenario(self, ifcn, n_total_coll_points, n_eps):
+        """Private method of the MPC class to create the scenario subproblem for the decomposed solve (``decomposition='progressive_hedging'``).
+        Called from :py:func:`_setup_mpc_optim_problem` unless the solver was loaded from the solver cache.
+
+        The subproblem is the MPC problem along a single path of the scenario tree (with the uncertain parameters of each stage as parameters).
+        Its cost is scaled such that the probability weighted sum over all scenarios yields the cost of the full problem.
+        The inputs up to the robust horizon (all inputs for ``open_loop``) are penalized with the multipliers
+        and the quadratic deviation from the consensus of progressive hedging.
+
+        :param ifcn: Discretization of the model equations (see :py:func:`do_mpc.optimizer.Optimizer._setup_discretization`).
+        :type ifcn: casadi.Function
+
+        :param n_total_coll_points: Number of collocation points per finite element.
+        :type n_total_coll_points: int
+
+        :param n_eps: Number of slack variables over the horizon.
+        :type n_eps: int
+        """
+        opt_x = self.opt_x_scenario
+        opt_p = self.opt_p_scenario
+        node_in, node_fun, aux_node_fun, cons_lb_node, cons_ub_node = self._setup_mpc_node_fun(ifcn, n_total_coll_points)
+        n_ph = len(opt_p['_ph_w'])
+
+        # Initial condition:
+        cons = [opt_x['_x', 0, 0, -1]-opt_p['_x0']/self._x_scaling]
+        obj = 0
+        opt_aux = []
+        for k in range(self.n_horizon):
+            k_eps = min(k, n_eps-1)
+            if self.nl_cons_check_colloc_points:
+                x_nl = vertcat(*[opt_x['_x', k, 0, i] for i in range(max(n_total_coll_points, 1))])
+                z_nl = vertcat(*[opt_x['_z', k, 0, i] for i in range(max(n_total_coll_points, 1))])
+            else:
+                x_nl = opt_x['_x', k, 0, -1]
+                z_nl = opt_x['_z', k, 0, 0]
+            if k == 0:
+                u_ref = opt_p['_u_prev']/self._u_scaling
+            else:
+                u_ref = opt_x['_u', k-1, 0]
+            node_args = {
+                'x_k': opt_x['_x', k, 0, -1],
+                'col_x': vertcat(*opt_x['_x', k+1, 0, :-1]),
+                'x_next': opt_x['_x', k+1, 0, -1],
+                'x_term': opt_x['_x', k+1, 0, -1],
+                'x_nl': x_nl,
+                'u': opt_x['_u', k, 0],
+                'u_ref': u_ref,
+                'col_z': vertcat(*opt_x['_z', k, 0]),
+                'z_last': opt_x['_z', k, 0, -1],
+                'z_nl': z_nl,
+                'tvp_k': opt_p['_tvp', k],
+                'tvp_next': opt_p['_tvp', k+1],
+                'p': opt_p['_p', k],
+                'eps': opt_x['_eps', k_eps, 0],
+                'omega': opt_p['_omega', k],
+                'terminal': float(k == self.n_horizon-1),
+                'w_obj': opt_p['_w_obj'],
+                'w_rterm': opt_p['_w_rterm'],
+                'w_eps': opt_p['_w_eps'],
+            }
+            [cons_k, obj_k] = node_fun(*[node_args[key] for key in node_in.keys()])
+            cons.append(cons_k)
+            # The (probability weighted) cost of the nodes is shared by all scenarios that pass the node:
+            obj += obj_k/opt_p['_omega', k]
+            if k < n_ph:
+                obj += opt_p['_ph_w', k].T@opt_x['_u', k, 0]
+                obj += opt_p['_ph_rho']/2*sumsqr(opt_x['_u', k, 0]-opt_p['_ph_u_bar', k])
+            opt_aux.append(aux_node_fun(node_args['x_k'], node_args['u'], node_args['z_last'], node_args['tvp_k'], node_args['p']))
+
+        cons = vertcat(*cons)
+        self.cons_lb_scenario = vertcat(np.zeros((self.model.n_x, 1)), repmat(cons_lb_node, self.n_horizon, 1))
+        self.cons_ub_scenario = vertcat(np.zeros((self.model.n_x, 1)), repmat(cons_ub_node, self.n_horizon, 1))
+        # Lagrange multipliers of all scenario subproblems are stored:
+        self.n_opt_lagr = cons.shape[0]*self.scenario_tree['n_scenarios'][-1]
+
+        nlpsol_opts = {
+            'expand': False,
+            'ipopt.linear_solver': 'mumps',
+            # The subproblems are solved repeatedly with small changes. Primal-dual warmstart from the previous solution:
+            'ipopt.warm_start_init_point': 'yes',
+            'ipopt.warm_start_bound_push': 1e-8,
+            'ipopt.warm_start_slack_bound_push': 1e-8,
+            'ipopt.warm_start_mult_bound_push': 1e-8,
+            'ipopt.mu_init': 1e-4,
+        }
+        nlpsol_opts.update(self.nlpsol_opts)
+        nlp = {'x': vertcat(opt_x), 'f': obj, 'g': cons, 'p': vertcat(opt_p)}
+        self.S_scenario = self._setup_nlpsol(nlp, nlpsol_opts)
+        self.opt_aux_scenario_fun = Function('opt_aux_scenario_fun', [vertcat(opt_x), vertcat(opt_p)], [vertcat(*opt_aux)])
+
+        self._save_solver_cache(**{key: getattr(self, key) for key in self._solver_cache_attributes()})
+
+    def _solve_progressive_hedging(self):
+        """Private method of the MPC class to solve the optimization problem with progressive hedging (``decomposition='progressive_hedging'``).
+        Called from :py:func:`solve`.
+
+        In each iteration, the scenario subproblems are solved (in parallel) with the current multipliers and consensus of the inputs.
+        The consensus is the probability weighted mean of the inputs of all scenarios with a common parent node.
+        The iterations stop once the weighted deviation from the consensus (primal residual) and the change of the consensus multiplied with the penalty parameter (dual residual)
+        are below the tolerance (or after ``max_iter`` iterations). With ``adaptive_rho``, the penalty parameter is adapted such that both residuals are balanced.
+        The multipliers are kept for the next call.
+        """
+        assert self.flags['setup'] == True, 'MPC was not setup yet. Please call MPC.setup().'
+        tic = time.time()
+        opts = self._ph_opts
+        n_leaves, n_ph, n_u = self._ph_w.shape
+        prob = self._ph_prob.reshape(-1, 1, 1)
+
+        if opts['n_processes'] > 1 and self._ph_pool is None:
+            self._ph_pool = concurrent.futures.ProcessPoolExecutor(max_workers=min(opts['n_processes'], n_leaves),
+                mp_context=multiprocessing.get_context('fork'), initializer=_init_solver_worker, initargs=(self.S_scenario,))
+
+        # Parameters, bounds and initial guess for all scenarios:
+        opt_p_num = self.opt_p_scenario(0)
+        opt_p_num['_x0'] = self.opt_p_num['_x0']
+        opt_p_num['_tvp'] = self.opt_p_num['_tvp']
+        opt_p_num['_u_prev'] = self.opt_p_num['_u_prev']
+        for key in ['_w_obj', '_w_rterm', '_w_eps']:
+            opt_p_num[key] = self.opt_p_num[key]
+        p_full = self.opt_p_num.cat.full().flatten()
+        p_scenario = np.repeat(opt_p_num.cat.full().T, n_leaves, axis=0)
+        p_scenario[:, self._ph_ind['_p']] = p_full[self._ph_p_ind]
+        p_scenario[:, self._ph_ind['_omega']] = self._ph_omega
+        lb_opt_x = self.lb_opt_x.cat.full().flatten()
+        ub_opt_x = self.ub_opt_x.cat.full().flatten()
+        if self._ph_solution is None:
+            # Initial guess from opt_x_num (multipliers are zero):
+            x_scenario = self.opt_x_num.cat.full().flatten()[self._ph_x_ind]
+            self._ph_solution = [{'x': x_scenario[l], 'lam_x': np.zeros(x_scenario.shape[1]), 'lam_g': np.zeros(self.cons_lb_scenario.shape[0])} for l in range(n_leaves)]
+
+        u_bar = np.zeros(self._ph_w.shape)
+        rho_k = opts['rho']
+        iter_count = 0
+        for ph_iter in range(opts['max_iter']):
+            # Without consensus (first iteration) the scenarios are solved independently (but with the multipliers from the previous call).
+            rho = 0 if ph_iter == 0 else rho_k
+            p_scenario[:, self._ph_ind['_ph_w']] = self._ph_w.reshape(n_leaves, -1)
+            p_scenario[:, self._ph_ind['_ph_u_bar']] = u_bar.reshape(n_leaves, -1)
+            p_scenario[:, self._ph_ind['_ph_rho']] = rho
+            solver_args = [{'x0': r_l['x'], 'lam_x0': r_l['lam_x'], 'lam_g0': r_l['lam_g'], 'lbx': lb_opt_x[self._ph_x_ind[l]], 'ubx': ub_opt_x[self._ph_x_ind[l]],
+                            'lbg': self.cons_lb_scenario, 'ubg': self.cons_ub_scenario, 'p': p_scenario[l]} for l, r_l in enumerate(self._ph_solution)]
+            if self._ph_pool is None:
+                self._ph_solution = [_solve_nlp(args_l, self.S_scenario) for args_l in solver_args]
+            else:
+                self._ph_solution = list(self._ph_pool.map(_solve_nlp, solver_args))
+            iter_count += sum(r_l['iter_count'] for r_l in self._ph_solution)
+            x_scenario = np.hstack([r_l['x'] for r_l in self._ph_solution]).T
+
+            # Consensus of the inputs (probability weighted mean of all scenarios with common parent node):
+            u_scenario = x_scenario[:, self._ph_u_ind]
+            u_bar_prev = u_bar
+            u_bar = np.zeros(u_scenario.shape)
+            for k in range(n_ph):
+                for g in np.unique(self._ph_group[:, k]):
+                    in_group = self._ph_group[:, k] == g
+                    u_bar[in_group, k] = np.sum(prob[in_group, 0]*u_scenario[in_group, k], axis=0)/np.sum(prob[in_group, 0])
+            self._ph_w += rho_k*(u_scenario-u_bar)
+            # Deviation from the consensus (primal residual) and change of the consensus (dual residual):
+            r_primal = np.sqrt(np.sum(prob*(u_scenario-u_bar)**2))
+            r_dual = rho_k*np.sqrt(np.sum(prob*(u_bar-u_bar_prev)**2))
+            residual = max(r_primal, r_dual)
+            if opts['adaptive_rho'] and ph_iter > 0:
+                # Residual balancing: A large penalty parameter enforces the consensus quickly but slows down the change of the consensus (and vice versa).
+                if r_primal > 10*r_dual:
+                    rho_k *= 2
+                elif r_dual > 10*r_primal:
+                    rho_k /= 2
+            if ph_iter > 0 and residual <= opts['tol']:
+                break
+
+        # Write the solution of all scenarios to the structure of the full problem:
+        opt_x_num = self.opt_x_num.cat.full().flatten()
+        lam_x_num = np.zeros(self.n_opt_x)
+        opt_aux_num = np.zeros(self.n_opt_aux)
+        for l, r_l in enumerate(self._ph_solution):
+            opt_x_num[self._ph_x_ind[l]] = r_l['x'].flatten()
+            lam_x_num[self._ph_x_ind[l]] = r_l['lam_x'].flatten()
+            opt_aux_num[self._ph_aux_ind[l]] = self.opt_aux_scenario_fun(r_l['x'], p_scenario[l]).full().flatten()
+            # The inputs of the scenarios are replaced by their consensus:
+            opt_x_num[self._ph_x_ind[l, self._ph_u_ind]] = u_bar[l]
+        self.opt_x_num.master = DM(opt_x_num)
+        self.opt_x_num_unscaled.master = self.opt_x_num.cat*self.opt_x_scaling.cat
+        self.opt_aux_num.master = DM(opt_aux_num)
+        self.opt_g_num = vertcat(*[r_l['g'] for r_l in self._ph_solution])
+        self.lam_g_num = vertcat(*[r_l['lam_g'] for r_l in self._ph_solution])
+        self.lam_x_num = DM(lam_x_num)
+
+        converged = residual <= opts['tol']
+        failed = [r_l['return_status'] for r_l in self._ph_solution if not r_l['success']]
+        if len(failed) > 0:
+            return_status = failed[0]
+        elif converged:
+            return_status = 'Solve_Succeeded'
+        else:
+            return_status = 'Maximum_Iterations_Exceeded'
+        self.solver_stats = {
+            'success': converged and len(failed) == 0,
+            'return_status': return_status,
+            'iter_count': iter_count,
+            'decomposition_iter': ph_iter+1,
+            'decomposition_residual': residual,
+            't_wall_S': time.time()-tic,
+        }
+
+    def _check_qp(self, opt_x, opt_p, obj, cons):
+        """Private method of the MPC class to check if the optimization problem is a quadratic program,
+        i.e. if the constraints are linear and the objective is quadratic in the optimization variables.
+        Problems formulated with ``MX`` are expanded to ``SX`` for this check (if possible).
+
+        :param opt_x: Symbolic optimization variables.
+        :type opt_x: casadi.SX or casadi.MX
+
+        :param opt_p: Symbolic parameters.
+        :type opt_p: casadi.SX or casadi.MX
+
+        :param obj: Objective function.
+        :type obj: casadi.SX or casadi.MX
+
+        :param cons: Constraints.
+        :type cons: casadi.SX or casadi.MX
+
+        :return: True, if the problem is a quadratic program.
+        :rtype: bool
+        """
+        if isinstance(opt_x, MX):
+            try:
+                nlp_fun = Function('nlp_fun', [opt_x, opt_p], [obj, cons]).expand()
+            except RuntimeError:
+                # Not all functions can be expanded (e.g. external functions).
+                return False
+            opt_x, opt_p = nlp_fun.sx_in()
+            obj, cons = nlp_fun(opt_x, opt_p)
+        return not depends_on(jacobian(cons, opt_x), opt_x) and not depends_on(hessian(obj, opt_x)[0], opt_x)
+
+    def _setup_rti(self, opt_x, opt_p, obj, cons):
+        """Private method of the MPC class to create the linearization and the QP solver for the real-time iteration (``real_time_iteration=True``).
+        Called from :py:func:`_setup_mpc_solver`.
+
+        The QP is formulated for the step of the optimization variables:
+
+        .. math::
+
+            \\min_{\\Delta w} \\quad & \\frac{1}{2} \\Delta w^T H \\Delta w + \\nabla f^T \\Delta w\\\\
+            \\text{s.t.} \\quad & g_{lb} - g \\leq J \\Delta w \\leq g_{ub} - g\\\\
+            & w_{lb} - w \\leq \\Delta w \\leq w_{ub} - w
+
+        :param opt_x: Symbolic optimization variables.
+        :type opt_x: casadi.SX or casadi.MX
+
+        :param opt_p: Symbolic parameters.
+        :type opt_p: casadi.SX or casadi.MX
+
+        :param obj: Objective function.
+        :type obj: casadi.SX or casadi.MX
+
+        :param cons: Constraints.
+        :type cons: casadi.SX or casadi.MX
+        """
+        lam_g = opt_x.sym('lam_g', cons.shape[0])
+        if self.rti_hessian == 'exact':
+            H, grad_f = hessian(obj+dot(lam_g, cons), opt_x)
+        else:
+            H, grad_f = hessian(obj, opt_x)
+        # Regularization (the Hessian is singular, e.g. for variables that only appear in the constraints):
+        H = H + self.rti_regularization*DM.eye(H.shape[0])
+        J = jacobian(cons, opt_x)
+        self._rti_lin_fun = Function('rti_lin_fun', [opt_x, opt_p, lam_g], [H, grad_f, J, cons])
+        rti_qpsol_opts = {'error_on_fail': False}
+        if self.rti_qpsol == 'qrqp':
+            rti_qpsol_opts.update({'print_iter': False, 'print_header': False, 'max_iter': 100})
+        rti_qpsol_opts.update(self.rti_qpsol_opts)
+        self._rti_qpsol = conic('rti_qpsol', self.rti_qpsol, {'h': H.sparsity(), 'a': J.sparsity()}, rti_qpsol_opts)
+
+    def _get_solver_cache_fingerprint_input(self):
+        """Private method of the MPC class that returns the functions and settings which define the MPC optimization problem.
+        These are used to compute the fingerprint for the solver cache (see :py:func:`do_mpc.optimizer.Optimizer._load_solver_cache`).
+
+        :return: List of functions and dict with settings.
+        :rtype: tuple
+        """
+        fun_list = [self.mterm_fun, self.lterm_fun, self.epsterm_fun, self._nl_cons_fun]
+        settings = {key: getattr(self, key) for key in self.data_fields if key not in ['solver_cache_dir', 'decomposition_opts', 'multistart_deadline']}
+        settings.update({
+            'n_combinations': self.n_combinations,
+            '_scenario_weights': self._scenario_weights,
+            '_x_scaling': self._x_scaling,
+            '_u_scaling': self._u_scaling,
+            '_z_scaling': self._z_scaling,
+            '_nl_cons_lb': self._nl_cons_lb,
+            '_nl_cons_ub': self._nl_cons_ub,
+            '_fixed_opt_x': self._get_fixed_opt_x(),
+        })
+        return fun_list, settings
+
+    def _solver_cache_attributes(self):
+        """Private method of the MPC class that returns the names of the attributes stored in the solver cache.
+
+        :return: Names of the cached attributes.
+        :rtype: list
+        """
+        if self.decomposition is not None:
+            return ['S_scenario', 'opt_aux_scenario_fun', 'cons_lb_scenario', 'cons_ub_scenario', 'n_opt_lagr']
+        attributes = ['S', 'opt_aux_expression_fun', 'cons_lb', 'cons_ub', 'n_opt_lagr', '_is_qp', '_nlp_perm', '_nlp_presolve']
+        if self.warm_start == 'shift':
+            attributes.append('_shift_ind')
+        if self.real_time_iteration:
+            attributes.extend(['_rti_lin_fun', '_rti_qpsol'])
+        if self.shrinking_horizon:
+            attributes.append('_horizon_cons_ind')
+        if self.multistart is not None:
+            attributes.append('_multistart_solvers')
+        return attributes
+
+
+# Solver in the worker processes of the decomposed solve (see MPC._solve_progressive_hedging) and the batched step (see MPC.make_step_batch).
+_worker_solver = None
+
+def _init_solver_worker(solver):
+    """Initialize a worker process with the solver (of the scenario subproblem or the full problem)."""
+    global _worker_solver
+    _worker_solver = solver
+
+class _MultistartWorkers:
+    """Worker processes of the multistart (see ``multistart`` in :py:func:`MPC.set_param`).
+    Each variant is solved in its own process, which receives the arguments of the solver and returns the result through a pipe.
+    Unfinished solves are cancelled by terminating the process. The process is started again for the next call.
+
+    :param solvers: Solver of each variant.
+    :type solvers: list
+    """
+    def __init__(self, solvers):
+        self.solvers = solvers
+        self.workers = [None]*len(solvers)
+
+    def _start(self, i):
+        mp_context = multiprocessing.get_context('fork')
+        conn, conn_worker = mp_context.Pipe()
+        process = mp_context.Process(target=_multistart_worker, args=(self.solvers[i], conn_worker), daemon=True)
+        process.start()
+        conn_worker.close()
+        self.workers[i] = (process, conn)
+
+    def race(self, solver_args, deadline=None):
+        """Solve the variants in parallel until the first converged solution is available or the deadline is exceeded (and at least one variant finished).
+
+        :param solver_args: Arguments of the solver for each variant (variant index as key).
+        :type solver_args: dict
+
+        :param deadline: Maximum time in seconds.
+        :type deadline: float
+
+        :return: Variant index and result (see :py:func:`_solve_nlp`) of the finished variants in order of completion.
+        :rtype: list
+        """
+        tic = time.time()
+        pending = {}
+        for i, args_i in solver_args.items():
+            if self.workers[i] is None:
+                self._start(i)
+            self.workers[i][1].send(args_i)
+            pending[self.workers[i][1]] = i
+
+        results = []
+        while len(pending) > 0 and not any(r['success'] for i, r in results):
+            timeout = None if deadline is None else max(deadline-(time.time()-tic), 0)
+            if timeout == 0 and len(results) == 0:
+                # Wait for the first finished variant:
+                timeout = None
+            ready = multiprocessing.connection.wait(list(pending.keys()), timeout)
+            if len(ready) == 0 and len(results) > 0:
+                break
+            for conn in ready:
+                i = pending.pop(conn)
+                try:
+                    results.append((i, conn.recv()))
+                except EOFError:
+                    # The worker process died (e.g. solver crash):
+                    self.workers[i] = None
+
+        # Cancel the unfinished solves:
+        for conn, i in pending.items():
+            process = self.workers[i][0]
+            process.terminate()
+            process.join()
+            conn.close()
+            self.workers[i] = None
+
+        return results
+
+    def close(self):
+        """Stop all worker processes."""
+        for i, worker in enumerate(self.workers):
+            if worker is not None:
+                process, conn = worker
+                process.terminate()
+                process.join()
+                conn.close()
+                self.workers[i] = None
+
+def _multistart_worker(solver, conn):
+    """Worker process of the multistart. Solves the problems received through the pipe until it is closed."""
+    while True:
+        try:
+            solver_args = conn.recv()
+        except EOFError:
+            break
+        conn.send(_solve_nlp(solver_args, solver))
+
+def _solve_nlp(solver_args, solver=None):
+    """Solve an optimization problem of the decomposed solve or the batched step (in the worker process, if no solver is passed).
+    Returns the solution and statistics as (picklable) numpy arrays and builtin types.
+    """
+    if solver is None:
+        solver = _worker_solver
+    r = solver(**solver_args)
+    stats = solver.stats()
+    return {
+        'x': r['x'].full(),
+        'f': float(r['f']),
+        'g': r['g'].full(),
+        'lam_x': r['lam_x'].full(),
+        'lam_g': r['lam_g'].full(),
+        'lam_p': r['lam_p'].full(),
+        'success': bool(stats['success']),
+        'return_status': stats['return_status'],
+        'iter_count': stats.get('iter_count', 0),
+        'stats': stats,
+    }
@@ -126,6 +126,9 @@ class Data:
         if not isinstance(ind, tuple):
             ind = [ind]
 
+        # Algebraic states eliminated from the model (see do_mpc.model.Model.setup) are stored as auxiliary expressions:
+        ind = self._eliminated_alg_ind(ind)
+
         # First element is the data_field:
         data_field = ind[0]
         # Check validity:
@@ -149,6 +152,20 @@ class Data:
             out = getattr(self, data_field)
         return out
 
+    def _eliminated_alg_ind(self, ind):
+        """Private method that maps queries of algebraic states, which were eliminated from the model (see :py:func:`do_mpc.model.Model.setup`),
+        to the respective auxiliary expressions.
+
+        :param ind: Power index of the query.
+        :type ind: tuple or list
+
+        :return: Power index of the query.
+        :rtype: tuple or list
+        """
+        if len(ind) > 1 and ind[0] == '_z' and ind[1] in self.model.get('_z_eliminated', []):
+            ind = ('_aux',) + tuple(ind[1:])
+        return ind
+
     def init_storage(self):
         """Create new (empty) arrays for all variables.
         The variables of interest are listed in the ``data_fields`` dictionary,
@@ -204,7 +221,7 @@ class Data:
             if type(value) == DM:
                 # Convert to numpy
                 value = value.full()
-            elif type(value) in [float, int, bool]:
+            elif type(value) in [float, int, bool, str]:
                 value = np.array(value)
             # Get current results array for the given key:
             arr = getattr(self, key)
@@ -288,6 +305,8 @@ class MPCData(Data):
         assert self.meta_data['store_full_solution'], 'Optimal trajectory is not stored. Please update your MPC settings.'
         assert isinstance(ind, tuple), 'Query index must be of type tuple.'
 
+        ind = self._eliminated_alg_ind(ind)
+
         structure_scenario = self.meta_data['structure_scenario']
 
         if self._opt_x_num.shape[0]==0:
@@ -306,8 +325,8 @@ class MPCData(Data):
             else:
                 f_ind = self.opt_x.f[(ind[0], slice(None), lambda v: horzcat(*v),slice(None), -1)+ind[1:]]
                 f_ind = np.array([f_ind_k.full() for f_ind_k in f_ind], dtype='int32')
-                # sort pred such that each column belongs to one scenario
-                f_ind = f_ind[range(f_ind.shape[0]),:,structure_scenario.T].T
+                # sort pred such that each column belongs to one scenario (algebraic states exist only until n_horizon-1)
+                f_ind = f_ind[range(f_ind.shape[0]),:,structure_scenario[:f_ind.shape[0]].T].T
                 # Store f_ind:
                 self.prediction_queries['ind'].append(ind)
                 self.prediction_queries['f_ind'].append(f_ind)
@@ -320,11 +339,16 @@ class MPCData(Data):
             else:
                 f_ind = self.opt_x.f[(ind[0], slice(None), lambda v: horzcat(*v),slice(None))+ind[1:]]
                 f_ind = np.array([f_ind_k.full() for f_ind_k in f_ind], dtype='int32')
+                # With move blocking, the inputs of each stage are those of its block (and scenario at the first stage of the block):
+                n_horizon = structure_scenario.shape[0]-1
+                u_block = self.meta_data.get('u_block', np.arange(n_horizon))
+                u_block_start = self.meta_data.get('u_block_start', np.arange(n_horizon))
+                f_ind = f_ind[u_block]
                 # sort pred such that each column belongs to one scenario
                 if self.meta_data['open_loop']:
-                    f_ind = f_ind[range(f_ind.shape[0]),:,structure_scenario[:-1,[0]].T].T
+                    f_ind = f_ind[range(f_ind.shape[0]),:,structure_scenario[u_block_start][:,[0]].T].T
                 else:
-                    f_ind = f_ind[range(f_ind.shape[0]),:,structure_scenario[:-1,:].T].T
+                    f_ind = f_ind[range(f_ind.shape[0]),:,structure_scenario[u_block_start,:].T].T
 
                 # Store f_ind:
                 self.prediction_queries['ind'].append(ind)
@@ -164,13 +164,19 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
             'collocation_type',
             'collocation_deg',
             'collocation_ni',
+            'integration_tool',
+            'integration_opts',
             'nl_cons_check_colloc_points',
             'nl_cons_single_slack',
             'cons_check_colloc_points',
             'store_full_solution',
             'store_lagr_multiplier',
             'store_solver_stats',
-            'nlpsol_opts'
+            'nlpsol_opts',
+            'solver_cache_dir',
+            'compile_nlp',
+            'max_solve_time',
+            'presolve',
         ]
 
         # Default Parameters:
@@ -179,6 +185,8 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
         self.collocation_type = 'radau'
         self.collocation_deg = 2
         self.collocation_ni = 1
+        self.integration_tool = 'rk4'
+        self.integration_opts = {}
         self.nl_cons_check_colloc_points = False
         self.nl_cons_single_slack = False
         self.cons_check_colloc_points = True
@@ -190,6 +198,10 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
             't_wall_S',
         ]
         self.nlpsol_opts = {} # Will update default options with this dict.
+        self.solver_cache_dir = None
+        self.compile_nlp = False
+        self.max_solve_time = None
+        self.presolve = False
 
 
         # Create seperate structs for the estimated and the set parameters (the union of both are all parameters of the model.)
@@ -435,7 +447,7 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
         :param meas_from_data: Default option to retrieve past measurements for the MHE optimization problem. The :py:func:`set_y_fun` is called during setup.
         :type meas_from_data: bool
 
-        :param state_discretization: Choose the state discretization for continuous models. Currently only ``'collocation'`` is available. Defaults to ``'collocation'``. Has no effect if model is created in ``discrete`` type.
+        :param state_discretization: Choose the state discretization for continuous models. Either ``'collocation'`` (orthogonal collocation) or ``'multiple_shooting'`` (the model is integrated over each time-step with ``integration_tool``, the optimization variables are only the states at the beginning of each time-step). Defaults to ``'collocation'``. Has no effect if model is created in ``discrete`` type.
         :type state_discretization: str
 
         :param collocation_type: Choose the collocation type for continuous models with collocation as state discretization. Currently only ``'radau'`` is available. Defaults to ``'radau'``.
@@ -447,6 +459,12 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
         :param collocation_ni: For orthogonal collocation, choose the number of finite elements for the states within a time-step (and during constant control input). Defaults to ``1``. Can be used to avoid high-order polynomials.
         :type collocation_ni: int
 
+        :param integration_tool: For multiple shooting, choose the integrator. Either ``'rk4'`` (fixed-step Runge-Kutta method of order four, created symbolically), ``'cvodes'`` or ``'idas'`` (CasADi integrators, ``'idas'`` is required for models with algebraic states). The CasADi integrators can only be used with ``MX`` symbolic variables (``symvar_type='MX'`` of the model). Defaults to ``'rk4'``.
+        :type integration_tool: str
+
+        :param integration_opts: For multiple shooting, options of the integrator. For ``'rk4'``, the number of integration steps per time-step can be set with ``'number_of_finite_elements'`` (defaults to ``1``). For ``'cvodes'`` and ``'idas'``, the options are passed to the CasADi integrator (e.g. ``'abstol'`` and ``'reltol'``). Defaults to ``{}``.
+        :type integration_opts: dict
+
         :param nl_cons_check_colloc_points: For orthogonal collocation choose wether the bounds set with :py:func:`set_nl_cons` are evaluated once per finite Element or for each collocation point. Defaults to ``False`` (once per collocation point).
         :type nl_cons_check_colloc_points: bool
 
@@ -462,12 +480,24 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
         :param store_lagr_multiplier: Choose whether to store the lagrange multipliers of the optimization problem. Increases the required storage. Defaults to ``True``.
         :type store_lagr_multiplier: bool
 
-        :param store_solver_stats: Choose which solver statistics to store. Must be a list of valid statistics. Defaults to ``['success','t_wall_S','t_wall_S']``.
+        :param store_solver_stats: Choose which solver statistics to store. Must be a list of valid statistics. In addition to the statistics of the solver, ``'solve_status'`` (``'converged'``, ``'suboptimal'``, ``'fallback'`` or ``'failed'``, see ``max_solve_time``) can be stored. Defaults to ``['success','t_wall_S','t_wall_S']``.
         :type store_solver_stats: list
 
         :param nlpsol_opts: Dictionary with options for the CasADi solver call ``nlpsol`` with plugin ``ipopt``. All options are listed `here <http://casadi.sourceforge.net/api/internal/d4/d89/group__nlpsol.html>`_.
         :type store_solver_stats: dict
 
+        :param solver_cache_dir: Directory for the solver cache. If a directory is supplied, the solver created in :py:func:`setup` is stored on disk and loaded again (instead of being created) whenever an identical optimization problem is setup. The problem is identified by a fingerprint of the model, the objective, the constraints and the configuration. Bounds can be changed without invalidating the cache. On a cache hit, the construction of the optimization problem and its derivatives is skipped. The remaining setup time is dominated by loading (deserializing) the solver and creating the structures of the optimization variables, which typically reduces the setup time by a factor of two to four (not to milliseconds). Loading is fastest in combination with ``compile_nlp``. Defaults to ``None`` (no caching).
+        :type solver_cache_dir: str
+
+        :param compile_nlp: If ``True``, C code is generated for the functions of the optimization problem (objective, constraints and their derivatives) and compiled with the local C compiler. This can drastically reduce the time for function evaluations during the solver call. The compilation can take several minutes for large problems. The compiled library is therefore stored (in ``solver_cache_dir`` or the temporary directory of the system) and reused for identical problems. Without compiler, the problem is solved without compilation. Defaults to ``False``.
+        :type compile_nlp: bool
+
+        :param max_solve_time: Maximum wall time in seconds for each solver call (IPOPT). The solver is stopped once the time is exceeded (IPOPT option ``max_wall_time`` and an iteration callback). If the solver did not converge, the best feasible iterate (lowest objective) is returned. If no feasible iterate was found, the first iterate of the solver (initial guess) is returned. The result is recorded in the solver statistic ``'solve_status'`` (``'converged'``, ``'suboptimal'`` or ``'fallback'``, see ``store_solver_stats``). Without ``max_solve_time``, ``'solve_status'`` is ``'converged'`` or ``'failed'`` (the solver did not converge and its last iterate is returned). The solver cache is not used with ``max_solve_time``. Defaults to ``None`` (no time limit).
+        :type max_solve_time: float
+
+        :param presolve: If ``True``, the optimization problem is simplified before it is passed to the solver: Constraints with infinite bounds are removed, duplicate constraints are merged, nonlinear constraints that are affine in a single variable are converted to bounds and optimization variables with identical lower and upper bounds are eliminated. The solution, :py:attr:`opt_x_num` and the lagrange multipliers refer to the original problem. The bounds of fixed variables cannot be changed after :py:func:`setup`. Defaults to ``False``.
+        :type presolve: bool
+
         .. note:: We highly suggest to change the linear solver for IPOPT from `mumps` to `MA27`. In many cases this will drastically boost the speed of **do-mpc**. Change the linear solver with:
 
             ::
@@ -881,10 +911,19 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
             raise Exception('You have not suppplied a measurement function. Use .set_y_fun or set parameter meas_from_data to True for default function.')
 
 
-    def set_initial_guess(self):
+    def set_initial_guess(self, method='constant', u_guess=None):
         """Initial guess for optimization variables.
         Uses the current class attributes :py:obj:`x0`, :py:obj:`z0` and :py:obj:`u0`, :py:obj:`p_est0` to create an initial guess for the MHE.
-        The initial guess is simply the initial values for all :math:`k=0,\dots,N` instances of :math:`x_k`, :math:`u_k` and :math:`z_k`, :math:`p_{\\text{est,k}}`.
+
+        With ``method='constant'`` (default), the initial guess is simply the initial values for all :math:`k=0,\\dots,N` instances of :math:`x_k`, :math:`u_k` and :math:`z_k`, :math:`p_{\\text{est,k}}`.
+
+        With ``method='simulation'``, the states and algebraic states are obtained by simulating the model from :py:obj:`x0` with the discretization of the optimization problem
+        (e.g. orthogonal collocation) over the estimation horizon. The initial guess is thus dynamically consistent.
+        The simulation uses :py:obj:`p_est0`, the current values of the time-varying parameters and set parameters (see :py:func:`set_tvp_fun` and :py:func:`set_p_fun`) and zero process noise.
+        If the simulation of a step fails, the state of the previous step is kept for the remaining horizon.
+
+        The inputs are :py:obj:`u0` for the entire horizon or, optionally, the sequence ``u_guess``.
+        For the simulation, the inputs are projected on their bounds.
 
         .. warning::
             If no initial values for :py:attr:`x0`, :py:attr:`z0` and :py:attr:`u0` were supplied during setup, these default to zero.
@@ -892,16 +931,67 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
         .. note::
             The initial guess is fully customizable by directly setting values on the class attribute:
             :py:attr:`opt_x_num`.
+
+        :param method: Method to create the initial guess for the states. Must be ``'constant'`` or ``'simulation'``.
+        :type method: str
+
+        :param u_guess: Inputs for each step of the horizon with shape ``(n_horizon, n_u)``. Defaults to :py:obj:`u0` for all steps.
+        :type u_guess: numpy.ndarray
+
+        :raises assertion: method must be constant or simulation.
+        :raises assertion: u_guess must have shape (n_horizon, n_u).
         """
         assert self.flags['setup'] == True, 'mhe was not setup yet. Please call mhe.setup().'
+        assert method in ['constant', 'simulation'], 'method must be constant or simulation, you have {}'.format(method)
 
         self.opt_x_num['_x'] = self._x0.cat/self._x_scaling
         self.opt_x_num['_u'] = self._u0.cat/self._u_scaling
         self.opt_x_num['_z'] = self._z0.cat/self._z_scaling
         self.opt_x_num['_p_est'] = self._p_est0.cat/self._p_est_scaling
 
+        if u_guess is not None:
+            u_guess = np.array(u_guess).reshape(-1, self.model.n_u)
+            assert u_guess.shape[0] == self.n_horizon, 'u_guess must have shape (n_horizon, n_u) = ({}, {}), you have {}'.format(self.n_horizon, self.model.n_u, u_guess.shape)
+            for k in range(self.n_horizon):
+                self.opt_x_num['_u', k] = u_guess[k]/self._u_scaling.cat.full().flatten()
+
+        if method == 'simulation':
+            self._simulate_initial_guess()
+
         self.flags['set_initial_guess'] = True
 
+    def _simulate_initial_guess(self):
+        """Private method of the MHE class to simulate the states and algebraic states of the initial guess
+        over the estimation horizon with the discretization of the optimization problem (see :py:func:`set_initial_guess`).
+        The inputs and process noise are taken from :py:attr:`opt_x_num` and the inputs are projected on their bounds.
+        """
+        n_z = self.model.n_z
+
+        tvp0 = self.tvp_fun(self._t0)
+        p0 = self._p_cat_fun(self.opt_x_num['_p_est'], DM(self.p_fun(self._t0))/self._p_set_scaling)
+        z0 = (self._z0.cat/self._z_scaling).full().flatten()
+
+        failed = False
+        for k in range(self.n_horizon):
+            x_k = self.opt_x_num['_x', k, -1]
+            u_k = np.clip(DM(self.opt_x_num['_u', k]).full(), self.lb_opt_x['_u', k].full(), self.ub_opt_x['_u', k].full())
+            self.opt_x_num['_u', k] = u_k
+            res = self._simulate_ifcn(x_k, u_k, tvp0['_tvp', k], p0, self.opt_x_num['_w', k], z0)
+            if res is None:
+                # Keep the state of the previous step:
+                failed = True
+                res = (np.tile(DM(x_k).full().flatten(), self._ifcn.size1_in(1)//self.model.n_x), np.tile(z0, self._ifcn.size1_in(3)//max(n_z, 1)), DM(x_k).full().flatten())
+            col_xk, col_zk, xf_k = res
+            for i, x_i in enumerate(col_xk.reshape(-1, self.model.n_x)):
+                self.opt_x_num['_x', k+1, i] = x_i
+            if n_z > 0:
+                for i, z_i in enumerate(col_zk.reshape(-1, n_z)):
+                    self.opt_x_num['_z', k, i] = z_i
+            self.opt_x_num['_x', k+1, -1] = xf_k
+
+        if failed:
+            warnings.warn('The simulation of the initial guess failed for some steps of the horizon. The state of the previous step was used instead.')
+
     def setup(self):
         """The setup method finalizes the MHE creation.
         The optimization problem is created based on the configuration of the module.
@@ -1096,6 +1186,64 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
         self.lb_opt_x = opt_x(-np.inf)
         self.ub_opt_x = opt_x(np.inf)
 
+        if self.cons_check_colloc_points:   # Constraints for all collocation points.
+            # Bounds for the states on all discretize values along the horizon
+            self.lb_opt_x['_x'] = self._x_lb.cat/self._x_scaling
+            self.ub_opt_x['_x'] = self._x_ub.cat/self._x_scaling
+
+            # Bounds for the algebraic states along the horizon
+            self.lb_opt_x['_z'] = self._z_lb.cat/self._z_scaling
+            self.ub_opt_x['_z'] = self._z_ub.cat/self._z_scaling
+        else:   # Constraints only at the beginning of the finite Element
+            # Bounds for the states on all discretize values along the horizon
+            self.lb_opt_x['_x', 1:self.n_horizon, -1] = self._x_lb.cat/self._x_scaling
+            self.ub_opt_x['_x', 1:self.n_horizon, -1] = self._x_ub.cat/self._x_scaling
+
+            # Bounds for the algebraic states along the horizon
+            self.lb_opt_x['_z', :, 0] = self._z_lb.cat/self._z_scaling
+            self.ub_opt_x['_z', :, 0] = self._z_ub.cat/self._z_scaling
+
+        # Bounds for the inputs along the horizon
+        self.lb_opt_x['_u'] = self._u_lb.cat/self._u_scaling
+        self.ub_opt_x['_u'] = self._u_ub.cat/self._u_scaling
+
+        # Bounds for the slack variables along the horizon:
+        self.lb_opt_x['_eps'] = self._eps_lb.cat
+        self.ub_opt_x['_eps'] = self._eps_ub.cat
+
+        # Bounds for the inputs along the horizon
+        self.lb_opt_x['_p_est'] = self._p_est_lb.cat/self._p_est_scaling
+        self.ub_opt_x['_p_est'] = self._p_est_ub.cat/self._p_est_scaling
+
+        # The solver (and related objects) are loaded from disk if the identical problem was created before (optional):
+        if not self._load_solver_cache(*self._get_solver_cache_fingerprint_input()):
+            self._setup_mhe_nlp(ifcn, n_total_coll_points, n_eps)
+
+        # Create copies of these structures with numerical values (all zero):
+        self.opt_x_num = self.opt_x(0)
+        self.opt_x_num_unscaled = self.opt_x(0)
+        self.opt_p_num = self.opt_p(0)
+        self.opt_aux_num = self.opt_aux(0)
+
+    def _setup_mhe_nlp(self, ifcn, n_total_coll_points, n_eps):
+        """Private method of the MHE class to create the objective function and constraints of the MHE
+        optimization problem and the resulting solver object. Called from :py:func:`_setup_mhe_optim_problem`
+        unless the solver was loaded from the solver cache.
+
+        :param ifcn: Discretization of the model equations (see :py:func:`do_mpc.optimizer.Optimizer._setup_discretization`).
+        :type ifcn: casadi.Function
+
+        :param n_total_coll_points: Number of collocation points per finite element.
+        :type n_total_coll_points: int
+
+        :param n_eps: Number of slack variables over the horizon.
+        :type n_eps: int
+        """
+        opt_x = self.opt_x
+        opt_x_unscaled = self.opt_x_unscaled
+        opt_p = self.opt_p
+        opt_aux = self.opt_aux
+
         # Initialize objective function and constraints
         obj = 0
         cons = []
@@ -1147,7 +1295,7 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
             k_eps = min(k, n_eps-1)
             if self.nl_cons_check_colloc_points:
                 # Ensure nonlinear constraints on all collocation points
-                for i in range(n_total_coll_points):
+                for i in range(max(n_total_coll_points, 1)):
                     nl_cons_k = self._nl_cons_fun(
                         opt_x_unscaled['_x', k, i], opt_x_unscaled['_u', k], opt_x_unscaled['_z', k, i],
                         opt_p['_tvp', k], opt_x['_p_est'], opt_p['_p_set'], opt_x_unscaled['_eps', k_eps])
@@ -1163,6 +1311,7 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
                 cons_lb.append(self._nl_cons_lb)
                 cons_ub.append(self._nl_cons_ub)
 
+            # NOTE: The nonlinear constraints of the last point are added again. The duplicate rows are merged with presolve.
             cons.append(nl_cons_k)
             cons_lb.append(self._nl_cons_lb)
             cons_ub.append(self._nl_cons_ub)
@@ -1173,43 +1322,13 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
             )
 
             # Add slack variables to the cost
-            obj += self.epsterm_fun(opt_x_unscaled['_eps', k_eps])
+            obj += self.epsterm_fun(opt_x_unscaled['_eps', k_eps], self._eps_penalty)
 
 
             # Calculate the auxiliary expressions for the current scenario:
             opt_aux['_aux', k] = self.model._aux_expression_fun(
                 opt_x_unscaled['_x', k, -1], opt_x_unscaled['_u', k], opt_x_unscaled['_z', k, -1], opt_p['_tvp', k], _p)
 
-
-        if self.cons_check_colloc_points:   # Constraints for all collocation points.
-            # Bounds for the states on all discretize values along the horizon
-            self.lb_opt_x['_x'] = self._x_lb.cat/self._x_scaling
-            self.ub_opt_x['_x'] = self._x_ub.cat/self._x_scaling
-
-            # Bounds for the algebraic states along the horizon
-            self.lb_opt_x['_z'] = self._z_lb.cat/self._z_scaling
-            self.ub_opt_x['_z'] = self._z_ub.cat/self._z_scaling
-        else:   # Constraints only at the beginning of the finite Element
-            # Bounds for the states on all discretize values along the horizon
-            self.lb_opt_x['_x', 1:self.n_horizon, -1] = self._x_lb.cat/self._x_scaling
-            self.ub_opt_x['_x', 1:self.n_horizon, -1] = self._x_ub.cat/self._x_scaling
-
-            # Bounds for the algebraic states along the horizon
-            self.lb_opt_x['_z', :, 0] = self._z_lb.cat/self._z_scaling
-            self.ub_opt_x['_z', :, 0] = self._z_ub.cat/self._z_scaling
-
-        # Bounds for the inputs along the horizon
-        self.lb_opt_x['_u'] = self._u_lb.cat/self._u_scaling
-        self.ub_opt_x['_u'] = self._u_ub.cat/self._u_scaling
-
-        # Bounds for the slack variables along the horizon:
-        self.lb_opt_x['_eps'] = self._eps_lb.cat
-        self.ub_opt_x['_eps'] = self._eps_ub.cat
-
-        # Bounds for the inputs along the horizon
-        self.lb_opt_x['_p_est'] = self._p_est_lb.cat/self._p_est_scaling
-        self.ub_opt_x['_p_est'] = self._p_est_ub.cat/self._p_est_scaling
-
         cons = vertcat(*cons)
         self.cons_lb = vertcat(*cons_lb)
         self.cons_ub = vertcat(*cons_ub)
@@ -1234,15 +1353,47 @@ class MHE(do_mpc.optimizer.Optimizer, Estimator):
         nlpsol_opts = {
             'expand': False,
             'ipopt.linear_solver': 'mumps',
-        }.update(self.nlpsol_opts)
+        }
         nlp = {'x': vertcat(opt_x), 'f': obj, 'g': cons, 'p': vertcat(opt_p)}
-        self.S = nlpsol('S', 'ipopt', nlp, self.nlpsol_opts)
-
-        # Create copies of these structures with numerical values (all zero):
-        self.opt_x_num = self.opt_x(0)
-        self.opt_x_num_unscaled = self.opt_x(0)
-        self.opt_p_num = self.opt_p(0)
-        self.opt_aux_num = self.opt_aux(0)
+        if self.presolve:
+            nlp = self._setup_nlp_presolve(nlp)
+        if self.max_solve_time is not None:
+            nlpsol_opts.update(self._setup_iteration_callback(nlp))
+        nlpsol_opts.update(self.nlpsol_opts)
+        self.S = self._setup_nlpsol(nlp, nlpsol_opts)
 
         # Create function to caculate all auxiliary expressions:
         self.opt_aux_expression_fun = Function('opt_aux_expression_fun', [opt_x, opt_p], [opt_aux])
+
+        self._save_solver_cache(**{key: getattr(self, key) for key in self._solver_cache_attributes()})
+
+    def _get_solver_cache_fingerprint_input(self):
+        """Private method of the MHE class that returns the functions and settings which define the MHE optimization problem.
+        These are used to compute the fingerprint for the solver cache (see :py:func:`do_mpc.optimizer.Optimizer._load_solver_cache`).
+
+        :return: List of functions and dict with settings.
+        :rtype: tuple
+        """
+        fun_list = [self.arrival_cost_fun, self.stage_cost_fun, self._p_cat_fun, self.epsterm_fun, self._nl_cons_fun]
+        settings = {key: getattr(self, key) for key in self.data_fields if key != 'solver_cache_dir'}
+        settings.update({
+            '_p_est': self._p_est.labels(),
+            '_x_scaling': self._x_scaling,
+            '_u_scaling': self._u_scaling,
+            '_z_scaling': self._z_scaling,
+            '_p_est_scaling': self._p_est_scaling,
+            '_p_set_scaling': self._p_set_scaling,
+            '_nl_cons_lb': self._nl_cons_lb,
+            '_nl_cons_ub': self._nl_cons_ub,
+            '_eps_penalty': self._eps_penalty,
+            '_fixed_opt_x': self._get_fixed_opt_x(),
+        })
+        return fun_list, settings
+
+    def _solver_cache_attributes(self):
+        """Private method of the MHE class that returns the names of the attributes stored in the solver cache.
+
+        :return: Names of the cached attributes.
+        :rtype: list
+        """
+        return ['S', 'opt_aux_expression_fun', 'cons_lb', 'cons_ub', 'n_opt_lagr', '_nlp_perm', '_nlp_presolve']
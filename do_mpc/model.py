@@ -1094,19 +1094,141 @@ class Model:
             for var, name in zip(var_dict['var'], var_dict['name']):
                 var.__dict__['this'] = sym_struct[name].__dict__['this']
 
+    def _eliminate_alg(self):
+        """Helper function for :py:func:`setup`. Not part of the public API.
+        This method is used to eliminate algebraic states that can be computed explicitly from the algebraic equations.
+
+        An algebraic equation is solved explicitly if it is affine in the (remaining) algebraic states with a constant and invertible coefficient matrix:
+
+        * An equation that depends on a single algebraic variable (of matching dimension), e.g. ``z - f(x,u) = 0``, is solved for this variable.
+          The solution is substituted in all remaining equations and the procedure is repeated.
+
+        * Afterwards, all remaining equations that are affine in the algebraic states are solved simultaneously,
+          if they form a square linear system.
+
+        The eliminated algebraic states are substituted in the right-hand-side, the remaining algebraic equations,
+        the auxiliary expressions and the measurement equations.
+        They are removed from the algebraic states and introduced as auxiliary expressions with the same name instead (see :py:func:`set_expression`).
+
+        :return: Eliminated algebraic variables (as returned by :py:func:`set_variable`) with their names as keys.
+        :rtype: dict
+        """
+        z_var = dict(zip(self._z['name'][1:], self._z['var'][1:]))
+        z_remaining = list(z_var.keys())
+        alg_remaining = [[alg_i.name, alg_i.dict['expr']] for alg_i in self.alg_list[1:]]
+        z_expl = {}
+
+        # Jacobians and substitutions are computed for each variable individually (MX only allows purely symbolic arguments).
+        def jacobian_z(alg_expr, z_names):
+            return horzcat(*[jacobian(alg_expr, z_var[name]) for name in z_names])
+
+        def substitute_z(expr, z_sol):
+            return substitute([expr], [z_var[name] for name in z_sol.keys()], list(z_sol.values()))[0]
+
+        def solve_affine(alg_expr, z_names):
+            # Solve alg_expr = 0 for the variables z_names, if alg_expr is affine with constant and invertible coefficients.
+            if sum([z_var[name].numel() for name in z_names]) != alg_expr.numel():
+                return None
+            A = jacobian_z(alg_expr, z_names)
+            if len(symvar(A)) > 0:
+                return None
+            A = evalf(A).full()
+            if np.linalg.matrix_rank(A) < A.shape[0]:
+                return None
+            b = substitute_z(vec(alg_expr), {name: DM.zeros(z_var[name].shape) for name in z_names})
+            z_sol = -mtimes(DM(np.linalg.inv(A)), b)
+            z_sol = vertsplit(z_sol, np.cumsum([0]+[z_var[name].numel() for name in z_names]).tolist())
+            return {name: reshape(z_sol_i, z_var[name].shape) for name, z_sol_i in zip(z_names, z_sol)}
+
+        def substitute_remaining(z_sol):
+            # Substitute the eliminated variables in all remaining algebraic equations.
+            for alg_i in alg_remaining:
+                alg_i[1] = substitute_z(alg_i[1], z_sol)
+            for name in z_sol.keys():
+                z_remaining.remove(name)
+            z_expl.update(z_sol)
+
+        # Algebraic equations that depend on a single algebraic variable:
+        eliminated = True
+        while eliminated:
+            eliminated = False
+            for alg_i in alg_remaining:
+                z_dep = [name for name in z_remaining if depends_on(alg_i[1], z_var[name])]
+                if len(z_dep) != 1:
+                    continue
+                z_sol = solve_affine(alg_i[1], z_dep)
+                if z_sol is not None:
+                    alg_remaining.remove(alg_i)
+                    substitute_remaining(z_sol)
+                    eliminated = True
+                    break
+
+        # Remaining algebraic equations that form a square linear system:
+        if len(z_remaining) > 0:
+            alg_affine = [alg_i for alg_i in alg_remaining if len(symvar(jacobian_z(alg_i[1], z_remaining))) == 0]
+            z_dep = [name for name in z_remaining if any([depends_on(alg_i[1], z_var[name]) for alg_i in alg_affine])]
+            if len(z_dep) > 0:
+                z_sol = solve_affine(vertcat(*[vec(alg_i[1]) for alg_i in alg_affine]), z_dep)
+                if z_sol is not None:
+                    for alg_i in alg_affine:
+                        alg_remaining.remove(alg_i)
+                    substitute_remaining(z_sol)
+
+        if len(z_expl) == 0:
+            return {}
+
+        # Substitute eliminated algebraic states in all model expressions:
+        def substitute_elim(expr):
+            if isinstance(expr, self.sv.dtype):
+                return substitute_z(expr, z_expl)
+            return expr
+
+        for rhs_i in self.rhs_list:
+            rhs_i['expr'] = substitute_elim(rhs_i['expr'])
+        self._aux_expression = [entry(aux_i.name, expr=substitute_elim(aux_i.dict['expr'])) for aux_i in self._aux_expression]
+        self._y_expression = [entry(y_i.name, expr=substitute_elim(y_i.dict['expr'])) for y_i in self._y_expression]
+        self.alg_list = self.alg_list[:1] + [entry(name, expr=expr) for name, expr in alg_remaining]
+
+        # Remove eliminated algebraic states and introduce them as auxiliary expressions:
+        for name, expr in z_expl.items():
+            assert name not in self._aux['name'], 'The eliminated algebraic state {} can not be introduced as auxiliary expression, because the name already exists.'.format(name)
+            ind = self._z['name'].index(name)
+            self._z['name'].pop(ind)
+            self._z['var'].pop(ind)
+            self.set_expression(name, self.sv.dtype(expr))
 
-    def setup(self):
+        return {name: z_var[name] for name in z_expl.keys()}
+
+
+    def setup(self, eliminate_alg=False):
         """Setup method must be called to finalize the modelling process.
         All required model variables must be declared.
         The right hand side expression for ``_x`` must have been set with :py:func:`set_rhs`.
 
         Sets default measurement function (state feedback) if :py:func:`set_meas` was not called.
 
+        Optionally, set ``eliminate_alg=True`` to eliminate all algebraic states that can be computed explicitly,
+        i.e. from algebraic equations that are affine in the algebraic states with constant coefficients (e.g. ``z - f(x,u) = 0``).
+        The solution is substituted in the right-hand-side, the remaining algebraic equations, the auxiliary expressions and the measurement equations.
+        The eliminated algebraic states are thus no longer optimization variables of :py:class:`do_mpc.controller.MPC` and :py:class:`do_mpc.estimator.MHE`
+        and are not computed by the :py:class:`do_mpc.simulator.Simulator`.
+
         .. warning::
 
             After calling :py:func:`setup`, the model is locked and no further variables,
             expressions etc. can be set.
 
+        .. note::
+
+            The eliminated algebraic states are removed from ``model.z`` and introduced as auxiliary expressions with the same name (``model.aux``).
+            The stored results can still be queried as algebraic states, e.g. ``mpc.data['_z', 'name']``.
+            Variables returned by :py:func:`set_variable` for eliminated algebraic states are replaced by their explicit expression
+            and can thus still be used (e.g. in the objective function).
+            Bounds and scaling can only be set for the remaining algebraic states.
+
+        :param eliminate_alg: Eliminate algebraic states that can be computed explicitly. Defaults to ``False``.
+        :type eliminate_alg: bool
+
         :raises assertion: Definition of right hand side (rhs) is incomplete
 
         :return: None
@@ -1119,6 +1241,12 @@ class Model:
             for name, var in zip(self._x['name'], self._x['var']):
                 self.set_meas(name, var, meas_noise=False)
 
+        # Eliminate explicit algebraic states (must be done before the structures are created):
+        if eliminate_alg:
+            z_eliminated = self._eliminate_alg()
+        else:
+            z_eliminated = {}
+
         # Write self._y_expression (measurement equations) as struct symbolic expression structures.
         self._y_expression = self.sv.struct(self._y_expression)
 
@@ -1161,6 +1289,11 @@ class Model:
 
         self._substitute_exported_vars(var_dict_list, sym_struct_list)
 
+        # Exported eliminated algebraic states are replaced by their explicit expression:
+        for name, var in z_eliminated.items():
+            var.__dict__['this'] = self._aux_expression[name].__dict__['this']
+        self._z_eliminated = list(z_eliminated.keys())
+
         self._x = _x
         self._w = _w
         self._v = _v
@@ -27,11 +27,21 @@ import pdb
 import itertools
 import time
 import warnings
+import os
+import json
+import hashlib
+import shutil
+import subprocess
+import tempfile
 
 
 from do_mpc.tools.indexedproperty import IndexedProperty
 
 
+# Version of the file format of the solver cache (part of the fingerprint, see Optimizer._get_solver_cache_file).
+_SOLVER_CACHE_VERSION = 2
+
+
 class Optimizer:
     """The base clase for the optimization based state estimation (MHE) and predictive controller (MPC).
     This class establishes the jointly used attributes, methods and properties.
@@ -72,6 +82,15 @@ class Optimizer:
         ]
         self.slack_cost = 0
 
+        # Pass the lagrange multipliers of the previous solution as initial guess to the solver (optional).
+        self._lam_warmstart = False
+        # Indices of the optimization variables passed to the solver (optional, see _permute_nlp).
+        self._nlp_perm = None
+        # Fixed variables and removed, merged and converted constraints of the presolve (optional, see _setup_nlp_presolve).
+        self._nlp_presolve = None
+        # Simulation of the discretization for the initial guess (created on demand, see _simulate_ifcn).
+        self._ifcn_sim = None
+
 
     @IndexedProperty
     def bounds(self, ind):
@@ -278,7 +297,7 @@ class Optimizer:
                             't_proc_callback_fun', 't_proc_nlp_f', 't_proc_nlp_g', 't_proc_nlp_grad',
                             't_proc_nlp_grad_f', 't_proc_nlp_hess_l', 't_proc_nlp_jac_g', 't_wall_S',
                             't_wall_callback_fun', 't_wall_nlp_f', 't_wall_nlp_g', 't_wall_nlp_grad', 't_wall_nlp_grad_f',
-                            't_wall_nlp_hess_l', 't_wall_nlp_jac_g']
+                            't_wall_nlp_hess_l', 't_wall_nlp_jac_g', 'warm_start', 'decomposition_iter', 'decomposition_residual', 'fallback', 'solve_status', 'multistart_variant']
             # Create data_field(s) for the recorded (valid) stats.
             for stat_i in self.store_solver_stats:
                 assert stat_i in solver_stats, 'The requested {} is not a valid solver stat and cannot be recorded. Please supply one of the following (or none): {}'.format(stat_i, solver_stats)
@@ -305,6 +324,7 @@ class Optimizer:
         Slack variables are added to the cost function and multiplied with the supplied penalty term.
         This formulation makes constraints soft, meaning that a certain violation is tolerated and does not lead to infeasibility.
         Typically, high values for the penalty are suggested to avoid significant violation of the constraints.
+        For the :py:class:`do_mpc.controller.MPC`, the penalty is a parameter of the optimization problem and can be changed after setup with :py:attr:`do_mpc.controller.MPC.weights`.
 
         :param expr_name: Arbitrary name for the given expression. Names are used for key word indexing.
         :type expr_name: string
@@ -358,15 +378,19 @@ class Optimizer:
         # Create bounds:
         self._eps_lb = _eps(0.0)
         self._eps_ub = _eps(np.inf)
+        # Penalty terms of the slack variables (numerical values):
+        self._eps_penalty = _eps(0.0)
 
-        # Set bounds, add slack variable to constraint and add cost.
+        # Set bounds, add slack variable to constraint and set penalty.
         for slack_i in self.slack_vars_list:
             self._eps_ub[slack_i['slack_name']] = slack_i['ub']
             self._nl_cons[slack_i['slack_name']] += self._eps[slack_i['slack_name']]
-            self.slack_cost += sum1(slack_i['penalty']*self._eps[slack_i['slack_name']])
+            self._eps_penalty[slack_i['slack_name']] = slack_i['penalty']
 
-        # Objective function epsilon contribution:
-        self.epsterm_fun = Function('epsterm', [_eps], [self.slack_cost])
+        # Objective function epsilon contribution (the penalty terms are an input of the function):
+        eps_penalty = self.model.sv.sym('eps_penalty', self.n_eps)
+        self.slack_cost = sum1(eps_penalty*_eps.cat)
+        self.epsterm_fun = Function('epsterm', [_eps, eps_penalty], [self.slack_cost])
 
         # Make function from these expressions:
         nl_cons_input += [_eps]
@@ -498,16 +522,66 @@ class Optimizer:
         """
         assert self.flags['setup'] == True, 'optimizer was not setup yet. Please call optimizer.setup().'
 
-        r = self.S(x0=self.opt_x_num, lbx=self.lb_opt_x, ubx=self.ub_opt_x,
-            ubg=self.cons_ub, lbg=self.cons_lb, p=self.opt_p_num)
+        solver_args = self._get_solver_args()
+        if self.max_solve_time is not None:
+            self._iteration_callback.reset(solver_args)
+        r = self.S(**solver_args)
+        solver_stats = self.S.stats()
+        if self.max_solve_time is not None:
+            # Best feasible iterate (or first iterate) if the solver did not converge within the time limit:
+            r, solver_stats['solve_status'] = self._iteration_callback.get_result(r, solver_stats['success'])
+        else:
+            solver_stats['solve_status'] = 'converged' if solver_stats['success'] else 'failed'
+        self._set_solution(r, solver_stats)
+
+    def _get_solver_args(self):
+        """Private method that returns the arguments of the solver call for the current problem
+        (initial guess, bounds and parameters).
+
+        :return: Arguments of the solver.
+        :rtype: dict
+        """
+        solver_args = {'x0': self.opt_x_num.cat, 'lbx': self.lb_opt_x.cat, 'ubx': self.ub_opt_x.cat,
+            'ubg': self.cons_ub, 'lbg': self.cons_lb, 'p': self.opt_p_num.cat}
+        if self._lam_warmstart:
+            # Initial guess for the lagrange multipliers (from the previous solution).
+            solver_args.update({'lam_x0': self.lam_x_num, 'lam_g0': self.lam_g_num})
+        if self._nlp_presolve is not None:
+            solver_args = self._get_presolve_solver_args(solver_args)
+        if self._nlp_perm is not None:
+            # The solver uses the selected and permuted optimization variables (see _permute_nlp):
+            for key in ['x0', 'lbx', 'ubx', 'lam_x0']:
+                if key in solver_args:
+                    solver_args[key] = DM(solver_args[key])[self._nlp_perm]
+        return solver_args
+
+    def _set_solution(self, r, solver_stats):
+        """Private method that stores the result of the solver call (see :py:func:`solve`).
+
+        :param r: Result of the solver call with the keys ``'x'``, ``'g'``, ``'lam_x'`` and ``'lam_g'`` (and optionally ``'lam_p'``).
+        :type r: dict
+
+        :param solver_stats: Statistics of the solver call.
+        :type solver_stats: dict
+        """
+        x, lam_x = DM(r['x']), DM(r['lam_x'])
+        g, lam_g = DM(r['g']), DM(r['lam_g'])
+        if self._nlp_perm is not None:
+            # The solver uses the selected and permuted optimization variables (see _permute_nlp).
+            # Variables that are not passed to the solver keep their previous values:
+            x_solver, lam_x_solver = x, lam_x
+            x, lam_x = DM(self.opt_x_num.cat), DM.zeros(self.n_opt_x)
+            x[self._nlp_perm], lam_x[self._nlp_perm] = x_solver, lam_x_solver
+        if self._nlp_presolve is not None:
+            x, lam_x, g, lam_g = self._get_presolve_solution(x, lam_x, g, lam_g, r.get('lam_p'))
         # Note: .master accesses the underlying vector of the structure.
-        self.opt_x_num.master = r['x']
-        self.opt_x_num_unscaled.master = r['x']*self.opt_x_scaling
-        self.opt_g_num = r['g']
+        self.opt_x_num.master = x
+        self.opt_x_num_unscaled.master = x*self.opt_x_scaling
+        self.opt_g_num = g
         # Values of lagrange multipliers:
-        self.lam_g_num = r['lam_g']
-        self.lam_x_num = r['lam_x']
-        self.solver_stats = self.S.stats()
+        self.lam_g_num = lam_g
+        self.lam_x_num = lam_x
+        self.solver_stats = solver_stats
 
         # Calculate values of auxiliary expressions (defined in model)
         self.opt_aux_num.master = self.opt_aux_expression_fun(
@@ -523,8 +597,12 @@ class Optimizer:
 
         * orthogonal collocation
 
+        * multiple shooting (with the integrators ``rk4``, ``cvodes`` or ``idas``)
+
         * discrete dynamics
 
+        For multiple shooting, the integration function has the same interface as for discrete dynamics (no collocation points).
+
         Discretization parameters can be set with the :py:func:`do_mpc.controller.MPC.set_param` and
         :py:func:`do_mpc.estimator.MHE.set_param` methods.
 
@@ -706,9 +784,142 @@ class Optimizer:
             # Create the integrator function
             ifcn = Function("ifcn", [xk0, ik, uk, zk, tv_pk, pk, wk], [gk, xkf])
 
-            # Return the integration function and the number of collocation points
+        elif self.state_discretization == 'multiple_shooting':
+            ifcn = self._setup_multiple_shooting(rhs, alg)
+            n_total_coll_points = 0
+        else:
+            raise Exception('state_discretization must be either \'collocation\' or \'multiple_shooting\'. You have {}.'.format(self.state_discretization))
+
+        # The integration function is also used to simulate the initial guess (see _simulate_ifcn):
+        self._ifcn = ifcn
+
+        # Return the integration function and the number of collocation points
         return ifcn, n_total_coll_points
 
+    def _simulate_ifcn(self, xk0, uk, tv_pk, pk, wk, zk0):
+        """Private method that simulates the discretization of the model (``ifcn``, see :py:func:`_setup_discretization`) for one time step.
+        Used to create a dynamically consistent initial guess (see ``set_initial_guess``).
+
+        The collocation points and the algebraic states are the solution of the discretization equations, which are solved with a Newton method.
+        The Newton method is initialized with the current state for all collocation points and ``zk0`` for all algebraic states.
+        All values are scaled.
+
+        :param xk0: State at the beginning of the time step.
+        :type xk0: numpy.ndarray
+
+        :param uk: Input of the time step.
+        :type uk: numpy.ndarray
+
+        :param tv_pk: Time-varying parameters of the time step.
+        :type tv_pk: numpy.ndarray
+
+        :param pk: Parameters.
+        :type pk: numpy.ndarray
+
+        :param wk: Process noise.
+        :type wk: numpy.ndarray
+
+        :param zk0: Initial guess of the algebraic states.
+        :type zk0: numpy.ndarray
+
+        :return: Collocation points, algebraic states and state at the end of the time step. ``None`` if the simulation failed.
+        :rtype: tuple
+        """
+        n_ik, n_zk = self._ifcn.size1_in(1), self._ifcn.size1_in(3)
+        if self._ifcn_sim is None:
+            # The discretization equations are the residual of the rootfinder for the collocation points and algebraic states:
+            v = MX.sym('v', n_ik+n_zk)
+            args = [MX.sym(self._ifcn.name_in(i), self._ifcn.sparsity_in(i)) for i in [0, 2, 4, 5, 6]]
+            gk, xkf = self._ifcn(args[0], v[:n_ik], args[1], v[n_ik:], *args[2:])
+            self._ifcn_sim = Function('ifcn_sim', [v]+args, [gk, xkf])
+            if n_ik+n_zk > 0:
+                self._ifcn_sim = rootfinder('ifcn_sim', 'newton', self._ifcn_sim, {'error_on_fail': False})
+
+        xk0, zk0 = DM(xk0), DM(zk0)
+        v0 = vertcat(repmat(xk0, n_ik//xk0.shape[0], 1), repmat(zk0, n_zk//max(zk0.shape[0], 1), 1))
+        v, xkf = self._ifcn_sim(v0, xk0, uk, tv_pk, pk, wk)
+        v, xkf = v.full().flatten(), xkf.full().flatten()
+        if not self._ifcn_sim.stats().get('success', True) or not np.all(np.isfinite(np.concatenate((v, xkf)))):
+            return None
+        return v[:n_ik], v[n_ik:], xkf
+
+    def _setup_multiple_shooting(self, rhs, alg):
+        """Private method that creates the integration function for multiple shooting (``state_discretization='multiple_shooting'``).
+        Called from :py:func:`_setup_discretization`.
+
+        The integration function has the same interface as for discrete dynamics.
+        It returns the algebraic equations at the beginning of the time-step (constraints)
+        and the (scaled) state at the end of the time-step, which is obtained with the selected ``integration_tool``.
+
+        :param rhs: Right-hand side of the ODE with scaled variables.
+        :type rhs: casadi.SX or casadi.MX
+
+        :param alg: Algebraic equations with scaled variables.
+        :type alg: casadi.SX or casadi.MX
+
+        :return: Integration function.
+        :rtype: casadi.Function
+        """
+        _x, _u, _z, _tvp, _p, _w = self.model['x', 'u', 'z', 'tvp', 'p', 'w']
+        ffcn = Function('ffcn', [_x, _u, _z, _tvp, _p, _w], [rhs/self._x_scaling.cat])
+        afcn = Function('afcn', [_x, _u, _z, _tvp, _p, _w], [alg])
+
+        # Symbolic variables of a single time-step (no intermediate points).
+        # CasADi integrators can only be embedded in MX expressions:
+        sym = MX.sym if self.integration_tool in ['cvodes', 'idas'] else self.model.sv.sym
+        xk0 = sym('xk0', self.model.n_x)
+        ik = sym('i', 0)
+        uk = sym('uk', self.model.n_u)
+        zk = sym('zk', self.model.n_z)
+        tv_pk = sym('tv_pk', self.model.n_tvp)
+        pk = sym('pk', self.model.n_p)
+        wk = sym('wk', self.model.n_w)
+
+        if self.integration_tool == 'rk4':
+            if self.model.n_z > 0:
+                raise Exception('integration_tool=\'rk4\' is not available for models with algebraic states. Please use \'idas\'.')
+            invalid_opts = set(self.integration_opts.keys())-{'number_of_finite_elements'}
+            if len(invalid_opts) > 0:
+                raise Exception('Invalid keys {} in integration_opts. For integration_tool=\'rk4\' only \'number_of_finite_elements\' is valid.'.format(invalid_opts))
+            n_fe = self.integration_opts.get('number_of_finite_elements', 1)
+            h = self.t_step/n_fe
+            # Fixed-step Runge-Kutta method of order four:
+            xkf = xk0
+            for i in range(n_fe):
+                k1 = ffcn(xkf, uk, zk, tv_pk, pk, wk)
+                k2 = ffcn(xkf + h/2*k1, uk, zk, tv_pk, pk, wk)
+                k3 = ffcn(xkf + h/2*k2, uk, zk, tv_pk, pk, wk)
+                k4 = ffcn(xkf + h*k3, uk, zk, tv_pk, pk, wk)
+                xkf = xkf + h/6*(k1 + 2*k2 + 2*k3 + k4)
+        elif self.integration_tool in ['cvodes', 'idas']:
+            if self.integration_tool == 'cvodes' and self.model.n_z > 0:
+                raise Exception('integration_tool=\'cvodes\' is not available for models with algebraic states. Please use \'idas\'.')
+            if self.model.sv.dtype == SX:
+                raise Exception('integration_tool=\'{}\' requires MX symbolic variables. Please use symvar_type=\'MX\' for the model.'.format(self.integration_tool))
+            # The integrator is created with MX variables (the parameters of the DAE are u, tvp, p and w):
+            x_dae = MX.sym('x', self.model.n_x)
+            z_dae = MX.sym('z', self.model.n_z)
+            p_dae = MX.sym('p', self.model.n_u + self.model.n_tvp + self.model.n_p + self.model.n_w)
+            u_dae, tvp_dae, p_p_dae, w_dae = vertsplit(p_dae, np.cumsum([0, self.model.n_u, self.model.n_tvp, self.model.n_p, self.model.n_w]).tolist())
+            dae = {
+                'x': x_dae,
+                'z': z_dae,
+                'p': p_dae,
+                'ode': ffcn(x_dae, u_dae, z_dae, tvp_dae, p_p_dae, w_dae),
+                'alg': afcn(x_dae, u_dae, z_dae, tvp_dae, p_p_dae, w_dae),
+            }
+            opts = {'tf': self.t_step}
+            opts.update(self.integration_opts)
+            I = integrator('ifcn_integrator', self.integration_tool, dae, opts)
+            xkf = I(x0=xk0, z0=zk, p=vertcat(uk, tv_pk, pk, wk))['xf']
+        else:
+            raise Exception('integration_tool must be \'rk4\', \'cvodes\' or \'idas\'. You have {}.'.format(self.integration_tool))
+
+        # Algebraic equations at the beginning of the time-step:
+        gk = afcn(xk0, uk, zk, tv_pk, pk, wk)
+
+        return Function('ifcn', [xk0, ik, uk, zk, tv_pk, pk, wk], [gk, xkf])
+
     def _setup_scenario_tree(self):
         """Private method that builds the scenario tree given the possible values of the uncertain parmeters.
         By default all possible combinations of uncertain parameters are evaluated.
@@ -721,16 +932,29 @@ class Optimizer:
         n_p = self.model.n_p
         nk = self.n_horizon
         n_robust = self.n_robust
+        # Scenarios of the uncertain parameters (indices of p_template) considered at each robust stage (all by default).
+        robust_branches = getattr(self, 'robust_branches', None)
+        if robust_branches is None:
+            robust_branches = [list(range(self.n_combinations))]*n_robust
         # Build auxiliary variables that code the structure of the tree
         # Number of branches
-        n_branches = [self.n_combinations if k < n_robust else 1 for k in range(nk)]
+        n_branches = [len(robust_branches[k]) if k < n_robust else 1 for k in range(nk)]
         # Calculate the number of scenarios (nodes at each stage)
-        n_scenarios = [self.n_combinations**min(k, n_robust) for k in range(nk + 1)]
+        n_scenarios = [int(np.prod(n_branches[:k])) for k in range(nk + 1)]
         # Scenaro tree structure
-        child_scenario = -1 * np.ones((nk, n_scenarios[-1], n_branches[0])).astype(int)
+        child_scenario = -1 * np.ones((nk, n_scenarios[-1], max(n_branches))).astype(int)
         parent_scenario = -1 * np.ones((nk + 1, n_scenarios[-1])).astype(int)
         branch_offset = -1 * np.ones((nk, n_scenarios[-1])).astype(int)
+        # Index of the uncertain parameters (p_template) for each branch of the tree
+        p_index = -1 * np.ones((nk, n_scenarios[-1], max(n_branches))).astype(int)
+        # Index of the uncertain parameters that lead to each node (nominal case for the root node)
+        node_p_index = [np.zeros(n_scenarios[k]).astype(int) for k in range(nk + 1)]
         structure_scenario = np.zeros((nk + 1, n_scenarios[-1])).astype(int)
+        # Probability of each node (product of the weights of the branches leading to the node)
+        scenario_weights = getattr(self, '_scenario_weights', None)
+        if scenario_weights is None:
+            scenario_weights = np.ones(self.n_combinations)/self.n_combinations
+        node_weight = [np.ones(n_scenarios[k]) for k in range(nk + 1)]
         # Fill in the auxiliary structures
         for k in range(nk):
             # Scenario counter
@@ -740,23 +964,616 @@ class Optimizer:
                 # For all uncertainty realizations
                 for b in range(n_branches[k]):
                     child_scenario[k][s][b] = scenario_counter
-                    structure_scenario[k][scenario_counter] = s
-                    structure_scenario[k+1][scenario_counter] = s
                     parent_scenario[k + 1][scenario_counter] = s
+                    if k < n_robust:
+                        p_index[k][s][b] = robust_branches[k][b]
+                        branch_weight = scenario_weights[robust_branches[k][b]]/np.sum(scenario_weights[robust_branches[k]])
+                    else:
+                        # After the robust horizon, the parameters of the last branching are kept.
+                        p_index[k][s][b] = node_p_index[k][s]
+                        branch_weight = 1
+                    node_p_index[k + 1][scenario_counter] = p_index[k][s][b]
+                    node_weight[k + 1][scenario_counter] = node_weight[k][s]*branch_weight
                     scenario_counter += 1
                 # Store the range of branches
-                if n_robust == 0:
-                    branch_offset[k][s] = 0
-                elif k < n_robust:
-                    branch_offset[k][s] = 0
-                else:
-                    branch_offset[k][s] = s % n_branches[0]
+                branch_offset[k][s] = p_index[k][s][0]
+        # Ancestors of all nodes at the last stage:
+        structure_scenario[nk] = np.arange(n_scenarios[-1])
+        for k in range(nk - 1, -1, -1):
+            structure_scenario[k] = parent_scenario[k + 1][structure_scenario[k + 1]]
 
         self.scenario_tree = {
             'structure_scenario': structure_scenario,
             'n_branches': n_branches,
             'n_scenarios': n_scenarios,
+            'child_scenario': child_scenario,
             'parent_scenario': parent_scenario,
-            'branch_offset': branch_offset
+            'branch_offset': branch_offset,
+            'node_weight': node_weight,
+            'p_index': p_index,
         }
         return n_branches, n_scenarios, child_scenario, parent_scenario, branch_offset
+
+    def _setup_nlpsol(self, nlp, nlpsol_opts):
+        """Private method to create the solver object (CasADi ``nlpsol`` with plugin ``ipopt``) for the optimization problem.
+
+        If ``compile_nlp`` is active, C code is generated for the NLP functions (objective, constraints and their derivatives),
+        compiled with the local C compiler (``CC`` environment variable, defaults to ``gcc``) into a shared library and
+        the solver is created from the library. The library is named by the hash of the generated code and reused whenever
+        the identical problem is setup again. Libraries are stored in ``solver_cache_dir`` (or in the temporary directory of the system).
+        If no compiler is available or the compilation fails, a warning is shown and the uncompiled solver is returned.
+
+        :param nlp: Dictionary with the optimization variables (``x``), parameters (``p``), objective (``f``) and constraints (``g``).
+        :type nlp: dict
+
+        :param nlpsol_opts: Options for the solver.
+        :type nlpsol_opts: dict
+
+        :return: Solver object.
+        :rtype: casadi.Function
+        """
+        S = nlpsol('S', 'ipopt', nlp, nlpsol_opts)
+
+        if not self.compile_nlp:
+            return S
+
+        compiler = os.environ.get('CC', 'gcc')
+        if shutil.which(compiler) is None:
+            warnings.warn('The C compiler {} was not found. The NLP is not compiled.'.format(compiler))
+            return S
+
+        if self.solver_cache_dir is not None:
+            compile_dir = self.solver_cache_dir
+        else:
+            compile_dir = os.path.join(tempfile.gettempdir(), 'do_mpc')
+        os.makedirs(compile_dir, exist_ok=True)
+
+        # Generate C code for all functions required by the solver (in a temporary directory, as processes may run in parallel):
+        src_dir = tempfile.mkdtemp(dir=compile_dir)
+        code_gen = CodeGenerator('nlp.c')
+        code_gen.add(S.oracle())
+        for fun_name in S.get_function():
+            code_gen.add(S.get_function(fun_name))
+        src_file = code_gen.generate(src_dir + os.sep)
+        with open(src_file, 'r') as f:
+            nlp_hash = hashlib.sha256(f.read().encode()).hexdigest()
+
+        lib_ext = '.dll' if os.name == 'nt' else '.so'
+        lib_file = os.path.join(compile_dir, 'nlp_{}{}'.format(nlp_hash, lib_ext))
+
+        try:
+            if not os.path.isfile(lib_file):
+                tmp_file = os.path.join(src_dir, 'nlp' + lib_ext)
+                subprocess.run([compiler, '-fPIC', '-shared', '-O1', src_file, '-o', tmp_file],
+                    check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                os.replace(tmp_file, lib_file)
+        except (subprocess.CalledProcessError, OSError) as err:
+            warnings.warn('The compilation of the NLP failed ({}). The NLP is not compiled.'.format(err))
+            return S
+        finally:
+            shutil.rmtree(src_dir)
+
+        return nlpsol('S', 'ipopt', lib_file, nlpsol_opts)
+
+    def _permute_nlp(self, nlp):
+        """Private method that returns the optimization problem with the optimization variables selected and permuted with ``_nlp_perm``,
+        i.e. the variable ``i`` of the solver is the variable ``_nlp_perm[i]`` of the original problem.
+        Variables which are not in ``_nlp_perm`` are not passed to the solver (they must not enter the objective and constraints),
+        except for the fixed variables of the presolve, which are appended to the parameters.
+        The constraints are reduced according to the presolve (see :py:func:`_setup_nlp_presolve`).
+        The mapping of initial guess, bounds and solution is done in :py:func:`_get_solver_args` and :py:func:`_set_solution`.
+
+        :param nlp: Dictionary with the optimization variables (``x``), parameters (``p``), objective (``f``) and constraints (``g``).
+        :type nlp: dict
+
+        :return: Optimization problem with permuted optimization variables.
+        :rtype: dict
+        """
+        x = nlp['x'].cat if isinstance(nlp['x'], structure3.CasadiStructured) else nlp['x']
+        p = nlp['p'].cat if isinstance(nlp['p'], structure3.CasadiStructured) else nlp['p']
+        g = nlp['g']
+        x_fixed = []
+        if self._nlp_presolve is not None:
+            x_fixed = self._nlp_presolve['x_fixed']
+            g = g[self._get_presolve_cons_rows().tolist()]
+        x_perm = type(x).sym('x', len(self._nlp_perm))
+        p_fixed = type(x).sym('x_fixed', len(x_fixed))
+        # Position of each original variable in the variables of the solver and the fixed variables (unused variables point to an appended zero):
+        ind = np.full(x.shape[0], len(self._nlp_perm)+len(x_fixed))
+        ind[self._nlp_perm] = np.arange(len(self._nlp_perm))
+        ind[x_fixed] = len(self._nlp_perm)+np.arange(len(x_fixed))
+        # The expressions are substituted (instead of embedding them in a function call) to retain efficient derivatives for MX:
+        f, g = substitute([nlp['f'], g], [x], [vertcat(x_perm, p_fixed, 0)[ind.tolist()]])
+        return {'x': x_perm, 'f': f, 'g': g, 'p': vertcat(p, p_fixed)}
+
+    def _setup_nlp_presolve(self, nlp, x_keep=None, drop_unused=True):
+        """Private method that simplifies the optimization problem before it is passed to the solver.
+        Optimization variables that enter neither the objective nor the constraints are not passed to the solver (if ``drop_unused`` is ``True``).
+        If ``presolve`` is active, additionally:
+
+        * constraints with infinite lower and upper bounds are removed,
+        * constraints that are affine in a single optimization variable with constant coefficients (e.g. a nonlinear constraint from :py:func:`set_nl_cons` on a single state or input) are converted to bounds of this variable,
+        * duplicate constraints (identical expressions) are merged and their bounds are intersected,
+        * fixed optimization variables (identical lower and upper bound) are replaced by parameters of the solver.
+
+        The original problem (:py:attr:`opt_x`, ``cons_lb``, ``cons_ub``) is not altered, i.e. :py:attr:`opt_x_num` and
+        the lagrange multipliers always refer to the original problem. The bounds of the presolved problem are obtained
+        from the current bounds for each solver call (see :py:func:`_get_solver_args`), such that bounds (e.g. of the constraints for
+        ``shrinking_horizon``) can change after setup. Only the bounds of the fixed variables must not change.
+
+        :param nlp: Dictionary with the optimization variables (``x``), parameters (``p``), objective (``f``) and constraints (``g``).
+        :type nlp: dict
+
+        :param x_keep: Indices of the optimization variables whose bounds may change after setup. These are not eliminated if they are fixed.
+        :type x_keep: numpy.ndarray
+
+        :param drop_unused: Remove the optimization variables that enter neither the objective nor the constraints. This changes the iterates of the solver (but not the solution).
+        :type drop_unused: bool
+
+        :return: Optimization problem passed to the solver.
+        :rtype: dict
+        """
+        x = nlp['x'].cat if isinstance(nlp['x'], structure3.CasadiStructured) else nlp['x']
+        p = nlp['p'].cat if isinstance(nlp['p'], structure3.CasadiStructured) else nlp['p']
+        g = nlp['g']
+        is_used = np.array(which_depends(vertcat(nlp['f'], g), x, 1, False))
+        if not drop_unused:
+            is_used[:] = True
+        is_solver_x = is_used.copy()
+        self._nlp_presolve = None
+
+        if self.presolve:
+            lbg, ubg = [np.array(DM(bound)).flatten() for bound in [self.cons_lb, self.cons_ub]]
+            is_fixed = np.zeros(x.shape[0], dtype=bool)
+            is_fixed[self._get_fixed_opt_x()] = True
+            if x_keep is not None:
+                is_fixed[x_keep] = False
+            # Constraints with infinite lower and upper bounds are removed:
+            is_cons = ~((lbg == -np.inf) & (ubg == np.inf))
+
+            # Constraints that are affine in a single (not fixed) optimization variable and independent of the parameters are converted to bounds:
+            row, col = jacobian_sparsity(g, x).get_triplet()
+            n_nz = np.bincount(np.array(row, dtype=int), minlength=g.shape[0])
+            x_row = np.zeros(g.shape[0], dtype=int)
+            x_row[row] = col
+            is_nonlinear = np.array(which_depends(g, x, 2, True))
+            is_param = np.array(which_depends(g, p, 1, True)) if p.shape[0] > 0 else np.zeros(g.shape[0], dtype=bool)
+            bound_row = np.flatnonzero(is_cons & (n_nz == 1) & ~is_nonlinear & ~is_param & ~is_fixed[x_row])
+            # Each converted constraint is a*x+b with constant coefficients:
+            bound_fun = Function('bound_fun', [x, p], [g[bound_row.tolist()]])
+            bound_b = np.array(bound_fun(0, 0)).flatten()
+            bound_a = np.array(bound_fun(1, 0)).flatten()-bound_b
+            bound_row, bound_a, bound_b = bound_row[bound_a != 0], bound_a[bound_a != 0], bound_b[bound_a != 0]
+            is_cons[bound_row] = False
+
+            # Duplicate constraints are merged (index of the constraint of the solver for each constraint, -1 for constraints that are not passed to the solver):
+            cons_keys = self._get_nlp_cons_keys(g)
+            cons = np.full(g.shape[0], -1)
+            cons_ind = {}
+            for i in np.flatnonzero(is_cons):
+                cons[i] = cons_ind.setdefault(cons_keys[i], len(cons_ind))
+
+            # Variables of the converted constraints must be passed to the solver. Fixed variables are parameters of the solver:
+            is_used[x_row[bound_row]] = True
+            is_solver_x = is_used & ~is_fixed
+            self._nlp_presolve = {
+                'x_fixed': np.flatnonzero(is_used & is_fixed),
+                'cons': cons,
+                'bound_row': bound_row,
+                'bound_x': x_row[bound_row],
+                'bound_a': bound_a,
+                'bound_b': bound_b,
+            }
+
+        if self._nlp_presolve is None and self._nlp_perm is None and np.all(is_solver_x):
+            return nlp
+        nlp_perm = np.arange(x.shape[0]) if self._nlp_perm is None else self._nlp_perm
+        self._nlp_perm = nlp_perm[is_solver_x[nlp_perm]]
+        return self._permute_nlp(nlp)
+
+    def _get_fixed_opt_x(self):
+        """Private method that returns the indices of the fixed optimization variables (identical lower and upper bound),
+        which are eliminated by the presolve (see :py:func:`_setup_nlp_presolve`).
+
+        :return: Indices of the fixed optimization variables.
+        :rtype: numpy.ndarray
+        """
+        return np.flatnonzero(DM(self.lb_opt_x.cat).full() == DM(self.ub_opt_x.cat).full())
+
+    def _get_nlp_cons_keys(self, g):
+        """Private method that returns a key for each constraint, such that duplicate constraints have the same key.
+        Common subexpressions are merged first (``casadi.cse``). Identical ``SX`` constraints are then the same expression.
+        ``MX`` constraints are compared blockwise, where outputs of identical function calls with identical arguments are the same.
+
+        :param g: Constraints of the optimization problem.
+        :type g: casadi.SX or casadi.MX
+
+        :return: Key of each constraint.
+        :rtype: list
+        """
+        g = cse(g)
+        if isinstance(g, SX):
+            return [g[i].element_hash() for i in range(g.shape[0])]
+        cons_keys = []
+        blocks = [g.dep(i) for i in range(g.n_dep())] if g.is_op(OP_VERTCAT) else [g]
+        for block in blocks:
+            block_key = hash(block)
+            if block.is_output():
+                call = block.dep(0)
+                block_key = (hash(call.which_function()), block.which_output(), tuple(hash(call.dep(i)) for i in range(call.n_dep())))
+            cons_keys.extend([(block_key, i) for i in range(block.shape[0])])
+        return cons_keys
+
+    def _get_presolve_cons_rows(self):
+        """Private method that returns the index of the first (original) constraint for each constraint of the solver (see :py:func:`_setup_nlp_presolve`).
+
+        :return: Indices of the constraints.
+        :rtype: numpy.ndarray
+        """
+        cons = self._nlp_presolve['cons']
+        rows = np.flatnonzero(cons >= 0)
+        # The constraints of the solver are numbered in the order of their first occurence:
+        return rows[np.unique(cons[rows], return_index=True)[1]]
+
+    def _get_presolve_bounds(self, lbx, ubx, lbg, ubg):
+        """Private method that returns the bounds of the optimization variables tightened with the constraints
+        that are converted to bounds by the presolve (see :py:func:`_setup_nlp_presolve`).
+
+        :return: Lower and upper bounds of the optimization variables and the bounds that result from the converted constraints.
+        :rtype: tuple
+        """
+        pre = self._nlp_presolve
+        a, b = pre['bound_a'], pre['bound_b']
+        # The constraint lb <= a*x+b <= ub is the bound (lb-b)/a <= x <= (ub-b)/a for a > 0 (and reversed for a < 0):
+        lb_cons, ub_cons = (lbg[pre['bound_row']]-b)/a, (ubg[pre['bound_row']]-b)/a
+        lb_cons, ub_cons = np.where(a > 0, lb_cons, ub_cons), np.where(a > 0, ub_cons, lb_cons)
+        lbx, ubx = lbx.copy(), ubx.copy()
+        np.maximum.at(lbx, pre['bound_x'], lb_cons)
+        np.minimum.at(ubx, pre['bound_x'], ub_cons)
+        return lbx, ubx, lb_cons, ub_cons
+
+    def _get_presolve_solver_args(self, solver_args):
+        """Private method that maps the arguments of the solver call (see :py:func:`_get_solver_args`) to the presolved problem.
+        The optimization variables are still those of the original problem (they are selected and permuted afterwards).
+
+        :param solver_args: Arguments of the solver call for the original problem.
+        :type solver_args: dict
+
+        :return: Arguments of the solver call for the presolved problem.
+        :rtype: dict
+        """
+        pre = self._nlp_presolve
+        x_fixed, cons = pre['x_fixed'], pre['cons']
+        lbx, ubx, lbg, ubg = [np.array(DM(solver_args[key])).flatten() for key in ['lbx', 'ubx', 'lbg', 'ubg']]
+        if np.any(lbx[x_fixed] != ubx[x_fixed]):
+            raise Exception('The bounds of optimization variables that were fixed during setup (identical lower and upper bound) were changed. '
+                            'Fixed variables are eliminated by the presolve. Use set_param(presolve=False) to change these bounds after setup.')
+        solver_args['lbx'], solver_args['ubx'] = self._get_presolve_bounds(lbx, ubx, lbg, ubg)[:2]
+        # The fixed variables are parameters of the solver:
+        solver_args['p'] = vertcat(solver_args['p'], lbx[x_fixed])
+
+        # Bounds of merged constraints are intersected:
+        is_cons = cons >= 0
+        n_cons = np.max(cons, initial=-1)+1
+        lbg_solver, ubg_solver = np.full(n_cons, -np.inf), np.full(n_cons, np.inf)
+        np.maximum.at(lbg_solver, cons[is_cons], lbg[is_cons])
+        np.minimum.at(ubg_solver, cons[is_cons], ubg[is_cons])
+        solver_args['lbg'], solver_args['ubg'] = lbg_solver, ubg_solver
+
+        if 'lam_g0' in solver_args:
+            # Multipliers of merged constraints are summed, multipliers of converted constraints are added to those of the variable bounds:
+            lam_x0, lam_g0 = [np.array(DM(solver_args[key])).flatten() for key in ['lam_x0', 'lam_g0']]
+            np.add.at(lam_x0, pre['bound_x'], pre['bound_a']*lam_g0[pre['bound_row']])
+            lam_g0_solver = np.zeros(n_cons)
+            np.add.at(lam_g0_solver, cons[is_cons], lam_g0[is_cons])
+            solver_args['lam_x0'], solver_args['lam_g0'] = lam_x0, lam_g0_solver
+        return solver_args
+
+    def _get_presolve_solution(self, x, lam_x, g, lam_g, lam_p=None):
+        """Private method that maps the solution of the presolved problem to the original problem (see :py:func:`_setup_nlp_presolve`).
+
+        :param x: Optimization variables (of the original problem, see :py:func:`_set_solution`).
+        :type x: casadi.DM
+
+        :param lam_x: Lagrange multipliers of the variable bounds (of the original problem).
+        :type lam_x: casadi.DM
+
+        :param g: Constraints of the solver.
+        :type g: casadi.DM
+
+        :param lam_g: Lagrange multipliers of the constraints of the solver.
+        :type lam_g: casadi.DM
+
+        :param lam_p: Lagrange multipliers of the parameters of the solver (not provided by all solvers).
+        :type lam_p: casadi.DM
+
+        :return: Optimization variables, constraints and their lagrange multipliers of the original problem.
+        :rtype: tuple
+        """
+        pre = self._nlp_presolve
+        x_fixed, cons, bound_row, bound_x, bound_a = pre['x_fixed'], pre['cons'], pre['bound_row'], pre['bound_x'], pre['bound_a']
+        x, lam_x, g, lam_g = [np.array(DM(value)).flatten() for value in [x, lam_x, g, lam_g]]
+        lbx, ubx, lbg, ubg = [np.array(DM(bound)).flatten() for bound in [self.lb_opt_x.cat, self.ub_opt_x.cat, self.cons_lb, self.cons_ub]]
+
+        # The multipliers of the fixed variables are the multipliers of the corresponding parameters:
+        x[x_fixed] = lbx[x_fixed]
+        lam_x[x_fixed] = 0
+        if lam_p is not None:
+            lam_x[x_fixed] = np.nan_to_num(np.array(DM(lam_p)).flatten()[self.opt_p_num.cat.shape[0]:])
+
+        # Merged constraints have the value of the constraint of the solver and the multiplier is assigned to the first one.
+        # Constraints with infinite bounds are not evaluated:
+        is_cons = cons >= 0
+        g_orig, lam_g_orig = np.full(cons.shape[0], np.nan), np.zeros(cons.shape[0])
+        g_orig[is_cons] = g[cons[is_cons]]
+        lam_g_orig[self._get_presolve_cons_rows()] = lam_g
+
+        # The multiplier of a variable bound is assigned to a converted constraint if it is the active bound:
+        g_orig[bound_row] = bound_a*x[bound_x]+pre['bound_b']
+        lbx_solver, ubx_solver, lb_cons, ub_cons = self._get_presolve_bounds(lbx, ubx, lbg, ubg)
+        for i, x_i in enumerate(bound_x):
+            if ((lam_x[x_i] < 0 and lb_cons[i] == lbx_solver[x_i] and lb_cons[i] > lbx[x_i]) or
+                    (lam_x[x_i] > 0 and ub_cons[i] == ubx_solver[x_i] and ub_cons[i] < ubx[x_i])):
+                lam_g_orig[bound_row[i]] = lam_x[x_i]/bound_a[i]
+                lam_x[x_i] = 0
+
+        return DM(x), DM(lam_x), DM(g_orig), DM(lam_g_orig)
+
+    def _setup_iteration_callback(self, nlp):
+        """Private method to create the iteration callback of the solver for the maximum solve time (``max_solve_time``).
+        The callback stores the best feasible iterate and stops the solver once the time is exceeded (see :py:class:`_IterationCallback`).
+
+        :param nlp: Dictionary with the optimization variables (``x``), parameters (``p``), objective (``f``) and constraints (``g``).
+        :type nlp: dict
+
+        :return: Options for the solver.
+        :rtype: dict
+        """
+        # Feasible iterates must satisfy the constraints with the tolerance of IPOPT:
+        tol = self.nlpsol_opts.get('ipopt.constr_viol_tol', 1e-4)
+        # The callback must be referenced as long as the solver exists:
+        self._iteration_callback = _IterationCallback('iteration_callback', nlp['x'].shape[0], nlp['g'].shape[0], self.max_solve_time, tol)
+        return {
+            'ipopt.max_wall_time': float(self.max_solve_time),
+            'iteration_callback': self._iteration_callback,
+        }
+
+    def _get_solver_cache_file(self, fun_list, settings):
+        """Private method that returns the path of the solver cache entry (a directory) for the current problem.
+        The name of the entry is the fingerprint (sha256 hash) of the optimization problem. It is
+        obtained from the serialized model functions, the supplied functions (e.g. objective, constraints)
+        and the supplied settings. Numerical bounds of the optimization variables are not part of the
+        fingerprint, as they do not alter the solver (only the fixed variables, which are eliminated by the presolve).
+
+        :param fun_list: CasADi functions that define the optimization problem (in addition to the model functions).
+        :type fun_list: list
+
+        :param settings: Settings (e.g. from ``set_param``) and numerical values that define the optimization problem.
+        :type settings: dict
+
+        :return: Path of the solver cache entry.
+        :rtype: str
+        """
+        fingerprint = hashlib.sha256()
+        fingerprint.update('{}-{}-{}-{}'.format(_SOLVER_CACHE_VERSION, CasadiMeta.version(), type(self).__name__, self.model.model_type).encode())
+
+        model_fun_list = [self.model._rhs_fun, self.model._alg_fun, self.model._aux_expression_fun, self.model._meas_fun]
+        for fun_i in model_fun_list + fun_list:
+            fingerprint.update(fun_i.serialize().encode())
+
+        for var_type in ['_x', '_u', '_z', '_tvp', '_p', '_w', '_v', '_aux_expression']:
+            fingerprint.update(str(getattr(self.model, var_type).labels()).encode())
+
+        for key in sorted(settings.keys()):
+            value = settings[key]
+            if isinstance(value, structure3.DMStruct):
+                value = value.cat
+            if isinstance(value, DM):
+                value = value.full()
+            if isinstance(value, np.ndarray):
+                value = (value.shape, value.tobytes())
+            fingerprint.update(repr((key, value)).encode())
+
+        file_name = '{}_{}'.format(type(self).__name__, fingerprint.hexdigest())
+
+        return os.path.join(self.solver_cache_dir, file_name)
+
+    def _load_solver_cache(self, fun_list, settings):
+        """Private method to load the solver (and related objects) from the solver cache (if activated with ``solver_cache_dir``).
+        Loaded objects are set as attributes of the class.
+
+        :param fun_list: CasADi functions that define the optimization problem (in addition to the model functions).
+        :type fun_list: list
+
+        :param settings: Settings (e.g. from ``set_param``) and numerical values that define the optimization problem.
+        :type settings: dict
+
+        :return: True if the solver was loaded from the cache.
+        :rtype: bool
+        """
+        self._solver_cache_file = None
+        if self.solver_cache_dir is None or self.max_solve_time is not None:
+            # The iteration callback of the solver (max_solve_time) cannot be stored.
+            return False
+
+        self._solver_cache_file = self._get_solver_cache_file(fun_list, settings)
+        array_file = os.path.join(self._solver_cache_file, 'arrays.npz')
+
+        if not os.path.isfile(array_file):
+            return False
+
+        try:
+            with np.load(array_file, allow_pickle=False) as arrays:
+                solver_cache_info = json.loads(str(arrays['_solver_cache_info']))
+                solver_cache = {key: _decode_solver_cache(info, arrays, self._solver_cache_file) for key, info in solver_cache_info.items()}
+        except Exception:
+            warnings.warn('The solver cache {} could not be loaded. The solver is created again.'.format(self._solver_cache_file))
+            return False
+
+        self.__dict__.update(solver_cache)
+
+        return True
+
+    def _save_solver_cache(self, **kwargs):
+        """Private method to store the solver (and related objects) in the solver cache (if activated with ``solver_cache_dir``).
+        Pass the attributes that should be cached as keyword arguments. These are restored with :py:func:`_load_solver_cache`.
+
+        Each entry of the cache is a directory. CasADi functions (e.g. the solver) are stored with ``Function.save``,
+        numerical values with ``numpy.savez`` (together with the structure of the attributes, see :py:func:`_encode_solver_cache`).
+        The entry is written to a temporary directory first and then renamed.
+        This ensures that processes starting in parallel never read incomplete entries.
+        """
+        if self._solver_cache_file is None:
+            return
+
+        os.makedirs(self.solver_cache_dir, exist_ok=True)
+
+        tmp_dir = '{}.{}.tmp'.format(self._solver_cache_file, os.getpid())
+        os.makedirs(tmp_dir, exist_ok=True)
+        arrays, functions = {}, {}
+        solver_cache_info = {key: _encode_solver_cache(value, key, arrays, functions) for key, value in kwargs.items()}
+        for name, fun in functions.items():
+            fun.save(os.path.join(tmp_dir, '{}.casadi'.format(name)))
+        np.savez(os.path.join(tmp_dir, 'arrays.npz'), _solver_cache_info=np.array(json.dumps(solver_cache_info)), **arrays)
+        try:
+            os.replace(tmp_dir, self._solver_cache_file)
+        except OSError:
+            # The entry was stored by another process in the meantime:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _encode_solver_cache(value, name, arrays, functions):
+    """Private function that prepares an attribute for the solver cache (see :py:func:`Optimizer._save_solver_cache`).
+    CasADi functions are added to ``functions`` and numerical arrays to ``arrays`` (with ``name`` as key).
+    Lists, tuples and dicts are encoded element-wise.
+
+    :return: JSON serializable description of the attribute (restored with :py:func:`_decode_solver_cache`).
+    :rtype: dict
+    """
+    if isinstance(value, Function):
+        functions[name] = value
+        return {'type': 'Function', 'name': name}
+    if isinstance(value, DM):
+        arrays[name] = value.full()
+        return {'type': 'DM', 'name': name}
+    if isinstance(value, np.ndarray):
+        arrays[name] = value
+        return {'type': 'array', 'name': name}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {'type': 'value', 'value': value}
+    if isinstance(value, (list, tuple)):
+        items = [_encode_solver_cache(value_i, '{}.{}'.format(name, i), arrays, functions) for i, value_i in enumerate(value)]
+        return {'type': type(value).__name__, 'items': items}
+    if isinstance(value, dict):
+        items = {key: _encode_solver_cache(value_i, '{}.{}'.format(name, key), arrays, functions) for key, value_i in value.items()}
+        return {'type': 'dict', 'items': items}
+    raise Exception('The attribute {} of type {} cannot be stored in the solver cache.'.format(name, type(value)))
+
+def _decode_solver_cache(info, arrays, cache_dir):
+    """Private function that restores an attribute from the solver cache (see :py:func:`_encode_solver_cache`)."""
+    if info['type'] == 'Function':
+        return Function.load(os.path.join(cache_dir, '{}.casadi'.format(info['name'])))
+    if info['type'] == 'DM':
+        return DM(arrays[info['name']])
+    if info['type'] == 'array':
+        return arrays[info['name']]
+    if info['type'] == 'value':
+        return info['value']
+    if info['type'] == 'dict':
+        return {key: _decode_solver_cache(info_i, arrays, cache_dir) for key, info_i in info['items'].items()}
+    items = [_decode_solver_cache(info_i, arrays, cache_dir) for info_i in info['items']]
+    return tuple(items) if info['type'] == 'tuple' else items
+
+
+class _IterationCallback(Callback):
+    """Iteration callback of the solver for the maximum solve time (``max_solve_time``).
+    Stores the best feasible iterate (lowest objective) and the first iterate of each solver call
+    and stops the solver once the time is exceeded.
+
+    :param name: Name of the callback.
+    :type name: str
+
+    :param n_x: Number of optimization variables.
+    :type n_x: int
+
+    :param n_g: Number of constraints.
+    :type n_g: int
+
+    :param max_solve_time: Maximum wall time in seconds.
+    :type max_solve_time: float
+
+    :param tol: Tolerance for the constraint violation of feasible iterates.
+    :type tol: float
+    """
+    def __init__(self, name, n_x, n_g, max_solve_time, tol):
+        Callback.__init__(self)
+        self.n_x = n_x
+        self.n_g = n_g
+        self.max_solve_time = max_solve_time
+        self.tol = tol
+        self.reset({'lbx': -np.inf, 'ubx': np.inf, 'lbg': -np.inf, 'ubg': np.inf})
+        self.construct(name, {})
+
+    def reset(self, solver_args):
+        """Prepare the next solver call with the bounds of the optimization variables and constraints.
+
+        :param solver_args: Arguments of the solver call.
+        :type solver_args: dict
+        """
+        self.bounds = {key: np.array(DM(solver_args[key])).flatten() for key in ['lbx', 'ubx', 'lbg', 'ubg']}
+        self.best = None
+        self.first = None
+        self.tic = time.time()
+
+    def get_n_in(self): return nlpsol_n_out()
+    def get_n_out(self): return 1
+    def get_name_in(self, i): return nlpsol_out(i)
+    def get_name_out(self, i): return 'ret'
+
+    def get_sparsity_in(self, i):
+        name = nlpsol_out(i)
+        if name == 'f':
+            return Sparsity.scalar()
+        elif name in ['x', 'lam_x']:
+            return Sparsity.dense(self.n_x)
+        elif name in ['g', 'lam_g']:
+            return Sparsity.dense(self.n_g)
+        else:
+            return Sparsity(0, 0)
+
+    def eval(self, arg):
+        iterate = {name: DM(arg[i]) for i, name in enumerate(nlpsol_out()) if name in ['x', 'f', 'g', 'lam_x', 'lam_g']}
+        if self.first is None:
+            self.first = iterate
+        x, g = iterate['x'].full().flatten(), iterate['g'].full().flatten()
+        violation = np.max(np.concatenate((
+            self.bounds['lbx']-x, x-self.bounds['ubx'], self.bounds['lbg']-g, g-self.bounds['ubg'], [0]
+        )))
+        if violation <= self.tol and (self.best is None or float(iterate['f']) < float(self.best['f'])):
+            self.best = iterate
+        # Stop the solver if the time is exceeded:
+        return [1 if time.time()-self.tic > self.max_solve_time else 0]
+
+    def get_result(self, r, success):
+        """Return the result of the solver call and its status.
+        If the solver did not converge, the best feasible iterate (``'suboptimal'``) or the first iterate (``'fallback'``) is returned.
+
+        :param r: Result of the solver call.
+        :type r: dict
+
+        :param success: Success of the solver call.
+        :type success: bool
+
+        :return: Result and status (``'converged'``, ``'suboptimal'`` or ``'fallback'``).
+        :rtype: tuple
+        """
+        if success:
+            return r, 'converged'
+        elif self.best is not None:
+            return self.best, 'suboptimal'
+        elif self.first is not None:
+            return self.first, 'fallback'
+        else:
+            return r, 'fallback'
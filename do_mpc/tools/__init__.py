@@ -22,3 +22,6 @@
 
 from .structure import *
 from .indexedproperty import *
+from .scenario_reduction import *
+from .approximate_mpc import *
+from .warm_start_library import *
@@ -0,0 +1,513 @@
+#
+#   This file is part of do-mpc
+#
+#   do-mpc: An environment for the easy, modular and efficient implementation of
+#        robust nonlinear model predictive control
+#
+#   Copyright (c) 2014-2019 Sergio Lucia, Alexandru Tatulea-Codrean
+#                        TU Dortmund. All rights reserved
+#
+#   do-mpc is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as
+#   published by the Free Software Foundation, either version 3
+#   of the License, or (at your option) any later version.
+#
+#   do-mpc is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with do-mpc.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import itertools
+import multiprocessing
+import concurrent.futures
+import warnings
+import copy
+
+
+class ApproximateMPC:
+    """Approximate (explicit) MPC. The feedback law of a configured :py:class:`do_mpc.controller.MPC` is sampled offline
+    and approximated with a piecewise-linear interpolant or a small neural network (multilayer perceptron).
+    The approximate law is evaluated with numpy only and replaces :py:func:`do_mpc.controller.MPC.make_step` online.
+
+    The inputs (features) of the approximate law are the initial state ``x0`` and optionally
+    the previous input ``u_prev`` (relevant if changes of the input are penalized with :py:func:`do_mpc.controller.MPC.set_rterm`),
+    the time-varying parameters ``tvp`` (constant over the horizon) and the parameters ``p``.
+
+    Use this class as follows:
+
+    1. Sample the MPC with :py:func:`sample` on a grid or Latin hypercube sample.
+
+    2. Fit the approximate law with :py:func:`fit`.
+
+    3. Validate the approximate law in closed loop with :py:func:`validate`.
+
+    4. Store the approximate law with :py:func:`save` and load it with :py:func:`load` for deployment. Call :py:func:`make_step` online.
+
+    **Example:**
+
+    ::
+
+        approx_mpc = do_mpc.tools.ApproximateMPC(mpc)
+        approx_mpc.sample({'x0': (x_lb, x_ub)}, n_samples=2000, method='lhs', n_processes=8)
+        approx_mpc.fit(method='mlp', hidden_layers=(20, 20))
+        res = approx_mpc.validate(simulator, x0, n_steps=50)
+        approx_mpc.save('approx_mpc.npz')
+
+        # Online:
+        approx_mpc = do_mpc.tools.ApproximateMPC.load('approx_mpc.npz')
+        u0 = approx_mpc.make_step(x0)
+
+    :param mpc: Configured MPC (after :py:func:`do_mpc.controller.MPC.setup`). Can be ``None`` for an approximate law that was loaded with :py:func:`load`.
+    :type mpc: do_mpc.controller.MPC
+    """
+    def __init__(self, mpc):
+        self.mpc = mpc
+        self.samples = None
+        self.law = None
+        if mpc is not None:
+            assert mpc.flags['setup'] == True, 'MPC was not setup yet. Please call MPC.setup().'
+            self._u_lb = mpc._u_lb.cat.full().flatten()
+            self._u_ub = mpc._u_ub.cat.full().flatten()
+            self._u_prev = mpc.u0.cat.full().flatten()
+
+    def sample(self, bounds, n_samples=100, method='lhs', n_processes=1, seed=None):
+        """Sample the feedback law of the MPC. For each sample, the MPC is initialized with :py:func:`do_mpc.controller.MPC.set_initial_guess`
+        and :py:func:`do_mpc.controller.MPC.make_step` is called. The samples are stored in :py:attr:`samples`.
+
+        .. note::
+
+            The state of the MPC (solution, lagrange multipliers, history in :py:class:`do_mpc.data.Data`, solver statistics, ...) is restored after sampling.
+            The samples are not added to the warm start library of the MPC.
+
+        :param bounds: Sampled features and their lower and upper bounds. Valid keys are ``'x0'`` (required), ``'u_prev'``, ``'tvp'`` and ``'p'``. Each value is a tuple of lower and upper bound (arrays with one element per state, input, time-varying parameter or parameter). Features that are not sampled are kept at the current value of the MPC.
+        :type bounds: dict
+
+        :param n_samples: Number of samples (``method='lhs'``) or number of grid points per feature (``method='grid'``, int or list with one element per feature).
+        :type n_samples: int or list
+
+        :param method: Sampling method. Either ``'lhs'`` (Latin hypercube sample) or ``'grid'`` (regular grid, required for the piecewise-linear interpolation in :py:func:`fit`).
+        :type method: str
+
+        :param n_processes: Number of processes to solve the MPC for the samples. Parallel sampling requires the ``fork`` start method (Linux and macOS). Defaults to ``1``.
+        :type n_processes: int
+
+        :param seed: Seed for the Latin hypercube sample.
+        :type seed: int
+
+        :raises assertion: MPC must be available.
+        :raises assertion: bounds must be valid.
+
+        :return: None
+        :rtype: None
+        """
+        assert self.mpc is not None, 'Sampling requires the MPC.'
+        assert 'x0' in bounds, 'bounds must contain the key x0.'
+        assert method in ['lhs', 'grid'], 'method must be either lhs or grid, you have {}.'.format(method)
+        n_var = {'x0': self.mpc.model.n_x, 'u_prev': self.mpc.model.n_u, 'tvp': self.mpc.model.n_tvp, 'p': self.mpc.model.n_p}
+        invalid_keys = set(bounds.keys())-set(n_var.keys())
+        assert len(invalid_keys) == 0, 'Invalid keys {} in bounds. Valid keys are {}.'.format(invalid_keys, list(n_var.keys()))
+
+        # The features are always ordered as x0, u_prev, tvp, p:
+        self.features = [(key, n_var[key]) for key in n_var.keys() if key in bounds]
+        self.feature_lb = np.concatenate([np.array(bounds[key][0], dtype=float).reshape(-1) for key, n in self.features])
+        self.feature_ub = np.concatenate([np.array(bounds[key][1], dtype=float).reshape(-1) for key, n in self.features])
+        n_features = self.feature_lb.shape[0]
+        assert self.feature_ub.shape[0] == n_features == sum(n for key, n in self.features), 'Bounds must have one element per state, input, time-varying parameter or parameter.'
+
+        if method == 'grid':
+            n_grid = np.broadcast_to(n_samples, (n_features,)).astype(int)
+            grid = [np.linspace(lb, ub, n) for lb, ub, n in zip(self.feature_lb, self.feature_ub, n_grid)]
+            features = np.array(list(itertools.product(*grid)))
+        else:
+            grid = None
+            rng = np.random.default_rng(seed)
+            # Latin hypercube: One sample in each of the n_samples intervals per feature (in random order).
+            lhs = (np.argsort(rng.random((n_samples, n_features)), axis=0) + rng.random((n_samples, n_features)))/n_samples
+            features = self.feature_lb + lhs*(self.feature_ub-self.feature_lb)
+
+        mpc = self.mpc
+        state = _get_mpc_state(mpc)
+        try:
+            if n_processes > 1:
+                mp_context = multiprocessing.get_context('fork')
+                with concurrent.futures.ProcessPoolExecutor(max_workers=n_processes, mp_context=mp_context,
+                        initializer=_init_sample_worker, initargs=(mpc, self.features)) as pool:
+                    result = list(pool.map(_solve_sample, features, chunksize=max(1, len(features)//(4*n_processes))))
+            else:
+                result = [_solve_sample(features_i, mpc, self.features) for features_i in features]
+        finally:
+            _set_mpc_state(mpc, state)
+
+        self.samples = {
+            'features': features,
+            'u0': np.array([u0 for u0, success in result]),
+            'success': np.array([success for u0, success in result]),
+            'grid': grid,
+        }
+        n_failed = np.sum(~self.samples['success'])
+        if n_failed > 0:
+            warnings.warn('The MPC failed for {} of {} samples.'.format(n_failed, len(features)))
+
+    def fit(self, method='mlp', hidden_layers=(20, 20), n_epochs=5000, learning_rate=1e-2, seed=None):
+        """Fit the approximate feedback law to the samples obtained with :py:func:`sample`.
+
+        Available methods:
+
+        * ``'interpolation'``: Piecewise-linear (multilinear) interpolation on the regular grid. Requires samples with ``method='grid'``. Exact at the grid points.
+
+        * ``'mlp'``: Multilayer perceptron with ``tanh`` activation, trained with the Adam algorithm on the mean squared error of the (normalized) inputs. Samples for which the MPC failed are excluded.
+
+        :param method: Either ``'interpolation'`` or ``'mlp'``.
+        :type method: str
+
+        :param hidden_layers: Number of neurons for each hidden layer (``'mlp'``).
+        :type hidden_layers: tuple
+
+        :param n_epochs: Number of training iterations (full batch, ``'mlp'``).
+        :type n_epochs: int
+
+        :param learning_rate: Learning rate of the Adam algorithm (``'mlp'``).
+        :type learning_rate: float
+
+        :param seed: Seed for the initialization of the weights (``'mlp'``).
+        :type seed: int
+
+        :raises assertion: Samples must be available.
+
+        :return: Mean squared error of the approximate law for the samples (in the units of the inputs).
+        :rtype: numpy.ndarray
+        """
+        assert self.samples is not None, 'No samples available. Please call sample() prior to fit().'
+        assert method in ['interpolation', 'mlp'], 'method must be either interpolation or mlp, you have {}.'.format(method)
+        features, u0 = self.samples['features'], self.samples['u0']
+
+        # Normalization of the inputs (with the bounds of the MPC if finite):
+        u_lb = np.where(np.isfinite(self._u_lb), self._u_lb, np.min(u0, axis=0))
+        u_ub = np.where(np.isfinite(self._u_ub), self._u_ub, np.max(u0, axis=0))
+        u_range = np.where(u_ub > u_lb, u_ub-u_lb, 1)
+
+        if method == 'interpolation':
+            assert self.samples['grid'] is not None, 'interpolation requires samples on a grid (method=grid in sample()).'
+            grid = self.samples['grid']
+            self.law = {
+                'method': 'interpolation',
+                'grid': grid,
+                'values': u0.reshape([len(grid_i) for grid_i in grid]+[-1]),
+            }
+        else:
+            rng = np.random.default_rng(seed)
+            success = self.samples['success']
+            X = self._normalize_features(features[success])
+            Y = (u0[success]-u_lb)/u_range
+            layers = [X.shape[1]]+list(hidden_layers)+[Y.shape[1]]
+            weights = [(rng.standard_normal((n_in, n_out))*np.sqrt(1/n_in), np.zeros(n_out)) for n_in, n_out in zip(layers[:-1], layers[1:])]
+            params = [w for layer in weights for w in layer]
+            m = [np.zeros_like(w) for w in params]
+            v = [np.zeros_like(w) for w in params]
+            beta_1, beta_2 = 0.9, 0.999
+            for epoch in range(1, n_epochs+1):
+                # Forward pass:
+                activations = [X]
+                for i in range(0, len(params), 2):
+                    z = activations[-1]@params[i] + params[i+1]
+                    activations.append(np.tanh(z) if i < len(params)-2 else z)
+                # Backward pass (mean squared error):
+                delta = 2*(activations[-1]-Y)/Y.size
+                grads = [None]*len(params)
+                for i in range(len(params)-2, -1, -2):
+                    grads[i] = activations[i//2].T@delta
+                    grads[i+1] = np.sum(delta, axis=0)
+                    if i > 0:
+                        delta = (delta@params[i].T)*(1-activations[i//2]**2)
+                # Adam update:
+                for j in range(len(params)):
+                    m[j] = beta_1*m[j] + (1-beta_1)*grads[j]
+                    v[j] = beta_2*v[j] + (1-beta_2)*grads[j]**2
+                    params[j] -= learning_rate*(m[j]/(1-beta_1**epoch))/(np.sqrt(v[j]/(1-beta_2**epoch))+1e-8)
+            self.law = {
+                'method': 'mlp',
+                'weights': params,
+                'u_lb': u_lb,
+                'u_range': u_range,
+            }
+
+        u0_approx = np.array([self._evaluate(features_i) for features_i in features])
+        return np.mean((u0_approx-u0)**2, axis=0)
+
+    def make_step(self, x0, tvp=None, p=None):
+        """Evaluate the approximate feedback law for the current state (replaces :py:func:`do_mpc.controller.MPC.make_step`).
+        The previous input (if it is a feature) is stored internally.
+
+        :param x0: Current state of the system.
+        :type x0: numpy.ndarray
+
+        :param tvp: Current time-varying parameters (if they were sampled).
+        :type tvp: numpy.ndarray
+
+        :param p: Current parameters (if they were sampled).
+        :type p: numpy.ndarray
+
+        :return: u0
+        :rtype: numpy.ndarray
+        """
+        assert self.law is not None, 'The approximate law was not fitted yet. Please call fit() prior to make_step().'
+        values = {'x0': x0, 'u_prev': self._u_prev, 'tvp': tvp, 'p': p}
+        for key, n in self.features:
+            assert values[key] is not None, 'The feature {} is required for the approximate law.'.format(key)
+        features = np.concatenate([np.asarray(values[key], dtype=float).reshape(-1) for key, n in self.features])
+        u0 = self._evaluate(features)
+        self._u_prev = u0
+        return u0.reshape(-1, 1)
+
+    def validate(self, simulator, x0, n_steps, compare_mpc=True):
+        """Validate the approximate feedback law in closed loop with the given :py:class:`do_mpc.simulator.Simulator`.
+        The time-varying parameters and parameters (if they are features) are obtained from the ``tvp_fun`` and ``p_fun`` (nominal case) of the MPC.
+
+        .. note::
+
+            The history of the simulator is reset.
+
+        :param simulator: Configured simulator (after :py:func:`do_mpc.simulator.Simulator.setup`).
+        :type simulator: do_mpc.simulator.Simulator
+
+        :param x0: Initial state of the closed-loop simulation.
+        :type x0: numpy.ndarray
+
+        :param n_steps: Number of time steps.
+        :type n_steps: int
+
+        :param compare_mpc: If ``True``, the MPC is solved for all states of the closed-loop trajectory and compared to the approximate law.
+        :type compare_mpc: bool
+
+        :return: Dictionary with the closed-loop states (``'x'``) and inputs (``'u'``), the maximum violation of the state and input bounds of the MPC (``'x_violation'``, ``'u_violation'``) and, if selected, the inputs of the MPC (``'u_mpc'``) and the maximum absolute difference (``'u_error'``).
+        :rtype: dict
+        """
+        assert self.law is not None, 'The approximate law was not fitted yet. Please call fit() prior to validate().'
+        simulator.reset_history()
+        simulator.x0 = x0
+        self._u_prev = np.asarray(self.mpc.u0.cat.full() if self.mpc is not None else self._u_prev, dtype=float).flatten()
+        x = [np.asarray(x0, dtype=float).reshape(-1)]
+        u, u_mpc = [], []
+        for k in range(n_steps):
+            t0 = simulator.t0
+            tvp = p = None
+            if self.mpc is not None:
+                tvp = self.mpc.tvp_fun(t0)['_tvp', 0].full()
+                p = self.mpc.p_fun(t0)['_p', 0].full()
+            u_prev = self._u_prev
+            u0 = self.make_step(x[-1], tvp=tvp, p=p)
+            if compare_mpc and self.mpc is not None:
+                values = {'x0': x[-1], 'u_prev': u_prev, 'tvp': tvp, 'p': p}
+                features = np.concatenate([np.asarray(values[key], dtype=float).reshape(-1) for key, n in self.features])
+                u_mpc.append(self._solve_mpc(features, u_prev))
+            u.append(u0.flatten())
+            x.append(simulator.make_step(u0).flatten())
+        x, u = np.array(x), np.array(u)
+
+        result = {'x': x, 'u': u}
+        if self.mpc is not None:
+            x_lb, x_ub = self.mpc._x_lb.cat.full().flatten(), self.mpc._x_ub.cat.full().flatten()
+            result['x_violation'] = max(np.max(x_lb-x), np.max(x-x_ub), 0)
+            result['u_violation'] = max(np.max(self._u_lb-u), np.max(u-self._u_ub), 0)
+        if compare_mpc and self.mpc is not None:
+            result['u_mpc'] = np.array(u_mpc)
+            result['u_error'] = np.max(np.abs(result['u_mpc']-u), axis=0)
+        return result
+
+    def save(self, filename):
+        """Store the approximate feedback law (without the MPC and the samples) in a ``.npz`` file.
+
+        :param filename: Name of the file.
+        :type filename: str
+        """
+        assert self.law is not None, 'The approximate law was not fitted yet. Please call fit() prior to save().'
+        arrays = {
+            'method': self.law['method'],
+            'features': np.array([key for key, n in self.features]),
+            'n_features': np.array([n for key, n in self.features]),
+            'feature_lb': self.feature_lb,
+            'feature_ub': self.feature_ub,
+            'u_lb': self._u_lb,
+            'u_ub': self._u_ub,
+            'u_prev': self._u_prev,
+        }
+        if self.law['method'] == 'interpolation':
+            arrays.update({'grid_{}'.format(i): grid_i for i, grid_i in enumerate(self.law['grid'])})
+            arrays['values'] = self.law['values']
+        else:
+            arrays.update({'weights_{}'.format(i): w for i, w in enumerate(self.law['weights'])})
+            arrays['law_u_lb'] = self.law['u_lb']
+            arrays['law_u_range'] = self.law['u_range']
+        np.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Load an approximate feedback law stored with :py:func:`save`. The returned instance can only be used
+        for :py:func:`make_step` (and :py:func:`validate` with ``compare_mpc=False``).
+
+        :param filename: Name of the file.
+        :type filename: str
+
+        :return: Approximate MPC.
+        :rtype: ApproximateMPC
+        """
+        data = np.load(filename)
+        approx_mpc = cls(None)
+        approx_mpc.features = [(str(key), int(n)) for key, n in zip(data['features'], data['n_features'])]
+        approx_mpc.feature_lb = data['feature_lb']
+        approx_mpc.feature_ub = data['feature_ub']
+        approx_mpc._u_lb = data['u_lb']
+        approx_mpc._u_ub = data['u_ub']
+        approx_mpc._u_prev = data['u_prev']
+        method = str(data['method'])
+        if method == 'interpolation':
+            n_grid = len([key for key in data.files if key.startswith('grid_')])
+            approx_mpc.law = {
+                'method': method,
+                'grid': [data['grid_{}'.format(i)] for i in range(n_grid)],
+                'values': data['values'],
+            }
+        else:
+            n_weights = len([key for key in data.files if key.startswith('weights_')])
+            approx_mpc.law = {
+                'method': method,
+                'weights': [data['weights_{}'.format(i)] for i in range(n_weights)],
+                'u_lb': data['law_u_lb'],
+                'u_range': data['law_u_range'],
+            }
+        return approx_mpc
+
+    def _normalize_features(self, features):
+        """Private method to scale the features to the interval [-1, 1] (with the sampled bounds)."""
+        feature_range = np.where(self.feature_ub > self.feature_lb, self.feature_ub-self.feature_lb, 1)
+        return 2*(features-self.feature_lb)/feature_range-1
+
+    def _evaluate(self, features):
+        """Private method to evaluate the approximate feedback law for a single feature vector.
+        The result is clipped to the bounds of the inputs.
+        """
+        if self.law['method'] == 'interpolation':
+            grid, values = self.law['grid'], self.law['values']
+            # Multilinear interpolation in the grid cell that contains the point (points outside of the grid are projected onto the grid):
+            ind, weight = [], []
+            for grid_i, f_i in zip(grid, features):
+                if len(grid_i) == 1:
+                    ind.append(0)
+                    weight.append(0.)
+                    continue
+                f_i = np.clip(f_i, grid_i[0], grid_i[-1])
+                i = min(np.searchsorted(grid_i, f_i, side='right')-1, len(grid_i)-2)
+                ind.append(i)
+                weight.append((f_i-grid_i[i])/(grid_i[i+1]-grid_i[i]))
+            u0 = 0
+            for corner in itertools.product([0, 1], repeat=len(ind)):
+                if any(c == 1 and w == 0 for c, w in zip(corner, weight)):
+                    continue
+                corner_weight = np.prod([w if c == 1 else 1-w for c, w in zip(corner, weight)])
+                u0 = u0 + corner_weight*values[tuple(i+c for i, c in zip(ind, corner))]
+        else:
+            params = self.law['weights']
+            a = self._normalize_features(features)
+            for i in range(0, len(params), 2):
+                a = a@params[i] + params[i+1]
+                if i < len(params)-2:
+                    a = np.tanh(a)
+            u0 = self.law['u_lb'] + a*self.law['u_range']
+        return np.clip(u0, self._u_lb, self._u_ub)
+
+    def _solve_mpc(self, features, u_prev):
+        """Private method to solve the MPC for the given features (without changing the state of the MPC)."""
+        mpc = self.mpc
+        state = _get_mpc_state(mpc)
+        try:
+            mpc.u0 = np.asarray(u_prev, dtype=float).reshape(-1, 1)
+            u0, success = _solve_sample(features, mpc, self.features)
+        finally:
+            _set_mpc_state(mpc, state)
+        return u0
+
+
+def _get_mpc_state(mpc):
+    """Store the state of the MPC before solving samples and prepare the MPC for the samples.
+    The samples are recorded in an empty data object and are not added to the warm start library of the MPC.
+
+    :return: State of the MPC (see :py:func:`_set_mpc_state`).
+    :rtype: dict
+    """
+    state = mpc._get_batch_state()
+    state.update({
+        'solver_stats': getattr(mpc, 'solver_stats', None),
+        'set_initial_guess': mpc.flags['set_initial_guess'],
+        'rti_prepared': mpc._rti_prepared,
+        'rti_qp_multipliers': mpc._rti_qp_multipliers,
+        'warm_start_library': mpc.warm_start_library,
+    })
+    mpc.data = mpc._get_empty_data(mpc.data)
+    mpc.warm_start_library = None
+    return state
+
+def _set_mpc_state(mpc, state):
+    """Restore the state of the MPC (solution, lagrange multipliers, history, solver statistics, ...) after solving samples."""
+    mpc._set_batch_state(state)
+    if state['solver_stats'] is None:
+        del mpc.solver_stats
+    else:
+        mpc.solver_stats = state['solver_stats']
+    mpc.flags['set_initial_guess'] = state['set_initial_guess']
+    mpc._rti_prepared = state['rti_prepared']
+    mpc._rti_qp_multipliers = state['rti_qp_multipliers']
+    mpc.warm_start_library = state['warm_start_library']
+
+
+# MPC and features in the worker processes of ApproximateMPC.sample:
+_sample_mpc = None
+_sample_features = None
+
+def _init_sample_worker(mpc, features):
+    """Initialize a worker process for sampling with the MPC (the process is forked, the MPC is not pickled)."""
+    global _sample_mpc, _sample_features
+    _sample_mpc = mpc
+    _sample_features = features
+
+def _solve_sample(features, mpc=None, feature_layout=None):
+    """Solve the MPC for a single sample (in the worker process, if no MPC is passed).
+    The features are split according to the feature layout. The time-varying parameters and parameters
+    (if they are features) are constant over the horizon and for all scenarios.
+
+    :return: Input and success of the solver.
+    :rtype: tuple
+    """
+    if mpc is None:
+        mpc, feature_layout = _sample_mpc, _sample_features
+    t0 = mpc.t0
+    values = {}
+    offset = 0
+    for key, n in feature_layout:
+        values[key] = features[offset:offset+n].reshape(-1, 1)
+        offset += n
+    if 'u_prev' in values:
+        mpc.u0 = values['u_prev']
+    if 'tvp' in values:
+        tvp_template = mpc.get_tvp_template()
+        for k in range(mpc.n_horizon+1):
+            tvp_template['_tvp', k] = values['tvp']
+        mpc.tvp_fun = lambda t_now: tvp_template
+    if 'p' in values:
+        p_template = mpc.get_p_template(mpc.n_combinations)
+        for i in range(mpc.n_combinations):
+            p_template['_p', i] = values['p']
+        mpc.p_fun = lambda t_now: p_template
+    mpc.x0 = values['x0']
+    mpc.set_initial_guess()
+    # Each sample is solved independently (no shift of the previous solution, no multipliers):
+    mpc._n_solve = 0
+    mpc.lam_x_num = np.zeros((mpc.n_opt_x, 1))
+    mpc.lam_g_num = np.zeros((mpc.n_opt_lagr, 1))
+    u0 = mpc.make_step(values['x0'])
+    # The sample does not advance the time:
+    mpc.t0 = t0
+    return u0.flatten(), bool(mpc.solver_stats['success'])
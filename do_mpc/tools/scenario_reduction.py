@@ -0,0 +1,111 @@
+#
+#   This file is part of do-mpc
+#
+#   do-mpc: An environment for the easy, modular and efficient implementation of
+#        robust nonlinear model predictive control
+#
+#   Copyright (c) 2014-2019 Sergio Lucia, Alexandru Tatulea-Codrean
+#                        TU Dortmund. All rights reserved
+#
+#   do-mpc is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as
+#   published by the Free Software Foundation, either version 3
+#   of the License, or (at your option) any later version.
+#
+#   do-mpc is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with do-mpc.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+
+
+def reduce_scenarios(p_scenario, n_reduced, method='k_medoids', max_iter=100):
+    """Select a subset of ``n_reduced`` scenarios from the given scenarios of the uncertain parameters.
+    Used for robust multi-stage MPC to limit the size of the scenario tree (see :py:func:`do_mpc.controller.MPC.set_uncertainty_values`).
+
+    All scenarios are assumed to be equally probable. Each scenario is assigned to the closest selected scenario
+    and the probability weight of a selected scenario is the fraction of scenarios assigned to it.
+    The distance between scenarios is computed after normalizing each parameter to the range of its values.
+    The first scenario (nominal case) is always selected and remains the first scenario.
+
+    Available methods:
+
+    * ``'k_medoids'``: The selected scenarios are the medoids of ``n_reduced`` clusters of the scenarios (the nominal case is kept fixed).
+
+    * ``'extreme_vertices'``: The selected scenarios are the nominal case and the vertices of the parameter box (all parameters at their minimal or maximal value). If there are more vertices than available scenarios, the vertices with the largest distance to the already selected scenarios are chosen first.
+
+    **Example:**
+
+    ::
+
+        p_scenario = np.array(list(itertools.product([1., 0.9, 1.1], [1., 1.05, 0.95])))
+        ind, weights = reduce_scenarios(p_scenario, 4, method='extreme_vertices')
+
+    :param p_scenario: Values of the uncertain parameters with one scenario per row.
+    :type p_scenario: numpy.ndarray
+
+    :param n_reduced: Number of selected scenarios.
+    :type n_reduced: int
+
+    :param method: Method for the selection. Either ``'k_medoids'`` or ``'extreme_vertices'``.
+    :type method: str
+
+    :param max_iter: Maximum number of iterations for ``'k_medoids'``.
+    :type max_iter: int
+
+    :raises assertion: method must be valid.
+
+    :return: Indices of the selected scenarios and their probability weights.
+    :rtype: tuple
+    """
+    assert method in ['k_medoids', 'extreme_vertices'], 'method must be either k_medoids or extreme_vertices, you have {}.'.format(method)
+    assert isinstance(n_reduced, (int, np.integer)) and n_reduced >= 1, 'n_reduced must be a positive integer, you have {}.'.format(n_reduced)
+
+    p_scenario = np.array(p_scenario, dtype=float).reshape(len(p_scenario), -1)
+    n_scenarios = p_scenario.shape[0]
+
+    if n_reduced >= n_scenarios:
+        return np.arange(n_scenarios), np.ones(n_scenarios)/n_scenarios
+
+    # Normalize parameters to their range:
+    p_range = np.max(p_scenario, axis=0) - np.min(p_scenario, axis=0)
+    p_range[p_range == 0] = 1
+    p_norm = (p_scenario - np.min(p_scenario, axis=0))/p_range
+    dist = np.linalg.norm(p_norm.reshape(n_scenarios, 1, -1)-p_norm.reshape(1, n_scenarios, -1), axis=2)
+
+    if method == 'k_medoids':
+        candidates = np.arange(n_scenarios)
+    else:
+        is_vertex = np.all(np.isclose(p_norm, 0) | np.isclose(p_norm, 1), axis=1)
+        candidates = np.flatnonzero(is_vertex)
+
+    # Initial selection: nominal case and then the candidates with the largest distance to the selection.
+    ind = [0]
+    candidates = [i for i in candidates if i != 0]
+    while len(ind) < n_reduced and len(candidates) > 0:
+        i_max = candidates[int(np.argmax(np.min(dist[np.ix_(candidates, ind)], axis=1)))]
+        ind.append(i_max)
+        candidates.remove(i_max)
+    ind = np.array(ind)
+
+    if method == 'k_medoids':
+        for i in range(max_iter):
+            cluster = np.argmin(dist[:, ind], axis=1)
+            ind_new = ind.copy()
+            # The nominal case (first medoid) is not updated:
+            for j in range(1, len(ind)):
+                members = np.flatnonzero(cluster == j)
+                ind_new[j] = members[np.argmin(np.sum(dist[np.ix_(members, members)], axis=1))]
+            if np.all(ind_new == ind):
+                break
+            ind = ind_new
+
+    cluster = np.argmin(dist[:, ind], axis=1)
+    weights = np.bincount(cluster, minlength=len(ind))/n_scenarios
+
+    return ind, weights
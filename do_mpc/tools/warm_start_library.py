@@ -0,0 +1,192 @@
+#
+#   This file is part of do-mpc
+#
+#   do-mpc: An environment for the easy, modular and efficient implementation of
+#        robust nonlinear model predictive control
+#
+#   Copyright (c) 2014-2019 Sergio Lucia, Alexandru Tatulea-Codrean
+#                        TU Dortmund. All rights reserved
+#
+#   do-mpc is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as
+#   published by the Free Software Foundation, either version 3
+#   of the License, or (at your option) any later version.
+#
+#   do-mpc is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with do-mpc.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+
+class WarmStartLibrary:
+    """Library of converged solutions of the :py:class:`do_mpc.controller.MPC` for warm starting the solver.
+    Each entry maps the parameters of the optimization problem (key) to the solution and the lagrange multipliers.
+    For a new key, the solution of the nearest stored key (euclidean distance) is obtained with :py:func:`query`.
+
+    The size of the library is bounded. If the library is full, the least recently used entry (added or returned by :py:func:`query`) is replaced.
+    The library can be stored with :py:func:`save` and loaded with :py:func:`load`, e.g. to warm start the MPC after a restart.
+
+    The library is created by the MPC with the ``warm_start_library_size`` parameter (see :py:func:`do_mpc.controller.MPC.set_param`)
+    and is available as the attribute ``warm_start_library`` of the MPC.
+
+    **Example:**
+
+    ::
+
+        mpc.set_param(warm_start_library_size=200)
+        mpc.setup()
+        ...
+        mpc.warm_start_library.save('warm_start_library.npz')
+
+        # After a restart:
+        mpc.warm_start_library = do_mpc.tools.WarmStartLibrary.load('warm_start_library.npz')
+
+    .. note::
+
+        The nearest neighbour is found with a linear search over all entries. For the bounded size of the library,
+        this is faster than a search tree and it is not affected by the dimension of the key (e.g. the time-varying parameters over the horizon).
+
+    :param size: Maximum number of entries.
+    :type size: int
+    """
+    def __init__(self, size=100):
+        assert isinstance(size, (int, np.integer)) and size >= 1, 'size must be a positive integer, you have {}.'.format(size)
+        self.size = int(size)
+        self.n_entries = 0
+        self.keys = None
+        self.opt_x = None
+        self.lam_x = None
+        self.lam_g = None
+        # Counter of the last use of each entry (least recently used entries are replaced first):
+        self._last_used = np.zeros(self.size, dtype=int)
+        self._n_used = 0
+
+    def __len__(self):
+        return self.n_entries
+
+    def add(self, key, opt_x, lam_x, lam_g):
+        """Add a solution to the library. An entry with the identical key is replaced.
+        If the library is full, the least recently used entry is replaced.
+
+        :param key: Parameters of the optimization problem.
+        :type key: numpy.ndarray
+
+        :param opt_x: Solution (optimization variables).
+        :type opt_x: numpy.ndarray
+
+        :param lam_x: Lagrange multipliers of the bounds of the optimization variables.
+        :type lam_x: numpy.ndarray
+
+        :param lam_g: Lagrange multipliers of the constraints.
+        :type lam_g: numpy.ndarray
+
+        :raises assertion: Dimensions must match the stored entries.
+
+        :return: None
+        :rtype: None
+        """
+        entry = [np.array(value, dtype=float).flatten() for value in [key, opt_x, lam_x, lam_g]]
+        if self.keys is None:
+            self.keys, self.opt_x, self.lam_x, self.lam_g = [np.zeros((self.size, value.shape[0])) for value in entry]
+        assert all(value.shape[0] == array.shape[1] for value, array in zip(entry, self._arrays())), 'The dimensions of the entry do not match the library.'
+
+        ind, dist = self._nearest(entry[0])
+        if dist > 0:
+            if self.n_entries < self.size:
+                ind = self.n_entries
+                self.n_entries += 1
+            else:
+                ind = np.argmin(self._last_used)
+        for value, array in zip(entry, self._arrays()):
+            array[ind] = value
+        self._use(ind)
+
+    def query(self, key):
+        """Return the stored solution of the nearest key.
+
+        :param key: Parameters of the optimization problem.
+        :type key: numpy.ndarray
+
+        :return: Distance to the nearest key and its solution, lagrange multipliers of the bounds and of the constraints. ``(numpy.inf, None, None, None)`` if the library is empty.
+        :rtype: tuple
+        """
+        if self.n_entries == 0:
+            return np.inf, None, None, None
+        key = np.array(key, dtype=float).flatten()
+        assert key.shape[0] == self.keys.shape[1], 'The dimension of the key does not match the library.'
+        ind, dist = self._nearest(key)
+        self._use(ind)
+        return dist, self.opt_x[ind].copy(), self.lam_x[ind].copy(), self.lam_g[ind].copy()
+
+    def is_compatible(self, n_key, n_opt_x, n_lam_g):
+        """Check if the dimensions of the library match an optimization problem. An empty library is always compatible.
+
+        :param n_key: Number of parameters (dimension of the key).
+        :type n_key: int
+
+        :param n_opt_x: Number of optimization variables.
+        :type n_opt_x: int
+
+        :param n_lam_g: Number of constraints.
+        :type n_lam_g: int
+
+        :return: True if the library can be used for the problem.
+        :rtype: bool
+        """
+        if self.keys is None:
+            return True
+        return (self.keys.shape[1], self.opt_x.shape[1], self.lam_g.shape[1]) == (n_key, n_opt_x, n_lam_g)
+
+    def save(self, filename):
+        """Store the library in a ``.npz`` file.
+
+        :param filename: Name of the file.
+        :type filename: str
+        """
+        arrays = {
+            'size': self.size,
+            'n_entries': self.n_entries,
+            'last_used': self._last_used,
+            'n_used': self._n_used,
+        }
+        if self.keys is not None:
+            arrays.update({'keys': self.keys, 'opt_x': self.opt_x, 'lam_x': self.lam_x, 'lam_g': self.lam_g})
+        np.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Load a library stored with :py:func:`save`.
+
+        :param filename: Name of the file.
+        :type filename: str
+
+        :return: Warm start library.
+        :rtype: WarmStartLibrary
+        """
+        data = np.load(filename)
+        library = cls(int(data['size']))
+        library.n_entries = int(data['n_entries'])
+        library._last_used = data['last_used']
+        library._n_used = int(data['n_used'])
+        if 'keys' in data.files:
+            library.keys, library.opt_x, library.lam_x, library.lam_g = [data[key] for key in ['keys', 'opt_x', 'lam_x', 'lam_g']]
+        return library
+
+    def _arrays(self):
+        return [self.keys, self.opt_x, self.lam_x, self.lam_g]
+
+    def _nearest(self, key):
+        if self.n_entries == 0:
+            return None, np.inf
+        dist = np.sqrt(np.sum((self.keys[:self.n_entries]-key)**2, axis=1))
+        ind = int(np.argmin(dist))
+        return ind, dist[ind]
+
+    def _use(self, ind):
+        self._n_used += 1
+        self._last_used[ind] = self._n_used
@@ -0,0 +1,145 @@
+#
+#   This file is part of do-mpc
+#
+#   do-mpc: An environment for the easy, modular and efficient implementation of
+#        robust nonlinear model predictive control
+#
+#   Copyright (c) 2014-2019 Sergio Lucia, Alexandru Tatulea-Codrean
+#                        TU Dortmund. All rights reserved
+#
+#   do-mpc is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as
+#   published by the Free Software Foundation, either version 3
+#   of the License, or (at your option) any later version.
+#
+#   do-mpc is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with do-mpc.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for the construction (``nlp_construction``) and parallel evaluation (``map_parallelization``)
+of the MPC optimization problem.
+
+For the CSTR and the industrial polymerization example, the MPC (as configured in the respective template)
+is setup for different horizons and robust horizons (number of scenarios) and solved for a few time steps.
+We report the setup time, the time spent in the evaluation of the NLP functions (objective, constraints and derivatives)
+and the total time of :py:func:`do_mpc.controller.MPC.make_step`, each averaged over the time steps.
+
+Run from this directory with:
+
+::
+
+    python map_parallelization.py
+
+"""
+
+import numpy as np
+import sys
+import os
+import importlib
+import time
+sys.path.append('../../')
+import do_mpc
+
+
+""" User settings: """
+examples = ['CSTR', 'industrial_poly']
+n_horizon_list = [10, 20, 40]
+n_robust_list = [0, 1]
+configurations = [
+    {'nlp_construction': 'loop', 'map_parallelization': 'serial'},
+    {'nlp_construction': 'map', 'map_parallelization': 'serial'},
+    {'nlp_construction': 'map', 'map_parallelization': 'thread'},
+    {'nlp_construction': 'map', 'map_parallelization': 'openmp'},
+]
+n_steps = 5
+
+# Initial states (as in the main.py of the examples):
+x0_CSTR = {'C_a': 0.8, 'C_b': 0.5, 'T_R': 134.14, 'T_K': 130.0}
+x0_poly = {'m_W': 10000.0, 'm_A': 853.0, 'm_P': 26.5, 'T_R': 90.0 + 273.15, 'T_S': 90.0 + 273.15,
+    'Tout_M': 90.0 + 273.15, 'T_EK': 35.0 + 273.15, 'Tout_AWT': 35.0 + 273.15, 'accum_monom': 300.0}
+x0_poly['T_adiab'] = x0_poly['m_A']*950.0/((x0_poly['m_W'] + x0_poly['m_A'] + x0_poly['m_P']) * 5.0) + x0_poly['T_R']
+initial_states = {'CSTR': x0_CSTR, 'industrial_poly': x0_poly}
+
+nlp_stats = ['t_wall_nlp_f', 't_wall_nlp_g', 't_wall_nlp_grad_f', 't_wall_nlp_jac_g', 't_wall_nlp_hess_l']
+
+
+class BenchmarkMPC(do_mpc.controller.MPC):
+    """MPC class where the parameters configured in the templates are overwritten with the benchmark settings."""
+    benchmark_param = {}
+
+    def set_param(self, **kwargs):
+        kwargs.update(self.benchmark_param)
+        super().set_param(**kwargs)
+
+
+def load_templates(example):
+    """Import the template functions of an example."""
+    example_dir = os.path.join('..', example)
+    sys.path.insert(0, example_dir)
+    templates = []
+    for name in ['template_model', 'template_mpc', 'template_simulator']:
+        # Modules with the same name exist in all examples:
+        sys.modules.pop(name, None)
+        templates.append(getattr(importlib.import_module(name), name))
+    sys.path.remove(example_dir)
+
+    return templates
+
+
+def benchmark(template_model, template_mpc, template_simulator, x0_dict, benchmark_param):
+    """Setup the MPC with the given parameters and run the closed loop for n_steps."""
+    model = template_model()
+
+    BenchmarkMPC.benchmark_param = dict(benchmark_param,
+        store_solver_stats=nlp_stats,
+        nlpsol_opts={'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0},
+    )
+    do_mpc.controller.MPC = BenchmarkMPC
+    try:
+        tic = time.time()
+        mpc = template_mpc(model)
+        t_setup = time.time()-tic
+    finally:
+        do_mpc.controller.MPC = BenchmarkMPC.__bases__[0]
+
+    simulator = template_simulator(model)
+
+    x0 = simulator.x0
+    for name, value in x0_dict.items():
+        x0[name] = value
+    mpc.x0 = x0
+    simulator.x0 = x0
+    mpc.set_initial_guess()
+
+    t_step = []
+    for k in range(n_steps):
+        tic = time.time()
+        u0 = mpc.make_step(x0)
+        t_step.append(time.time()-tic)
+        x0 = simulator.make_step(u0)
+
+    t_nlp = np.sum([mpc.data[stat_i] for stat_i in nlp_stats], axis=0).mean()
+    t_solver = np.mean(t_step)
+    n_scenarios = mpc.n_combinations**mpc.n_robust
+
+    return t_setup, t_nlp, t_solver, n_scenarios
+
+
+if __name__ == '__main__':
+    print('{:<16}{:>10}{:>12}{:>14}{:>14}{:>12}{:>12}{:>12}'.format(
+        'example', 'n_horizon', 'n_scenarios', 'construction', 'parallel', 't_setup', 't_nlp', 't_step'))
+    for example in examples:
+        templates = load_templates(example)
+        for n_horizon in n_horizon_list:
+            for n_robust in n_robust_list:
+                for config in configurations:
+                    benchmark_param = dict(config, n_horizon=n_horizon, n_robust=n_robust)
+                    t_setup, t_nlp, t_solver, n_scenarios = benchmark(*templates, initial_states[example], benchmark_param)
+                    print('{:<16}{:>10}{:>12}{:>14}{:>14}{:>12.3f}{:>12.4f}{:>12.4f}'.format(
+                        example, n_horizon, n_scenarios, config['nlp_construction'], config['map_parallelization'],
+                        t_setup, t_nlp, t_solver))
@@ -0,0 +1,104 @@
+#
+#   This file is part of do-mpc
+#
+#   do-mpc: An environment for the easy, modular and efficient implementation of
+#        robust nonlinear model predictive control
+#
+#   Copyright (c) 2014-2019 Sergio Lucia, Alexandru Tatulea-Codrean
+#                        TU Dortmund. All rights reserved
+#
+#   do-mpc is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as
+#   published by the Free Software Foundation, either version 3
+#   of the License, or (at your option) any later version.
+#
+#   do-mpc is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with do-mpc.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for the order of the optimization variables passed to the solver (``nlp_ordering``).
+
+For the CSTR and the industrial polymerization example, the MPC (as configured in the respective template)
+is setup for different horizons with the variables ordered by type (default) and stage-wise.
+The closed loop is run for a few time steps and we report the number of IPOPT iterations and
+the time of ``make_step`` without the NLP function evaluations (mostly the factorization of the KKT matrix in IPOPT), both averaged over the time steps.
+
+Run from this directory with:
+
+::
+
+    python nlp_ordering.py
+
+"""
+
+import numpy as np
+import sys
+import time
+sys.path.append('../../')
+import do_mpc
+from map_parallelization import BenchmarkMPC, load_templates, initial_states
+
+
+""" User settings: """
+examples = ['CSTR', 'industrial_poly']
+n_horizon_list = [20, 40, 80, 160]
+n_robust_list = [0, 1]
+nlp_ordering_list = ['type', 'stage']
+n_steps = 5
+
+nlp_stats = ['t_wall_nlp_f', 't_wall_nlp_g', 't_wall_nlp_grad_f', 't_wall_nlp_jac_g', 't_wall_nlp_hess_l']
+
+
+def benchmark(template_model, template_mpc, template_simulator, x0_dict, benchmark_param):
+    """Setup the MPC with the given parameters and run the closed loop for n_steps."""
+    model = template_model()
+
+    BenchmarkMPC.benchmark_param = dict(benchmark_param,
+        nlpsol_opts={'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0},
+    )
+    do_mpc.controller.MPC = BenchmarkMPC
+    try:
+        mpc = template_mpc(model)
+    finally:
+        do_mpc.controller.MPC = BenchmarkMPC.__bases__[0]
+
+    simulator = template_simulator(model)
+
+    x0 = simulator.x0
+    for name, value in x0_dict.items():
+        x0[name] = value
+    mpc.x0 = x0
+    simulator.x0 = x0
+    mpc.set_initial_guess()
+
+    iter_count = []
+    t_lin = []
+    for k in range(n_steps):
+        tic = time.time()
+        u0 = mpc.make_step(x0)
+        t_step = time.time()-tic
+        stats = mpc.solver_stats
+        iter_count.append(stats['iter_count'])
+        t_lin.append(t_step-sum(stats[stat_i] for stat_i in nlp_stats))
+        x0 = simulator.make_step(u0)
+
+    return mpc.n_opt_x, np.mean(iter_count), np.mean(t_lin)
+
+
+if __name__ == '__main__':
+    print('{:<16}{:>10}{:>10}{:>10}{:>10}{:>10}{:>12}'.format(
+        'example', 'n_horizon', 'n_robust', 'ordering', 'n_opt_x', 'iter', 't_lin'))
+    for example in examples:
+        templates = load_templates(example)
+        for n_horizon in n_horizon_list:
+            for n_robust in n_robust_list:
+                for nlp_ordering in nlp_ordering_list:
+                    benchmark_param = dict(n_horizon=n_horizon, n_robust=n_robust, nlp_ordering=nlp_ordering)
+                    n_opt_x, iter_count, t_lin = benchmark(*templates, initial_states[example], benchmark_param)
+                    print('{:<16}{:>10}{:>10}{:>10}{:>10}{:>10.1f}{:>12.4f}'.format(
+                        example, n_horizon, n_robust, nlp_ordering, n_opt_x, iter_count, t_lin))
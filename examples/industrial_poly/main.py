@@ -74,8 +74,8 @@ x0['T_adiab'] = x0['m_A']*delH_R_real/((x0['m_W'] + x0['m_A'] + x0['m_P']) * c_p
 # Finally, the controller gets the same initial state.
 mpc.x0 = x0
 
-# Which is used to set the initial guess:
-mpc.set_initial_guess()
+# Which is used to set the initial guess (dynamically consistent trajectory obtained by simulation):
+mpc.set_initial_guess(method='simulation')
 
 # Initialize graphic:
 graphics = do_mpc.graphics.Graphics(mpc.data)
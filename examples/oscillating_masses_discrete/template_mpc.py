@@ -29,11 +29,12 @@ sys.path.append('../../')
 import do_mpc
 
 
-def template_mpc(model):
+def template_mpc(model, **setup_mpc_update):
     """
     --------------------------------------------------------------------------
     template_mpc: tuning parameters
     --------------------------------------------------------------------------
+    Additional keyword arguments are passed to MPC.set_param (e.g. detect_qp=True).
     """
     mpc = do_mpc.controller.MPC(model)
 
@@ -43,6 +44,7 @@ def template_mpc(model):
         't_step': 0.5,
         'store_full_solution':True,
     }
+    setup_mpc.update(setup_mpc_update)
 
     mpc.set_param(**setup_mpc)
 
@@ -29,11 +29,12 @@ sys.path.append('../../')
 import do_mpc
 
 
-def template_model(symvar_type='SX'):
+def template_model(symvar_type='SX', eliminate_alg=False):
     """
     --------------------------------------------------------------------------
     template_model: Variables / RHS / AUX
     --------------------------------------------------------------------------
+    With eliminate_alg=True, the explicit algebraic states are eliminated in Model.setup.
     """
     model_type = 'discrete' # either 'discrete' or 'continuous'
     model = do_mpc.model.Model(model_type, symvar_type)
@@ -68,6 +69,6 @@ def template_model(symvar_type='SX'):
 
     model.set_alg('x_next', x_next-A@_x-B@_u)
 
-    model.setup()
+    model.setup(eliminate_alg=eliminate_alg)
 
     return model
@@ -0,0 +1,591 @@
+#
+#   This file is part of do-mpc
+#
+#   do-mpc: An environment for the easy, modular and efficient implementation of
+#        robust nonlinear model predictive control
+#
+#   Copyright (c) 2014-2019 Sergio Lucia, Alexandru Tatulea-Codrean
+#                        TU Dortmund. All rights reserved
+#
+#   do-mpc is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as
+#   published by the Free Software Foundation, either version 3
+#   of the License, or (at your option) any later version.
+#
+#   do-mpc is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with do-mpc.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from casadi import *
+from casadi.tools import *
+import asyncio
+import itertools
+import os
+import tempfile
+import sys
+import unittest
+
+sys.path.append('../')
+import do_mpc
+sys.path.pop(-1)
+
+sys.path.append('../examples/CSTR/')
+from template_model import template_model
+from template_simulator import template_simulator
+sys.path.pop(-1)
+
+
+def get_mpc(model, **params):
+    """Configure the MPC of the CSTR example (see examples/CSTR/template_mpc.py) with additional parameters."""
+    mpc = do_mpc.controller.MPC(model)
+
+    # Optional tuning (weight of the objective as parameter, see MPC.set_weight_param) and additional bounds:
+    objective_weight = params.pop('objective_weight', None)
+    rterm = params.pop('rterm', {'F': 0.1, 'Q_dot': 1e-3})
+    penalty_term_cons = params.pop('penalty_term_cons', 1e2)
+    bounds = params.pop('bounds', {})
+
+    setup_mpc = {
+        'n_horizon': 20,
+        'n_robust': 1,
+        'open_loop': 0,
+        't_step': 0.005,
+        'state_discretization': 'collocation',
+        'collocation_type': 'radau',
+        'collocation_deg': 2,
+        'collocation_ni': 1,
+        'store_full_solution': True,
+        'nlpsol_opts': {'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0},
+    }
+    setup_mpc.update(params)
+    mpc.set_param(**setup_mpc)
+
+    mpc.scaling['_x', 'T_R'] = 100
+    mpc.scaling['_x', 'T_K'] = 100
+    mpc.scaling['_u', 'Q_dot'] = 2000
+    mpc.scaling['_u', 'F'] = 100
+
+    _x = model.x
+    mterm = (_x['C_b'] - 0.6)**2
+    lterm = (_x['C_b'] - 0.6)**2
+    if objective_weight is not None:
+        Q = mpc.set_weight_param('Q', value=objective_weight)
+        mterm = Q*mterm
+        lterm = Q*lterm
+    mpc.set_objective(mterm=mterm, lterm=lterm)
+    mpc.set_rterm(**rterm)
+
+    mpc.bounds['lower', '_x', 'C_a'] = 0.1
+    mpc.bounds['lower', '_x', 'C_b'] = 0.1
+    mpc.bounds['lower', '_x', 'T_R'] = 50
+    mpc.bounds['lower', '_x', 'T_K'] = 50
+    mpc.bounds['upper', '_x', 'C_a'] = 2
+    mpc.bounds['upper', '_x', 'C_b'] = 2
+    mpc.bounds['upper', '_x', 'T_K'] = 140
+    mpc.bounds['lower', '_u', 'F'] = 5
+    mpc.bounds['lower', '_u', 'Q_dot'] = -8500
+    mpc.bounds['upper', '_u', 'F'] = 100
+    mpc.bounds['upper', '_u', 'Q_dot'] = 0.0
+    for key, val in bounds.items():
+        mpc.bounds[key] = val
+
+    mpc.set_nl_cons('T_R', _x['T_R'], ub=140, soft_constraint=True, penalty_term_cons=penalty_term_cons)
+
+    alpha_var = np.array([1., 1.05, 0.95])
+    beta_var = np.array([1., 1.1, 0.9])
+    mpc.set_uncertainty_values(alpha = alpha_var, beta = beta_var)
+
+    mpc.setup()
+
+    return mpc
+
+
+def run_steps(mpc, n_steps=3):
+    """Run the closed loop with the CSTR simulator and return the control inputs (one column per step)."""
+    model = mpc.model
+    simulator = template_simulator(model)
+    x0 = np.array([0.8, 0.5, 134.14, 130.0]).reshape(-1,1)
+    mpc.x0 = x0
+    simulator.x0 = x0
+    mpc.set_initial_guess()
+
+    u = []
+    for k in range(n_steps):
+        u0 = mpc.make_step(x0)
+        u.append(u0)
+        x0 = simulator.make_step(u0)
+    return np.hstack(u)
+
+
+class TestCSTROptions(unittest.TestCase):
+
+    def test_warm_start_shift(self):
+        # The shifted solution is the initial guess of the next solver call. For the predicted state, the shifted solution
+        # is close to the optimum and the solver needs fewer iterations than with the previous solution as initial guess:
+        iter_count = {}
+        for warm_start in ['shift', 'previous']:
+            mpc = get_mpc(template_model('SX'), n_robust=0, warm_start=warm_start)
+            run_steps(mpc, n_steps=1)
+            self.assertEqual(mpc.solver_stats['warm_start'], 'initial')
+            mpc.make_step(mpc.opt_x_num_unscaled['_x', 1, 0, -1].full())
+            self.assertTrue(mpc.solver_stats['success'])
+            iter_count[warm_start] = mpc.solver_stats['iter_count']
+        self.assertEqual(mpc.solver_stats['warm_start'], 'previous')
+        self.assertLess(iter_count['shift'], iter_count['previous'])
+
+        # Closed loop (robust) with the shifted and the previous solution as initial guess (solved with tight tolerance):
+        nlpsol_opts = {'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0, 'ipopt.tol': 1e-10}
+        mpc_shift = get_mpc(template_model('SX'), warm_start='shift', nlpsol_opts=nlpsol_opts)
+        mpc = get_mpc(template_model('SX'), nlpsol_opts=nlpsol_opts)
+        u_shift = run_steps(mpc_shift)
+        u = run_steps(mpc)
+        self.assertEqual(mpc_shift.solver_stats['warm_start'], 'shifted')
+        self.assertTrue(mpc_shift.solver_stats['success'])
+        scaling = np.array([[100], [2000]])
+        self.assertTrue(np.allclose(u_shift/scaling, u/scaling, atol=1e-5))
+
+    def test_solver_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # The first setup creates the solver and stores it in the cache (presolve and the shifted warm start store
+            # additional arrays, dicts and lists of arrays):
+            mpc = get_mpc(template_model('SX'), n_robust=0, presolve=True, warm_start='shift', solver_cache_dir=cache_dir)
+            cache_files = os.listdir(cache_dir)
+            self.assertEqual(len(cache_files), 1)
+            mtime = os.stat(cache_dir).st_mtime_ns
+            # The functions are stored with Function.save and the arrays with numpy.savez:
+            self.assertEqual(sorted(os.listdir(os.path.join(cache_dir, cache_files[0]))), ['S.casadi', 'arrays.npz', 'opt_aux_expression_fun.casadi'])
+
+            # The second setup loads the solver (the cache entry is not written again):
+            mpc_cached = get_mpc(template_model('SX'), n_robust=0, presolve=True, warm_start='shift', solver_cache_dir=cache_dir)
+            self.assertEqual(os.listdir(cache_dir), cache_files)
+            self.assertEqual(os.stat(cache_dir).st_mtime_ns, mtime)
+            self.assertTrue(np.allclose(run_steps(mpc), run_steps(mpc_cached)))
+
+            # A different configuration is a new entry of the cache:
+            get_mpc(template_model('SX'), n_robust=0, presolve=True, warm_start='shift', n_horizon=10, solver_cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_compile_nlp(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            mpc_compiled = get_mpc(template_model('SX'), n_robust=0, n_horizon=3, compile_nlp=True, solver_cache_dir=cache_dir)
+            self.assertEqual(len([f for f in os.listdir(cache_dir) if f.startswith('nlp_')]), 1)
+            mpc = get_mpc(template_model('SX'), n_robust=0, n_horizon=3)
+            self.assertTrue(np.allclose(run_steps(mpc_compiled), run_steps(mpc)))
+
+    def test_make_step_batch(self):
+        X0 = np.array([[0.8, 0.5, 134.14, 130.0], [0.9, 0.4, 130.0, 128.0], [0.7, 0.6, 136.0, 131.0]])
+
+        # Reference: Each plant is controlled with its own MPC.
+        U_ref = []
+        for x0 in X0:
+            mpc = get_mpc(template_model('SX'), n_robust=0)
+            simulator = template_simulator(mpc.model)
+            x0 = x0.reshape(-1,1)
+            mpc.x0 = x0
+            simulator.x0 = x0
+            mpc.set_initial_guess()
+            u = []
+            for k in range(2):
+                u0 = mpc.make_step(x0)
+                u.append(u0)
+                x0 = simulator.make_step(u0)
+            U_ref.append(np.hstack(u))
+
+        # Sequential solve and solve with a process pool:
+        for batch_n_processes in [1, 2]:
+            mpc = get_mpc(template_model('SX'), n_robust=0, batch_n_processes=batch_n_processes)
+            simulators = [template_simulator(mpc.model) for x0 in X0]
+            for simulator, x0 in zip(simulators, X0):
+                simulator.x0 = x0
+            X0_k = X0
+            for k in range(2):
+                U0 = mpc.make_step_batch(X0_k)
+                X0_k = np.hstack([simulator.make_step(U0[i].reshape(-1,1)) for i, simulator in enumerate(simulators)]).T
+            for i in range(X0.shape[0]):
+                self.assertTrue(np.allclose(mpc.batch_data[i]['_u'].T, U_ref[i]))
+            # The state of the MPC is not changed:
+            self.assertEqual(mpc.data['_u'].shape[0], 0)
+            mpc.close()
+
+    def test_max_solve_time(self):
+        mpc = get_mpc(template_model('SX'), n_robust=0)
+        u = run_steps(mpc)
+        self.assertEqual(mpc.solver_stats['solve_status'], 'converged')
+
+        # The time limit is not reached:
+        mpc_limit = get_mpc(template_model('SX'), n_robust=0, max_solve_time=100)
+        self.assertTrue(np.allclose(run_steps(mpc_limit), u))
+        self.assertEqual(mpc_limit.solver_stats['solve_status'], 'converged')
+
+        # The time limit is reached: An iterate within the bounds is returned.
+        mpc_limit = get_mpc(template_model('SX'), n_robust=0, max_solve_time=1e-4)
+        u_limit = run_steps(mpc_limit, n_steps=1)
+        self.assertIn(mpc_limit.solver_stats['solve_status'], ['suboptimal', 'fallback'])
+        self.assertFalse(mpc_limit.solver_stats['success'])
+        self.assertTrue(np.all(u_limit >= np.array([[5], [-8500]])-1e-6))
+        self.assertTrue(np.all(u_limit <= np.array([[100], [0]])+1e-6))
+
+    def test_move_blocking(self):
+        # One block per stage is identical to the MPC without move blocking:
+        u = run_steps(get_mpc(template_model('SX')))
+        self.assertTrue(np.allclose(run_steps(get_mpc(template_model('SX'), move_blocking=[1]*20)), u))
+
+        for n_robust in [0, 1]:
+            mpc = get_mpc(template_model('SX'), n_robust=n_robust, move_blocking=[1, 1, 2, 4, 12])
+            self.assertEqual(len(mpc.opt_x['_u']), 5)
+            run_steps(mpc)
+            self.assertTrue(mpc.solver_stats['success'])
+
+            # The predicted inputs are constant within each block:
+            u_pred = mpc.data.prediction(('_u', 'F'))
+            self.assertEqual(u_pred.shape[1], 20)
+            for block in [[2, 3], [4, 5, 6, 7], list(range(8, 20))]:
+                self.assertTrue(np.allclose(u_pred[:, block], u_pred[:, [block[0]]]))
+
+    def test_nlp_ordering(self):
+        nlpsol_opts = {'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0, 'ipopt.tol': 1e-12}
+        mpc_type = get_mpc(template_model('SX'), nlp_ordering='type', nlpsol_opts=nlpsol_opts)
+        mpc_stage = get_mpc(template_model('SX'), nlp_ordering='stage', nlpsol_opts=nlpsol_opts)
+
+        # The variables of the solver are a permutation of the optimization variables:
+        self.assertEqual(mpc_stage.S.size1_in(0), mpc_type.S.size1_in(0))
+        self.assertEqual(mpc_type.S.size1_in(0), mpc_type.opt_x.shape[0])
+
+        # The order does not change the solution:
+        scaling = np.array([[100], [2000]])
+        self.assertTrue(np.allclose(run_steps(mpc_stage)/scaling, run_steps(mpc_type)/scaling, atol=1e-6))
+        self.assertEqual(mpc_stage.opt_x_num.cat.shape, mpc_type.opt_x_num.cat.shape)
+
+    def test_runtime_weights(self):
+        setup_mpc = {'n_robust': 0, 'objective_weight': 1.0, 'rterm': {'F': 0.1, 'Q_dot': 1e-3}, 'penalty_term_cons': 1e2}
+        mpc = get_mpc(template_model('SX'), **setup_mpc)
+        self.assertEqual(mpc.weights['Q'], 1.0)
+        self.assertEqual(mpc.weights['rterm', 'F'], 0.1)
+
+        # Weights changed after setup:
+        mpc.weights['Q'] = 10
+        mpc.weights['rterm', 'F'] = 1.0
+        mpc.weights['penalty', 'T_R'] = 1e3
+        self.assertEqual(mpc.weights['Q'], 10)
+
+        # Reference: MPC that is created with the new weights.
+        setup_mpc = {'n_robust': 0, 'objective_weight': 10.0, 'rterm': {'F': 1.0, 'Q_dot': 1e-3}, 'penalty_term_cons': 1e3}
+        mpc_ref = get_mpc(template_model('SX'), **setup_mpc)
+        self.assertTrue(np.allclose(run_steps(mpc), run_steps(mpc_ref)))
+
+        # The retuned MPC differs from the original tuning:
+        self.assertFalse(np.allclose(run_steps(mpc_ref), run_steps(get_mpc(template_model('SX'), n_robust=0))))
+
+    def test_shrinking_horizon(self):
+        nlpsol_opts = {'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0, 'ipopt.tol': 1e-12}
+        scaling = np.array([[100], [2000]])
+        mpc = get_mpc(template_model('SX'), shrinking_horizon=True, nlpsol_opts=nlpsol_opts)
+        self.assertEqual(mpc.n_horizon_active, 20)
+        u_ref = run_steps(get_mpc(template_model('SX'), nlpsol_opts=nlpsol_opts), n_steps=1)
+        self.assertTrue(np.allclose(run_steps(mpc, n_steps=1)/scaling, u_ref/scaling, atol=1e-6))
+
+        # Reduced horizon (compared to an MPC that is created with the short horizon, Q_dot is only weakly determined by the objective):
+        mpc = get_mpc(template_model('SX'), shrinking_horizon=True, nlpsol_opts=nlpsol_opts)
+        mpc.n_horizon_active = 5
+        u_ref = run_steps(get_mpc(template_model('SX'), n_horizon=5, nlpsol_opts=nlpsol_opts), n_steps=1)
+        self.assertTrue(np.allclose(run_steps(mpc, n_steps=1)/scaling, u_ref/scaling, atol=1e-5))
+
+        # The effective horizon is the remaining time until the end of the batch:
+        mpc = get_mpc(template_model('SX'), shrinking_horizon=True, t_end=0.015)
+        run_steps(mpc)
+        self.assertEqual(mpc.n_horizon_active, 1)
+        self.assertTrue(mpc.solver_stats['success'])
+
+    def test_multiple_shooting(self):
+        scaling = np.array([[100], [2000]])
+        setup_mpc = {'n_robust': 0, 'state_discretization': 'multiple_shooting', 'integration_opts': {'number_of_finite_elements': 4}}
+
+        # RK4 integrator compared to orthogonal collocation:
+        u_rk4 = run_steps(get_mpc(template_model('SX'), **setup_mpc))
+        u_colloc = run_steps(get_mpc(template_model('SX'), n_robust=0))
+        self.assertTrue(np.allclose(u_rk4/scaling, u_colloc/scaling, atol=1e-3))
+
+        # CasADi integrator (short horizon) compared to the RK4 integrator:
+        u_rk4 = run_steps(get_mpc(template_model('SX'), n_horizon=3, **setup_mpc), n_steps=1)
+        setup_mpc.update({'integration_tool': 'cvodes', 'integration_opts': {}})
+        u_cvodes = run_steps(get_mpc(template_model('MX'), n_horizon=3, **setup_mpc), n_steps=1)
+        self.assertTrue(np.allclose(u_cvodes/scaling, u_rk4/scaling, atol=1e-5))
+
+        with self.assertRaises(Exception):
+            get_mpc(template_model('SX'), n_robust=0, state_discretization='multiple_shooting', integration_opts={'abstol': 1e-8})
+
+    def test_unused_variables(self):
+        nlpsol_opts = {'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0, 'ipopt.tol': 1e-12}
+        mpc_presolve = get_mpc(template_model('SX'), presolve=True, nlpsol_opts=nlpsol_opts)
+        mpc = get_mpc(template_model('SX'), nlpsol_opts=nlpsol_opts)
+
+        # Without presolve all optimization variables are passed to the solver. With presolve, the collocation points of
+        # the initial state and the unused nodes of the scenario tree are not passed to the solver:
+        n_opt_x = mpc.opt_x.shape[0]
+        n_unused = (len(mpc.opt_x['_x', 0, 0])-1)*mpc.model.n_x
+        self.assertEqual(mpc.S.size1_in(0), n_opt_x)
+        self.assertLessEqual(mpc_presolve.S.size1_in(0), n_opt_x-n_unused)
+
+        scaling = np.array([[100], [2000]])
+        self.assertTrue(np.allclose(run_steps(mpc_presolve, n_steps=1)/scaling, run_steps(mpc, n_steps=1)/scaling, atol=1e-6))
+        self.assertTrue(mpc_presolve.solver_stats['success'])
+
+        # The auxiliary expressions of the unused nodes are zero:
+        self.assertTrue(np.allclose(mpc_presolve.opt_aux_num['_aux', 0, 1], 0))
+        self.assertFalse(np.allclose(mpc_presolve.opt_aux_num['_aux', 0, 0], 0))
+
+    def test_presolve(self):
+        nlpsol_opts = {'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0, 'ipopt.tol': 1e-12}
+        # The feed flow is fixed (the input has identical bounds):
+        bounds = {('lower', '_u', 'F'): 20, ('upper', '_u', 'F'): 20}
+        mpc_presolve = get_mpc(template_model('SX'), presolve=True, bounds=bounds, nlpsol_opts=nlpsol_opts)
+        mpc = get_mpc(template_model('SX'), bounds=bounds, nlpsol_opts=nlpsol_opts)
+
+        # Duplicate constraints are merged and fixed variables are eliminated:
+        n_fixed = np.sum(mpc.lb_opt_x.cat.full() == mpc.ub_opt_x.cat.full())
+        self.assertGreater(n_fixed, 0)
+        self.assertLessEqual(mpc_presolve.S.size1_in(0), mpc.S.size1_in(0)-n_fixed)
+        self.assertLess(mpc_presolve.S.size1_out(2), mpc.S.size1_out(2))
+
+        scaling = np.array([[100], [2000]])
+        self.assertTrue(np.allclose(run_steps(mpc_presolve)/scaling, run_steps(mpc)/scaling, atol=1e-6))
+        self.assertTrue(np.allclose(mpc_presolve.data['_u', 'F'], 20))
+
+        # The bounds of fixed variables (of the optimization problem, scaled) can only be changed without presolve:
+        mpc.ub_opt_x['_u', 0, 0, 'F'] = 0.3
+        mpc.make_step(np.array([0.8, 0.5, 134.14, 130.0]).reshape(-1,1))
+        mpc_presolve.ub_opt_x['_u', 0, 0, 'F'] = 0.3
+        with self.assertRaises(Exception):
+            mpc_presolve.make_step(np.array([0.8, 0.5, 134.14, 130.0]).reshape(-1,1))
+
+    def test_initial_guess_simulation(self):
+        mpc = get_mpc(template_model('SX'))
+        x0 = np.array([0.8, 0.5, 134.14, 130.0]).reshape(-1,1)
+        u_guess = np.tile(np.array([20.0, -500.0]), (20, 1))
+        mpc.x0 = x0
+        mpc.set_initial_guess(method='simulation', u_guess=u_guess)
+
+        # The states of the initial guess follow the model (compared to the simulator for the nominal scenario, up to the discretization error):
+        simulator = template_simulator(mpc.model)
+        simulator.x0 = x0
+        for k in range(3):
+            x_next = simulator.make_step(u_guess[k].reshape(-1,1))
+            self.assertTrue(np.allclose(mpc.opt_x_num['_x', k+1, 0, -1]*mpc.opt_x_scaling['_x', k+1, 0, -1], x_next, rtol=1e-3))
+        self.assertTrue(np.allclose(mpc.opt_x_num['_u', 0, 0]*mpc.opt_x_scaling['_u', 0, 0], u_guess[0].reshape(-1,1)))
+
+        mpc.make_step(x0)
+        self.assertTrue(mpc.solver_stats['success'])
+
+    def test_warm_start_library(self):
+        # The least recently used entry is replaced:
+        library = do_mpc.tools.WarmStartLibrary(size=2)
+        for i in range(2):
+            library.add(np.array([i, 0.]), np.array([i]), np.array([0.]), np.array([0.]))
+        library.query(np.array([0., 0.1]))
+        library.add(np.array([2., 0.]), np.array([2.]), np.array([0.]), np.array([0.]))
+        self.assertEqual(len(library), 2)
+        dist, opt_x, lam_x, lam_g = library.query(np.array([1.2, 0.]))
+        self.assertEqual(opt_x[0], 2.)
+        self.assertAlmostEqual(dist, 0.8)
+        dist, opt_x, lam_x, lam_g = library.query(np.array([0.1, 0.]))
+        self.assertEqual(opt_x[0], 0.)
+
+        # Library of the MPC:
+        mpc = get_mpc(template_model('SX'), n_robust=0, warm_start_library_size=10)
+        u = run_steps(mpc)
+        self.assertEqual(len(mpc.warm_start_library), 3)
+
+        with tempfile.TemporaryDirectory() as library_dir:
+            filename = os.path.join(library_dir, 'library.npz')
+            mpc.warm_start_library.save(filename)
+
+            # After a restart, the first step is warm started with the stored solution:
+            mpc_restart = get_mpc(template_model('SX'), n_robust=0, warm_start_library_size=10)
+            mpc_restart.warm_start_library = do_mpc.tools.WarmStartLibrary.load(filename)
+            u_restart = run_steps(mpc_restart, n_steps=1)
+            self.assertEqual(mpc_restart.solver_stats['warm_start'], 'library')
+            self.assertTrue(np.allclose(u_restart, u[:, [0]], atol=1e-5))
+            mpc_cold = get_mpc(template_model('SX'), n_robust=0)
+            run_steps(mpc_cold, n_steps=1)
+            self.assertLess(mpc_restart.solver_stats['iter_count'], mpc_cold.solver_stats['iter_count'])
+
+    def test_multistart(self):
+        nlpsol_opts = {'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0, 'ipopt.tol': 1e-12}
+        multistart = [{'initial_guess': 'warm_start'}, {'initial_guess': 'simulation', 'nlpsol_opts': {'ipopt.mu_strategy': 'adaptive'}}]
+        mpc = get_mpc(template_model('SX'), n_robust=0, multistart=multistart, nlpsol_opts=nlpsol_opts)
+        u = run_steps(mpc)
+        self.assertTrue(mpc.solver_stats['success'])
+        self.assertIn(mpc.solver_stats['multistart_variant'], [0, 1])
+        self.assertEqual(mpc.solver_stats['warm_start'], ['previous', 'simulation'][mpc.solver_stats['multistart_variant']])
+        mpc.close()
+
+        # All variants converge to the solution of the single solve (solved with tight tolerance):
+        scaling = np.array([[100], [2000]])
+        u_ref = run_steps(get_mpc(template_model('SX'), n_robust=0, nlpsol_opts=nlpsol_opts))
+        self.assertTrue(np.allclose(u/scaling, u_ref/scaling, atol=1e-5))
+
+        with self.assertRaises(Exception):
+            get_mpc(template_model('SX'), n_robust=0, multistart=[{'initial_guess': 'library'}])
+
+    def test_async_deadline_first_call(self):
+        model = template_model('SX')
+        mpc = get_mpc(model, n_robust=0)
+        x0 = np.array([0.8, 0.5, 134.14, 130.0]).reshape(-1,1)
+        mpc.x0 = x0
+        mpc.set_initial_guess()
+
+        # The deadline passes before the first solution is available: The previous input is returned.
+        u0 = asyncio.run(mpc.make_step_async(x0, deadline=1e-6))
+        self.assertTrue(np.allclose(u0, mpc.data['_u'][0]))
+        self.assertEqual(mpc.data['fallback'][0, 0], 1)
+
+        # close waits for the late solve and stops the worker. The next call starts a new worker and solve:
+        mpc.close()
+        u0 = asyncio.run(mpc.make_step_async(x0))
+        self.assertEqual(mpc.data['fallback'][-1, 0], 0)
+        self.assertTrue(mpc.data['success'][-1, 0])
+
+        # The deadline passes: The input of the previous solution for the current time is returned.
+        u_prediction = mpc.opt_x_num['_u', 1, 0].full()*np.array([[100], [2000]])
+        u0 = asyncio.run(mpc.make_step_async(x0, deadline=1e-6))
+        self.assertEqual(mpc.data['fallback'][-1, 0], 1)
+        self.assertTrue(np.allclose(u0, u_prediction))
+        mpc.close()
+
+    def test_rti(self):
+        for n_robust in [0, 1]:
+            mpc_rti = get_mpc(template_model('SX'), n_robust=n_robust, real_time_iteration=True, warm_start='shift')
+            mpc = get_mpc(template_model('SX'), n_robust=n_robust)
+            u_rti = run_steps(mpc_rti, n_steps=2)
+            u = run_steps(mpc, n_steps=2)
+
+            # The first feedback step is solved with the QP solver (initialized with the multipliers of the active constraints):
+            self.assertTrue(mpc_rti.solver_stats['success'])
+            self.assertLess(mpc_rti.data['t_wall_S'][-1, 0], 1.0)
+            # The real-time iteration is close to the converged solution (inputs scaled with the MPC scaling):
+            scaling = np.array([[100], [2000]])
+            self.assertTrue(np.allclose(u_rti/scaling, u/scaling, atol=1e-2))
+
+    def test_nlp_construction_map(self):
+        # Ragged scenario tree (nine branches at the first stage and three at the second stage):
+        nlpsol_opts = {'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0, 'ipopt.tol': 1e-12}
+        setup_mpc = {'n_horizon': 5, 'n_robust': 2, 'robust_branches': [list(range(9)), [0, 1, 2]], 'presolve': False, 'nlpsol_opts': nlpsol_opts}
+        mpc_loop = get_mpc(template_model('SX'), nlp_construction='loop', **setup_mpc)
+        mpc_map = get_mpc(template_model('SX'), nlp_construction='map', **setup_mpc)
+        self.assertEqual(mpc_map.scenario_tree['n_scenarios'], [1, 9, 27, 27, 27, 27])
+
+        # Objective and constraints at a random point:
+        np.random.seed(99)
+        x = np.random.rand(mpc_loop.S.size1_in(0))
+        p = np.random.rand(mpc_loop.S.size1_in(1))
+        [f_loop, g_loop] = mpc_loop.S.oracle()(x, p)[:2]
+        [f_map, g_map] = mpc_map.S.oracle()(x, p)[:2]
+        self.assertTrue(np.allclose(f_loop, f_map))
+        self.assertTrue(np.allclose(g_loop, g_map))
+        self.assertTrue(np.allclose(mpc_loop.cons_ub, mpc_map.cons_ub))
+
+        # Closed loop (solved with tight tolerance):
+        u_loop = run_steps(mpc_loop)
+        u_map = run_steps(mpc_map)
+        self.assertTrue(np.allclose(u_loop, u_map, atol=1e-5))
+
+    def test_nlp_construction_map_MX(self):
+        # Full scenario tree with MX symbolic variables:
+        mpc_loop = get_mpc(template_model('MX'), n_horizon=5, nlp_construction='loop')
+        mpc_map = get_mpc(template_model('MX'), n_horizon=5, nlp_construction='map')
+        self.assertEqual(mpc_map.S.size1_in(0), mpc_loop.S.size1_in(0))
+
+        np.random.seed(99)
+        x = np.random.rand(mpc_loop.S.size1_in(0))
+        p = np.random.rand(mpc_loop.S.size1_in(1))
+        [f_loop, g_loop] = mpc_loop.S.oracle()(x, p)[:2]
+        [f_map, g_map] = mpc_map.S.oracle()(x, p)[:2]
+        self.assertTrue(np.allclose(f_loop, f_map))
+        self.assertTrue(np.allclose(g_loop, g_map))
+
+        self.assertTrue(np.allclose(run_steps(mpc_loop), run_steps(mpc_map)))
+        self.assertTrue(np.allclose(mpc_loop.opt_aux_num.cat, mpc_map.opt_aux_num.cat))
+
+    def test_map_parallelization(self):
+        mpc_serial = get_mpc(template_model('SX'), nlp_construction='map', map_parallelization='serial')
+        mpc_thread = get_mpc(template_model('SX'), nlp_construction='map', map_parallelization='thread')
+
+        # Objective, constraints and gradient of the lagrangian at a random point:
+        np.random.seed(99)
+        x = np.random.rand(mpc_serial.S.size1_in(0))
+        p = np.random.rand(mpc_serial.S.size1_in(1))
+        lam_g = np.random.rand(mpc_serial.S.size1_in(5))
+        f_serial = mpc_serial.S.get_function('nlp_grad')(x, p, 1, lam_g)
+        f_thread = mpc_thread.S.get_function('nlp_grad')(x, p, 1, lam_g)
+        for res_serial, res_thread in zip(f_serial, f_thread):
+            self.assertTrue(np.allclose(res_serial, res_thread))
+
+        self.assertTrue(np.allclose(run_steps(mpc_serial), run_steps(mpc_thread)))
+
+    def test_scenario_reduction(self):
+        p_scenario = np.array(list(itertools.product([1., 1.05, 0.95], [1., 1.1, 0.9])))
+        for method in ['k_medoids', 'extreme_vertices']:
+            ind, weights = do_mpc.tools.reduce_scenarios(p_scenario, np.int64(4), method=method)
+            self.assertEqual(len(ind), 4)
+            self.assertEqual(len(set(ind)), 4)
+            self.assertEqual(ind[0], 0)
+            self.assertTrue(np.all(weights > 0))
+            self.assertAlmostEqual(np.sum(weights), 1)
+        # All selected scenarios except the nominal case are vertices of the parameter box:
+        for p in p_scenario[ind[1:]]:
+            self.assertTrue(np.all((p == p_scenario.min(axis=0)) | (p == p_scenario.max(axis=0))))
+
+        # Robust MPC with reduced and weighted scenarios:
+        mpc = get_mpc(template_model('SX'), n_robust=2, n_horizon=5, scenario_reduction='k_medoids', n_reduced_scenarios=4)
+        self.assertEqual(mpc.n_combinations, 4)
+        self.assertEqual(mpc.scenario_tree['n_scenarios'], [1, 4, 16, 16, 16, 16])
+        for node_weight in mpc.scenario_tree['node_weight']:
+            self.assertAlmostEqual(np.sum(node_weight), 1)
+        run_steps(mpc)
+        self.assertTrue(mpc.solver_stats['success'])
+
+    def test_approximate_mpc_state(self):
+        setup_mpc = {'n_robust': 0, 'warm_start': 'shift', 'warm_start_library_size': 10}
+        mpc = get_mpc(template_model('SX'), **setup_mpc)
+        mpc_ref = get_mpc(template_model('SX'), **setup_mpc)
+        u = run_steps(mpc, n_steps=2)
+        u_ref = run_steps(mpc_ref, n_steps=2)
+
+        # Sampling and validation (with the MPC) do not change the state of the MPC:
+        approx_mpc = do_mpc.tools.ApproximateMPC(mpc)
+        approx_mpc.sample({'x0': (np.array([0.5, 0.3, 120, 120]), np.array([1.0, 0.8, 140, 135]))}, n_samples=4, seed=1)
+        approx_mpc.fit(method='mlp', hidden_layers=(4,), n_epochs=10, seed=1)
+        res = approx_mpc.validate(template_simulator(mpc.model), np.array([0.8, 0.5, 134.14, 130.0]), n_steps=2)
+        self.assertEqual(res['u_mpc'].shape, (2, 2))
+        self.assertEqual(mpc.data['_u'].shape[0], 2)
+        self.assertEqual(len(mpc.warm_start_library), 2)
+        self.assertTrue(np.allclose(mpc.lam_g_num, mpc_ref.lam_g_num))
+
+        # The next step is identical to the MPC without sampling:
+        x0 = np.array([0.75, 0.55, 133.0, 129.0]).reshape(-1,1)
+        self.assertTrue(np.allclose(mpc.make_step(x0), mpc_ref.make_step(x0)))
+        self.assertEqual(mpc.solver_stats['warm_start'], 'shifted')
+
+    def test_progressive_hedging(self):
+        # Reference: Monolithic problem solved with tight tolerance (Q_dot is only weakly determined by the objective).
+        nlpsol_opts = {'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0, 'ipopt.tol': 1e-12}
+        u = run_steps(get_mpc(template_model('SX'), nlpsol_opts=nlpsol_opts), n_steps=1)
+        scaling = np.array([[100], [2000]])
+
+        # Sequential solve of the subproblems and solve with a process pool:
+        for n_processes in [1, 2]:
+            mpc = get_mpc(template_model('SX'), decomposition='progressive_hedging', decomposition_opts={'n_processes': n_processes})
+            u_ph = run_steps(mpc, n_steps=1)
+            self.assertTrue(mpc.solver_stats['success'])
+            self.assertLessEqual(mpc.solver_stats['decomposition_residual'], 1e-5)
+            self.assertTrue(np.allclose(u_ph/scaling, u/scaling, atol=1e-3))
+            mpc.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
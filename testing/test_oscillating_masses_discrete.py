@@ -41,6 +41,37 @@ sys.path.pop(-1)
 
 class TestOscillatingMassesDiscrete(unittest.TestCase):
 
+    def test_detect_qp(self):
+        model = template_model('SX')
+        nlpsol_opts = {'ipopt.print_level': 0, 'ipopt.sb': 'yes', 'print_time': 0, 'ipopt.tol': 1e-12}
+        mpc_qp = template_mpc(model, detect_qp=True)
+        mpc_nlp = template_mpc(model, nlpsol_opts=nlpsol_opts)
+
+        # Options of IPOPT have no effect for the QP solver:
+        with self.assertWarns(UserWarning):
+            template_mpc(model, detect_qp=True, nlpsol_opts=nlpsol_opts)
+
+        # The QP solver and IPOPT find the same solution within the solver tolerance (with active input bounds):
+        np.random.seed(99)
+        for k in range(3):
+            x0 = 4*np.random.rand(model.n_x)-2
+            for mpc in [mpc_qp, mpc_nlp]:
+                mpc.x0 = x0
+                mpc.set_initial_guess()
+            u_qp = mpc_qp.make_step(x0)
+            u_nlp = mpc_nlp.make_step(x0)
+            self.assertTrue(mpc_qp.solver_stats['success'])
+            self.assertTrue(np.allclose(u_qp, u_nlp, atol=1e-6))
+            self.assertTrue(np.allclose(mpc_qp.opt_x_num.cat, mpc_nlp.opt_x_num.cat, atol=1e-5))
+
+        # The time limit is only available for IPOPT, i.e. the problem is not solved as QP with max_solve_time:
+        mpc_limit = template_mpc(model, detect_qp=True, max_solve_time=100, nlpsol_opts=nlpsol_opts)
+        mpc_limit.x0 = x0
+        mpc_limit.set_initial_guess()
+        self.assertTrue(np.allclose(mpc_limit.make_step(x0), u_nlp))
+        self.assertEqual(mpc_limit.solver_stats['return_status'], 'Solve_Succeeded')
+        self.assertEqual(mpc_limit.solver_stats['solve_status'], 'converged')
+
     def test_SX(self):
         print('Testing SX implementation')
         self.oscillating_masses_discrete('SX')
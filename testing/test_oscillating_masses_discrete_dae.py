@@ -40,6 +40,31 @@ sys.path.pop(-1)
 
 
 class TestOscillatingMassesDiscrete(unittest.TestCase):
+    def test_eliminate_alg(self):
+        for symvar_type in ['SX', 'MX']:
+            model = template_model(symvar_type, eliminate_alg=True)
+            self.assertEqual(model.n_z, 0)
+            self.assertIn('x_next', model.aux.keys())
+
+            mpc = template_mpc(model)
+            simulator = template_simulator(model)
+            np.random.seed(99)
+            x0 = np.random.rand(model.n_x)-0.5
+            mpc.x0 = x0
+            simulator.x0 = x0
+            mpc.set_initial_guess()
+
+            for k in range(5):
+                u0 = mpc.make_step(x0)
+                x0 = simulator.make_step(u0)
+
+            # Results are identical to the reference run (with algebraic states):
+            ref = do_mpc.data.load_results('./results/results_oscillatingMasses_dae.pkl')
+            for data, data_ref in [(mpc.data, ref['mpc']), (simulator.data, ref['simulator'])]:
+                self.assertTrue(np.allclose(data['_x'], data_ref['_x']))
+                self.assertTrue(np.allclose(data['_u'], data_ref['_u']))
+                self.assertTrue(np.allclose(data['_z', 'x_next'], data_ref['_z', 'x_next']))
+
     def test_SX(self):
         print('Testing SX implementation')
         self.oscillating_masses_discrete('SX')